@@ -0,0 +1,108 @@
+from parallel import ADDRESS_CHANGES_HELP
+from service import SOLVE_DEFAULTS, solve
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+def solve_instance(task):
+    """
+    Solve one instance in a worker process with the solve service's
+    pipeline, and return its result record.  Loading goes through the
+    worker's instance cache and the compiled instance snapshot of its data
+    directory, so only the first solve of an instance reads its CSV files.
+    """
+    instance, settings, with_routes = task
+    record = {'instance': instance['data_dir'], 'seed': settings['seed']}
+    started = time.time()
+    try:
+        result = solve(instance, settings)
+        record.update({
+            'cost': result.cost,
+            'feasible': result.feasible,
+            'initial_cost': result.initial_cost,
+            'lower_bound': result.lower_bound.value,
+            'gap': result.lower_bound.gap(result.cost) if result.feasible else None,
+            'load_seconds': result.load_seconds,
+            'solve_seconds': result.solve_seconds,
+            'evaluations': result.evaluations,
+            'evaluations_per_second': result.evaluations / result.solve_seconds if result.solve_seconds > 0 else None
+        })
+        if with_routes:
+            record['routes'] = [dict(zip(('packages', 'depot_stops'), route.encode()), truck=route.truck.number) for route in result.solution]
+    except Exception as e:
+        record['error'] = '%s: %s' % (type(e).__name__, e)
+    record['elapsed'] = time.time() - started
+    return record
+
+def instance_dirs(patterns):
+    """Expand directories and glob patterns into the sorted instance directories they match."""
+    dirs = set()
+    for pattern in patterns:
+        for path in glob.glob(pattern):
+            if os.path.isdir(path):
+                dirs.add(os.path.join(path, ''))
+    return sorted(dirs)
+
+def main():
+    parser = argparse.ArgumentParser(description='Solve many instance directories in parallel, writing one JSON line per instance.')
+    parser.add_argument('instances', nargs='+', help='instance directories or glob patterns')
+    parser.add_argument('-o', '--output', help='JSON Lines file to write (default: standard output)')
+    parser.add_argument('--workers', type=int, help='number of worker processes (default: all cores)')
+    parser.add_argument('--time-limit', type=float, default=SOLVE_DEFAULTS['time_limit'], help='seconds per instance')
+    parser.add_argument('--iter-per-temp', type=int, default=SOLVE_DEFAULTS['iter_per_temp'])
+    parser.add_argument('--init-temp', type=float, default=SOLVE_DEFAULTS['init_temp'])
+    parser.add_argument('--final-temp', type=float, default=SOLVE_DEFAULTS['final_temp'])
+    parser.add_argument('--alpha', type=float, default=SOLVE_DEFAULTS['alpha'])
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--depot', type=int, default=999, help='depot location id')
+    parser.add_argument('--drivers', type=int, default=2)
+    parser.add_argument('--speed', type=float, default=18)
+    parser.add_argument('--capacity', type=int, default=16)
+    parser.add_argument('--start', default='08:00', help='start of day as HH:MM')
+    parser.add_argument('--construction', default='savings')
+    parser.add_argument('--address-changes', type=json.loads, help=ADDRESS_CHANGES_HELP)
+    parser.add_argument('--mmap-distances', action='store_true', help='memory map each distance matrix, shared by the workers solving its instance')
+    parser.add_argument('--routes', action='store_true', help='include the routes in each record')
+    args = parser.parse_args()
+
+    dirs = instance_dirs(args.instances)
+    if not dirs:
+        parser.error('no instance directories match %s' % ' '.join(args.instances))
+    settings = {
+        'time_limit': args.time_limit,
+        'init_temp': args.init_temp,
+        'final_temp': args.final_temp,
+        'iter_per_temp': args.iter_per_temp,
+        'alpha': args.alpha,
+        'seed': args.seed
+    }
+    tasks = [({
+        'data_dir': data_dir,
+        'depot': args.depot,
+        'drivers': args.drivers,
+        'speed': args.speed,
+        'capacity': args.capacity,
+        'start': args.start,
+        'construction': args.construction,
+        'address_changes': args.address_changes,
+        'mmap_distances': args.mmap_distances
+    }, settings, args.routes) for data_dir in dirs]
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        # Records are written as instances finish, so a long batch can be
+        # followed, or resumed by hand, from the output file.
+        with ProcessPoolExecutor(min(args.workers or os.cpu_count() or 1, len(tasks))) as pool:
+            for future in as_completed([pool.submit(solve_instance, task) for task in tasks]):
+                out.write(json.dumps(future.result()) + '\n')
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == "__main__":
+    main()
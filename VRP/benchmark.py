@@ -0,0 +1,227 @@
+from lowerbound import LowerBound
+from optimization import two_opt, iterative_local_search, iterative_stochastic_optimization, CountingEvaluator
+from parallel import instance_simulator, ADDRESS_CHANGES_HELP
+from route import Route
+from solomon import load_solomon, trip_demands, travel_distance, SOLOMON_SPEED
+from deliverysimulator import DeliverySimulator
+from contextlib import redirect_stdout
+from datetime import datetime, date
+import argparse
+import glob
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+PIPELINES = ('two_opt', 'ils', 'iso')
+
+class TracingEvaluator(CountingEvaluator):
+    """
+    A CountingEvaluator that also traces the best feasible cost found over
+    time, as (seconds since start(), cost), for time-to-target.
+    """
+    def __init__(self, test_eval):
+        CountingEvaluator.__init__(self, test_eval)
+        self.start()
+
+    def start(self):
+        self.count = 0
+        self.started = time.time()
+        self.best = None
+        self.trace = []
+
+    def __call__(self, solution, *args, **kwargs):
+        feas, cost = CountingEvaluator.__call__(self, solution, *args, **kwargs)
+        if all(feas) and (self.best is None or cost < self.best - 1e-9):
+            self.best = cost
+            self.trace.append((time.time() - self.started, cost))
+        return feas, cost
+
+    def time_to(self, target):
+        """Seconds until a feasible cost at or below target was first found, or None."""
+        for t, cost in self.trace:
+            if cost <= target + 1e-9:
+                return t
+        return None
+
+class BenchmarkInstance:
+    """
+    A simulator with its constructed initial solution, and what is needed
+    to report on it: the cost offset of the adapted format (the service
+    times folded into Solomon distances), the travel distance the lower
+    bound is computed on when the distance table holds more than that, and
+    the demand capacity of a trip.  Instances with a demand capacity are
+    adapted from another format, and solved as a relaxation of it.
+    """
+    def __init__(self, name, simulator, initial, cost_offset=0.0, demand_capacity=None, bound_distance=None):
+        self.name = name
+        self.simulator = simulator
+        self.initial = initial
+        self.cost_offset = cost_offset
+        self.demand_capacity = demand_capacity
+        self.bound_distance = bound_distance
+
+    def lower_bound(self, iterations):
+        """The lower bound on the cost of the instance, without cost_offset."""
+        simulator = self.simulator
+        feas, cost = simulator.test_eval(self.solution())
+        return LowerBound(
+            simulator.depot_location, simulator.depot.packages, simulator.constants.truck_capacity,
+            iterations, upper_bound=cost - self.cost_offset, distance=self.bound_distance
+        )
+
+    @staticmethod
+    def bundled(data_dir, construction, address_changes):
+        simulator, initial = instance_simulator({'data_dir': data_dir, 'construction': construction, 'address_changes': address_changes})
+        name = os.path.basename(os.path.normpath(data_dir))
+        return BenchmarkInstance(name, simulator, initial)
+
+    @staticmethod
+    def solomon(path, construction, address_changes=None):
+        start = datetime.combine(date.today(), datetime.min.time())
+        instance = load_solomon(path, start)
+        simulator = DeliverySimulator(
+            instance.depot_id, instance.vehicles, SOLOMON_SPEED, instance.packages_per_trip,
+            start, None, construction=construction, data=instance.data
+        )
+        initial = [route.encode() for route in simulator.current_solution()]
+        return BenchmarkInstance(instance.name, simulator, initial, instance.service_total, instance.capacity, travel_distance)
+
+    def solution(self):
+        trucks = self.simulator.depot.trucks
+        table = self.simulator.data.package_table
+        return [Route.decode(trucks[t], table, encoded) for t, encoded in enumerate(self.initial)]
+
+def run_pipeline(instance, pipeline, seed, time_limit, iter_per_temp, lower_bound, best_known, target_gap):
+    """Run one pipeline on one instance from its initial solution, and return its record."""
+    simulator = instance.simulator
+    offset = instance.cost_offset
+    test_eval = TracingEvaluator(simulator.test_eval)
+    solution = instance.solution()
+    random.seed(seed)
+    record = {'instance': instance.name, 'pipeline': pipeline, 'seed': seed, 'time_limit': time_limit}
+
+    test_eval.start()
+    try:
+        # The pipelines report their rounds on standard output.
+        with redirect_stdout(io.StringIO()):
+            if pipeline == 'two_opt':
+                best = two_opt(solution, test_eval)
+            elif pipeline == 'ils':
+                best = iterative_local_search(solution, test_eval, sys.maxsize, time_limit)
+            elif pipeline == 'iso':
+                best = iterative_stochastic_optimization(solution, test_eval, sys.maxsize, iter_per_temp, lower_bound, time_limit=time_limit)
+            else:
+                raise ValueError('Unknown pipeline: %s' % pipeline)
+    except (AssertionError, ValueError) as e:
+        record['error'] = '%s: %s' % (type(e).__name__, e)
+        return record
+    elapsed = time.time() - test_eval.started
+
+    # The returned solution is evaluated through the tracer too, as a
+    # pipeline may change a solution after its last evaluation.
+    feas, cost = test_eval(best)
+    test_eval.count -= 1
+    cost -= offset
+    record.update({
+        'cost': cost,
+        'feasible': all(feas),
+        'best_found': test_eval.best - offset if test_eval.best is not None else None,
+        'elapsed': elapsed,
+        'evaluations': test_eval.count,
+        'evaluations_per_second': test_eval.count / elapsed if elapsed > 0 else None,
+        'lower_bound': lower_bound.value,
+        'gap_lower_bound': max(cost - lower_bound.value, 0.0) / cost if all(feas) and cost > 0 else None,
+        'best_known': best_known,
+        'gap_best_known': (cost - best_known) / best_known if all(feas) and best_known else None,
+        'time_to_target': None
+    })
+    if best_known:
+        target = best_known * (1 + target_gap)
+        record['target'] = target
+        record['time_to_target'] = test_eval.time_to(target + offset)
+    if instance.demand_capacity is not None:
+        record['relaxed'] = True
+        record['demand_feasible'] = all(demand <= instance.demand_capacity for demand in trip_demands(best))
+    return record
+
+def summarize(records):
+    """Print the median cost, gap, time-to-target and evaluation rate per instance and pipeline."""
+    groups = {}
+    for record in records:
+        groups.setdefault((record['instance'], record['pipeline']), []).append(record)
+
+    def median(values):
+        values = [value for value in values if value is not None]
+        return statistics.median(values) if values else None
+
+    def show(value, pattern):
+        return pattern % value if value is not None else '-'
+
+    print('%-12s %-8s %5s %10s %8s %8s %10s %10s' % ('instance', 'pipeline', 'runs', 'cost', 'gap LB', 'gap BK', 'to target', 'evals/s'))
+    for (name, pipeline), group in sorted(groups.items()):
+        ok = [record for record in group if 'error' not in record]
+        print('%-12s %-8s %5d %10s %8s %8s %10s %10s' % (
+            name, pipeline, len(ok),
+            show(median(r['cost'] for r in ok), '%.1f'),
+            show(median(r['gap_lower_bound'] for r in ok), '%.3f'),
+            show(median(r['gap_best_known'] for r in ok), '%.3f'),
+            show(median(r['time_to_target'] for r in ok), '%.1fs'),
+            show(median(r['evaluations_per_second'] for r in ok), '%.0f')
+        ))
+    if any(record.get('relaxed') for record in records):
+        print('Adapted instances drop ready times and count capacity in packages, so their gaps to '
+              'best-known costs compare against a relaxation of the published problem.')
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the solver pipelines under fixed seeds and time budgets.')
+    parser.add_argument('--bundled', nargs='*', default=['../data/'], help='instance directories in the bundled CSV format')
+    parser.add_argument('--solomon', nargs='*', default=[], help='Solomon or Gehring-Homberger instance files or glob patterns')
+    parser.add_argument('--best-known', help='JSON file of best-known costs by instance name')
+    parser.add_argument('--pipelines', nargs='+', default=list(PIPELINES), choices=PIPELINES)
+    parser.add_argument('--seeds', nargs='+', type=int, default=[1, 2, 3])
+    parser.add_argument('--time-limit', type=float, default=30, help='seconds per run')
+    parser.add_argument('--iter-per-temp', type=int, default=20)
+    parser.add_argument('--target-gap', type=float, default=0.05, help='time-to-target is measured to within this gap of the best-known cost')
+    parser.add_argument('--bound-iterations', type=int, default=100, help='subgradient iterations of the lower bound')
+    parser.add_argument('--construction', default='savings')
+    parser.add_argument('--address-changes', type=json.loads, help=ADDRESS_CHANGES_HELP)
+    parser.add_argument('-o', '--output', help='JSON Lines file of run records')
+    args = parser.parse_args()
+
+    best_known = {}
+    if args.best_known:
+        with open(args.best_known) as f:
+            best_known = json.load(f)
+    solomon_paths = sorted({path for pattern in args.solomon for path in glob.glob(pattern) if os.path.isfile(path)})
+
+    out = open(args.output, 'w') if args.output else None
+    records = []
+    try:
+        # Runs are made one at a time, so that their timings do not compete
+        # for cores.
+        sources = [(BenchmarkInstance.bundled, path) for path in args.bundled]
+        sources += [(BenchmarkInstance.solomon, path) for path in solomon_paths]
+        for load, path in sources:
+            instance = load(path, args.construction, args.address_changes)
+            lower_bound = instance.lower_bound(args.bound_iterations)
+            for pipeline in args.pipelines:
+                for seed in args.seeds:
+                    record = run_pipeline(
+                        instance, pipeline, seed, args.time_limit, args.iter_per_temp,
+                        lower_bound, best_known.get(instance.name), args.target_gap
+                    )
+                    records.append(record)
+                    if out is not None:
+                        out.write(json.dumps(record) + '\n')
+                        out.flush()
+    finally:
+        if out is not None:
+            out.close()
+    summarize(records)
+
+if __name__ == "__main__":
+    main()
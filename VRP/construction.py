@@ -0,0 +1,436 @@
+from route import Route
+from spatial import GridIndex
+from math import ceil
+import heapq
+import time
+
+# Lateness is weighted far above distance, so that an insertion that makes
+# a delivery late is only chosen when no on-time insertion exists.
+LATE_PENALTY = 10000
+
+class PlanEvaluator:
+    """
+    Fast evaluation of a construction plan, where the plan of each truck is a
+    list of trips and each trip is a list of packages loaded together at the
+    depot.  Times are kept in float hours after the start of the day rather
+    than datetimes.  A trip leaves the depot once every package on it is
+    available (earliest_load), so the depot wait before each trip is derived
+    from the plan instead of searched for.  Waits are rounded up to whole
+    minutes, matching the DepotStop wait times they become.
+    """
+    def __init__(self, simulator):
+        self.depot_location = simulator.depot_location
+        self.speed = simulator.constants.truck_speed
+        self.capacity = simulator.constants.truck_capacity
+        self.number_drivers = simulator.constants.number_drivers
+        start = simulator.constants.start_of_day
+        self.deadline = {}
+        self.earliest = {}
+        for package in simulator.data.package_table.values():
+            self.deadline[package.id] = (package.delivery_deadline - start).total_seconds() / 3600
+            self.earliest[package.id] = max((package.earliest_load - start).total_seconds() / 3600, 0.0)
+
+    def trip_ready(self, trip):
+        return max(self.earliest[p.id] for p in trip)
+
+    def evaluate(self, trips, cur_time=0.0):
+        """
+        Returns (miles, lateness, waits, end_time) for a truck driving trips
+        in order, where lateness is the summed hours past each deadline and
+        waits are the depot wait minutes before each trip.
+        Θ(n)
+        """
+        depot = self.depot_location
+        speed = self.speed
+        deadline = self.deadline
+        miles = 0.0
+        lateness = 0.0
+        waits = []
+        for trip in trips:
+            ready = self.trip_ready(trip)
+            wait = ceil((ready - cur_time) * 60 - 1e-6) if ready > cur_time else 0
+            cur_time += wait / 60
+            waits.append(wait)
+            pred_loc = depot
+            for package in trip:
+                distance = pred_loc.distances[package.delivery_location.id]
+                miles += distance
+                cur_time += distance / speed
+                # A small tolerance absorbs the float to timedelta rounding
+                # difference with DeliverySimulator.test_eval().
+                if cur_time > deadline[package.id] - 1e-6:
+                    lateness += cur_time - deadline[package.id] + 1e-6
+                pred_loc = package.delivery_location
+            distance = pred_loc.distances[depot.id]
+            miles += distance
+            cur_time += distance / speed
+        return miles, lateness, waits, cur_time
+
+    def late_packages(self, trips):
+        """Return the ids of the packages delivered after their deadline."""
+        late = set()
+        cur_time = 0.0
+        depot = self.depot_location
+        for trip, wait in zip(trips, self.evaluate(trips)[2]):
+            cur_time += wait / 60
+            pred_loc = depot
+            for package in trip:
+                cur_time += pred_loc.distances[package.delivery_location.id] / self.speed
+                if cur_time > self.deadline[package.id] - 1e-6:
+                    late.add(package.id)
+                pred_loc = package.delivery_location
+            cur_time += pred_loc.distances[depot.id] / self.speed
+        return late
+
+    def score(self, trips, cur_time=0.0):
+        miles, lateness, _, _ = self.evaluate(trips, cur_time)
+        return miles + LATE_PENALTY * lateness
+
+def _order_group(depot_location, group):
+    """
+    Order a linked group for contiguous delivery: by deadline, and by
+    nearest neighbor among packages that share a deadline.
+    """
+    remaining = sorted(group, key=lambda p: (p.delivery_deadline, p.id))
+    ordered = []
+    pred_loc = depot_location
+    while remaining:
+        deadline = remaining[0].delivery_deadline
+        package = min(
+            (p for p in remaining if p.delivery_deadline == deadline),
+            key=lambda p: pred_loc.distances[p.delivery_location.id]
+        )
+        remaining.remove(package)
+        ordered.append(package)
+        pred_loc = package.delivery_location
+    return ordered
+
+def build_units(simulator):
+    """
+    Split the packages into insertion units: each linked delivery group is
+    a single unit, as its packages must be loaded and delivered together,
+    and every other package is a unit of its own.  Returns a list of
+    (packages, required_truck_index or None) pairs.
+    """
+    units = []
+    grouped = set()
+    for group in simulator.depot.linked_packages:
+        grouped.update(p.id for p in group)
+        units.append(_order_group(simulator.depot_location, group))
+    for package in sorted(simulator.data.package_table.values(), key=lambda p: p.id):
+        if package.id not in grouped:
+            units.append([package])
+
+    ret = []
+    for unit in units:
+        required = {p.required_truck_number for p in unit if p.required_truck_number is not None}
+        if len(required) > 1:
+            raise ValueError('Linked packages require different trucks: %s' % unit)
+        truck_idx = required.pop() - 1 if required else None
+        if truck_idx is not None and truck_idx >= simulator.constants.number_drivers:
+            raise ValueError('Package requires truck %d but only %d trucks exist: %s' % (truck_idx + 1, simulator.constants.number_drivers, unit))
+        if len(unit) > simulator.constants.truck_capacity:
+            raise ValueError('Linked packages exceed the truck capacity of %d: %s' % (simulator.constants.truck_capacity, unit))
+        ret.append((unit, truck_idx))
+    return ret
+
+def build_route(truck, trips, waits):
+    """
+    Return a route of truck through trips, with a depot stop at the start of
+    each trip holding its wait minutes.
+    """
+    route = Route(truck)
+    for trip, wait in zip(trips, waits):
+        route_idx = len(route.packages)
+        route.add_depot_stop(route_idx)
+        route.get_depot_stop(route_idx).increase_wait(wait)
+        for package in trip:
+            route.add_package(package)
+    return route
+
+def route_trips(route):
+    """Split the packages of a route into its trips between depot stops."""
+    bounds = sorted({stop.route_index for stop in route.depot_stops} | {0, len(route.packages)})
+    return [route.packages[a:b] for a, b in zip(bounds, bounds[1:]) if b > a]
+
+def apply_plan(simulator, plans):
+    """
+    Load the trips of every truck into fresh routes, with a depot stop at the
+    start of each trip holding the wait required by its earliest load time.
+    """
+    evaluator = PlanEvaluator(simulator)
+    for truck, trips in zip(simulator.depot.trucks, plans):
+        truck.route = build_route(truck, trips, evaluator.evaluate(trips)[2])
+    return simulator.depot.get_routes()
+
+def insertions(unit, trips, capacity):
+    """
+    Yield every plan with unit inserted, either contiguously into an
+    existing trip with room for it, or as a new trip at any position.
+    """
+    for i, trip in enumerate(trips):
+        if len(trip) + len(unit) <= capacity:
+            for pos in range(len(trip) + 1):
+                yield trips[:i] + [trip[:pos] + unit + trip[pos:]] + trips[i+1:]
+    for i in range(len(trips) + 1):
+        yield trips[:i] + [list(unit)] + trips[i:]
+
+def regret_insertion(simulator, k=2, plans=None, units=None, start_times=None, time_limit=None):
+    """
+    Regret-k insertion.  Every round, the cheapest insertion of each
+    unrouted unit into each truck is known, and the unit with the largest
+    regret (the summed cost difference between its best truck and its next
+    k-1 best trucks) is inserted at its best position, as it stands to lose
+    the most by waiting.  Units restricted to a single truck have infinite
+    regret and go first.  Insertion costs include a heavy lateness penalty,
+    so deadlines, earliest load times (through depot waits), required trucks
+    and linked groups are all respected whenever possible.
+    Only the truck that received the last unit has its insertion costs
+    recomputed, so a round costs O(units * n_t^2) for n_t packages per truck.
+    That is too slow to build whole instances of more than a few hundred
+    packages, so savings is the default construction, and regret insertion
+    mostly repairs the few late units that the other constructions leave.
+    Given partial <plans>, only <units> are inserted into them, and the
+    plans may start later than the start of the day at <start_times>, in
+    hours after it.
+    After time_limit seconds, every unit left is appended as a trip of its
+    own to the truck whose score it raises least.
+    """
+    started = time.time()
+    evaluator = PlanEvaluator(simulator)
+    if plans is None:
+        plans = [[] for _ in range(simulator.constants.number_drivers)]
+    n_trucks = len(plans)
+    if units is None:
+        units = build_units(simulator)
+    if start_times is None:
+        start_times = [0.0] * n_trucks
+    scores = [evaluator.score(plan, start_times[t]) for t, plan in enumerate(plans)]
+    unrouted = set(range(len(units)))
+    best = [[None] * n_trucks for _ in units]
+    dirty = set(range(n_trucks))
+
+    out_of_time = False
+    while unrouted and not out_of_time:
+        for u in unrouted:
+            if time_limit is not None and time.time() - started >= time_limit:
+                out_of_time = True
+                break
+            unit, required = units[u]
+            for t in dirty:
+                if required is not None and required != t:
+                    continue
+                cheapest = None
+                for plan in insertions(unit, plans[t], evaluator.capacity):
+                    cost = evaluator.score(plan, start_times[t]) - scores[t]
+                    if cheapest is None or cost < cheapest[0]:
+                        cheapest = (cost, plan)
+                best[u][t] = cheapest
+        if out_of_time:
+            break
+
+        chosen, chosen_key = None, None
+        for u in unrouted:
+            costs = sorted((c[0], t) for t, c in enumerate(best[u]) if c is not None)
+            if len(costs) < min(k, n_trucks) or len(costs) == 1:
+                regret = float('inf')
+            else:
+                regret = sum(c - costs[0][0] for c, _ in costs[1:k])
+            key = (regret, -costs[0][0], -u)
+            if chosen_key is None or key > chosen_key:
+                chosen, chosen_key, chosen_truck = u, key, costs[0][1]
+
+        plans[chosen_truck] = best[chosen][chosen_truck][1]
+        scores[chosen_truck] = evaluator.score(plans[chosen_truck], start_times[chosen_truck])
+        unrouted.remove(chosen)
+        dirty = {chosen_truck}
+
+    for u in sorted(unrouted):
+        unit, required = units[u]
+        candidates = [required] if required is not None else range(n_trucks)
+        t = min(candidates, key=lambda t: evaluator.score(plans[t] + [list(unit)], start_times[t]) - scores[t])
+        plans[t] = plans[t] + [list(unit)]
+        scores[t] = evaluator.score(plans[t], start_times[t])
+    return plans
+
+def repair(simulator, plans, k=2):
+    """
+    Take every unit with a late delivery out of the plans and put it back
+    with regret insertion, which weighs the full schedule of each truck.
+    """
+    evaluator = PlanEvaluator(simulator)
+    late = set()
+    for trips in plans:
+        late |= evaluator.late_packages(trips)
+    if not late:
+        return plans
+    units = [unit for unit in build_units(simulator) if any(p.id in late for p in unit[0])]
+    removed = {p.id for unit, _ in units for p in unit}
+    plans = [[[p for p in trip if p.id not in removed] for trip in trips] for trips in plans]
+    plans = [[trip for trip in trips if trip] for trips in plans]
+    return regret_insertion(simulator, k, plans, units)
+
+def _assign_trips(evaluator, trips, n_trucks):
+    """
+    Assign standalone trips to trucks, most urgent trip first, each to the
+    truck and position in its plan that adds the least lateness, then ends
+    the truck's day earliest.
+    <trips> is a list of (packages, required_truck_index or None) pairs.
+    """
+    plans = [[] for _ in range(n_trucks)]
+    trips = sorted(trips, key=lambda trip: (min(evaluator.deadline[p.id] for p in trip[0]), evaluator.trip_ready(trip[0])))
+    for trip, required in trips:
+        best = None
+        for t in range(n_trucks):
+            if required is not None and required != t:
+                continue
+            for i in range(len(plans[t]) + 1):
+                plan = plans[t][:i] + [trip] + plans[t][i:]
+                _, lateness, _, end_time = evaluator.evaluate(plan)
+                key = (lateness, end_time)
+                if best is None or key < best[0]:
+                    best = (key, t, plan)
+        plans[best[1]] = best[2]
+    return plans
+
+def clarke_wright(simulator, neighbors=None):
+    """
+    Clarke-Wright savings.  Every unit starts on a trip of its own, and
+    trips are merged end to start in order of decreasing savings
+    d(depot, i) + d(j, depot) - d(i, j), taken from a heap.  A merge must
+    respect the truck capacity, required trucks and every deadline when the
+    merged trip leaves as soon as its packages are available.  The finished
+    trips are then assigned to trucks by urgency, and any unit still
+    delivered late is repaired by regret insertion.
+    With <neighbors> set, savings are only computed towards that many
+    nearest units by coordinates (through a GridIndex), which reduces the
+    heap from O(n^2) to O(n * neighbors) pairs for large instances.
+    """
+    evaluator = PlanEvaluator(simulator)
+    depot = simulator.depot_location
+    units = build_units(simulator)
+    n = len(units)
+    trips = {u: [u] for u in range(n)}
+    trip_of = list(range(n))
+    required = [truck for _, truck in units]
+
+    def first(u):
+        return units[u][0][0].delivery_location
+
+    def last(u):
+        return units[u][0][-1].delivery_location
+
+    if neighbors is None or neighbors >= n:
+        candidates = [range(n) for _ in range(n)]
+    else:
+        grid = GridIndex((u, first(u).coords) for u in range(n))
+        candidates = [[v for _, v in grid.nearest(last(u).coords, neighbors + 1)] for u in range(n)]
+
+    heap = []
+    for i in range(n):
+        for j in candidates[i]:
+            if i != j:
+                saving = last(i).distances[depot.id] + depot.distances[first(j).id] - last(i).distances[first(j).id]
+                heap.append((-saving, i, j))
+    heapq.heapify(heap)
+
+    while heap:
+        saving, i, j = heapq.heappop(heap)
+        if saving > 0:
+            break
+        a, b = trip_of[i], trip_of[j]
+        if a == b or trips[a][-1] != i or trips[b][0] != j:
+            continue
+        if required[a] is not None and required[b] is not None and required[a] != required[b]:
+            continue
+        merged = trips[a] + trips[b]
+        packages = [p for u in merged for p in units[u][0]]
+        if len(packages) > evaluator.capacity:
+            continue
+        if evaluator.evaluate([packages], evaluator.trip_ready(packages))[1] > 0:
+            continue
+        trips[a] = merged
+        del trips[b]
+        for u in merged:
+            trip_of[u] = a
+        if required[a] is None:
+            required[a] = required[b]
+
+    built = [([p for u in trip for p in units[u][0]], required[key]) for key, trip in trips.items()]
+    return repair(simulator, _assign_trips(evaluator, built, simulator.constants.number_drivers))
+
+def nearest_neighbor(simulator, candidates=8):
+    """
+    Spatial nearest neighbor.  The truck that is back at the depot earliest
+    loads the next trip, repeatedly driving to the closest available package
+    (by road distance, among the nearest <candidates> by coordinates from a
+    GridIndex) until the truck is full.  A package is available once its
+    earliest load time has passed, and linked groups are loaded whole.
+    Units delivered late are repaired by regret insertion.
+    """
+    evaluator = PlanEvaluator(simulator)
+    n_trucks = simulator.constants.number_drivers
+    units = build_units(simulator)
+    unit_of = {}
+    for u, (unit, _) in enumerate(units):
+        for package in unit:
+            unit_of[package.id] = u
+    grid = GridIndex((u, unit[0].delivery_location.coords) for u, (unit, _) in enumerate(units))
+    unrouted = set(range(len(units)))
+
+    plans = [[] for _ in range(n_trucks)]
+    heap = [(0.0, t) for t in range(n_trucks)]
+    while unrouted:
+        cur_time, t = heapq.heappop(heap)
+        allowed = [u for u in unrouted if units[u][1] is None or units[u][1] == t]
+        if not allowed:
+            continue
+        depart = max(cur_time, min(evaluator.trip_ready(units[u][0]) for u in allowed))
+
+        def eligible(u):
+            unit, required = units[u]
+            return (required is None or required == t) and evaluator.trip_ready(unit) <= depart
+
+        trip = []
+        cur_loc = simulator.depot_location
+        while len(trip) < evaluator.capacity:
+            k = candidates
+            choice = None
+            while choice is None:
+                near = [u for _, u in grid.nearest(cur_loc.coords, k) if eligible(u) and len(trip) + len(units[u][0]) <= evaluator.capacity]
+                if near:
+                    choice = min(near, key=lambda u: cur_loc.distances[units[u][0][0].delivery_location.id])
+                elif k >= len(grid):
+                    break
+                k *= 2
+            if choice is None:
+                break
+            trip += units[choice][0]
+            cur_loc = units[choice][0][-1].delivery_location
+            grid.remove(choice)
+            unrouted.remove(choice)
+
+        if trip:
+            plans[t].append(trip)
+        _, _, _, end_time = evaluator.evaluate(plans[t])
+        heapq.heappush(heap, (end_time, t))
+    return repair(simulator, plans)
+
+CONSTRUCTIONS = {
+    'regret': regret_insertion,
+    'savings': clarke_wright,
+    'nearest': nearest_neighbor,
+}
+
+def construct(simulator, method='savings'):
+    """
+    Build the initial routes of every truck with a construction method, or
+    with decomposition.decompose() for method 'decompose'.
+    """
+    if method == 'decompose':
+        # Imported here, as decomposition builds on this module.
+        from decomposition import decompose
+        return decompose(simulator)
+    if method not in CONSTRUCTIONS:
+        raise ValueError('Unknown construction method: %s' % method)
+    return apply_plan(simulator, CONSTRUCTIONS[method](simulator))
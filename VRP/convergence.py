@@ -0,0 +1,163 @@
+from collections import namedtuple
+import argparse
+import math
+import struct
+
+try:
+    from matplotlib import pyplot as plt
+except:
+    plt = None
+
+ConvergenceRecord = namedtuple('ConvergenceRecord', ['iteration', 'temperature', 'cost', 'best', 'feasible'])
+
+# Binary traces start with MAGIC, followed by one RECORD per temperature
+# step: iteration, temperature, current cost, best feasible cost (NaN until
+# one is found) and feasibility, 33 bytes in all.
+MAGIC = b'VRPCONV1'
+RECORD = struct.Struct('<QdddB')
+CSV_HEADER = 'iteration,temperature,cost,best,feasible\n'
+
+def _csv_line(record):
+    best = repr(float(record.best)) if record.best is not None else ''
+    return '%d,%r,%r,%s,%d\n' % (record.iteration, float(record.temperature), float(record.cost), best, record.feasible)
+
+class ConvergenceTracer:
+    """
+    The convergence of a search, recorded once per temperature step.  Only
+    a downsampled history is kept in memory, in at most capacity records:
+    when it fills up every other record is dropped, and from then on only
+    every other step is kept, so the history always spans the whole run at
+    an even resolution.  With a path, every record is also streamed to a
+    file, in CSV if the path ends with .csv and in a compact binary format
+    otherwise, to be read back with read_trace().
+    """
+    def __init__(self, path=None, capacity=1024):
+        if capacity < 2 or capacity % 2:
+            raise ValueError('Capacity must be an even number of at least 2.')
+        self.path = path
+        self.capacity = capacity
+        self.stride = 1
+        self.count = 0
+        self.best = None
+        self.last = None
+        self._history = []
+        self._file = None
+        self._csv = path is not None and path.lower().endswith('.csv')
+        if path is not None:
+            if self._csv:
+                self._file = open(path, 'w')
+                self._file.write(CSV_HEADER)
+            else:
+                self._file = open(path, 'wb')
+                self._file.write(MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, iteration, temperature, cost, feasible):
+        if feasible and (self.best is None or cost < self.best):
+            self.best = cost
+        record = ConvergenceRecord(iteration, temperature, cost, self.best, feasible)
+        if self._file is not None:
+            if self._csv:
+                self._file.write(_csv_line(record))
+            else:
+                self._file.write(RECORD.pack(iteration, temperature, cost, self.best if self.best is not None else math.nan, feasible))
+
+        n = self.count
+        self.count += 1
+        if n % self.stride == 0:
+            if len(self._history) == self.capacity:
+                del self._history[1::2]
+                self.stride *= 2
+            if n % self.stride == 0:
+                self._history.append(record)
+        self.last = record
+
+    def records(self):
+        """Return the downsampled history, ending with the latest record."""
+        if self.last is not None and (not self._history or self._history[-1] is not self.last):
+            return self._history + [self.last]
+        return list(self._history)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def read_trace(path):
+    """Yield the ConvergenceRecords of a trace file written by a ConvergenceTracer."""
+    with open(path, 'rb') as f:
+        head = f.read(len(MAGIC))
+        if head == MAGIC:
+            while True:
+                data = f.read(RECORD.size * 4096)
+                if not data:
+                    break
+                if len(data) % RECORD.size:
+                    raise ValueError('Truncated convergence trace: %s' % path)
+                for iteration, temperature, cost, best, feasible in RECORD.iter_unpack(data):
+                    yield ConvergenceRecord(iteration, temperature, cost, None if math.isnan(best) else best, bool(feasible))
+            return
+    with open(path) as f:
+        if f.readline() != CSV_HEADER:
+            raise ValueError('Not a convergence trace: %s' % path)
+        for line in f:
+            iteration, temperature, cost, best, feasible = line.rstrip('\n').split(',')
+            yield ConvergenceRecord(int(iteration), float(temperature), float(cost), float(best) if best else None, feasible == '1')
+
+def plot_records(records):
+    """Plot the current and best feasible cost of convergence records by iteration."""
+    if plt is None:
+        raise ImportError('Must install matplotlib to plot convergence.')
+
+    records = list(records)
+    iterations = [record.iteration for record in records]
+    plt.plot(iterations, [record.cost for record in records], label='Current')
+    plt.plot(iterations, [record.best if record.best is not None else math.nan for record in records], label='Best feasible')
+    plt.xlabel('Iteration')
+    plt.ylabel('Cost')
+    plt.legend()
+    plt.show()
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize, convert or plot a convergence trace.')
+    parser.add_argument('trace')
+    parser.add_argument('--csv', help='write the trace as CSV to this file')
+    parser.add_argument('--plot', action='store_true')
+    args = parser.parse_args()
+
+    count = 0
+    last = None
+    first_feasible = None
+    out = open(args.csv, 'w') if args.csv else None
+    try:
+        if out is not None:
+            out.write(CSV_HEADER)
+        for record in read_trace(args.trace):
+            count += 1
+            last = record
+            if first_feasible is None and record.feasible:
+                first_feasible = record
+            if out is not None:
+                out.write(_csv_line(record))
+    finally:
+        if out is not None:
+            out.close()
+    print('%d records' % count)
+    if last is not None:
+        print('Last: iteration %d, temperature %.6g, cost %.1f, best %s' % (last.iteration, last.temperature, last.cost, '%.1f' % last.best if last.best is not None else '-'))
+    if first_feasible is not None:
+        print('First feasible at iteration %d' % first_feasible.iteration)
+    if args.plot:
+        plot_records(read_trace(args.trace))
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,81 @@
-from helpers import dijkstra
+from helpers import dijkstra, floyd_warshall
 from location import Location
-from package import Package
-from hashtable import ChainingHashTable
+from hashtable import ChainingHashTable, build_table
+from distancematrix import DistanceMatrix, MappedDistanceMatrix
+from roadgraph import LazyDistanceTable
+from spatial import coordinate_distances
+from snapshot import InstanceSnapshot
+from packagestream import PackageStream
 import csv
-from datetime import datetime, date
+import hashlib
+import importlib
+import logging
+import os
 from collections import namedtuple
 
+try:
+    import numpy as np
+except:
+    np = None
+
 class DataLoader:
     LOCATIONS_FILENAME = 'locations.csv'
     PACKAGES_FILENAME = 'packages.csv'
     DISTANCES_FILENAME = 'distances.csv'
+    ROAD_EDGES_FILENAME = 'edges.csv'
+    ADDRESS_CHANGES_FILENAME = 'address_changes.csv'
+    CACHE_DIRNAME = '.vrpcache/'
+    ROAD_CACHE_SIZE = 1024
+    # Multiplier applied to straight-line distances between coordinates to
+    # approximate road distances when a pair is missing from distances.csv.
+    ROAD_FACTOR = 1.3
+    # Modules whose code decides what a compiled snapshot holds, such as the
+    # parsing of special notes and the shortest path closure of distances.
+    SNAPSHOT_MODULES = ('dataloader', 'packagestream', 'package', 'location', 'distancematrix', 'helpers', 'spatial', 'snapshot')
 
     Data = namedtuple('Data', ['package_table', 'location_table', 'distance_table'])
+    Data.__qualname__ = 'DataLoader.Data'
 
-    def __init__(self, simulator, data_dir):
+    def __init__(self, simulator, data_dir, mmap_distances=False, triangular=False, table_type=None):
         self.simulator = simulator
         self.data_dir = data_dir
+        self.mmap_distances = mmap_distances
+        self.triangular = triangular
+        # The package and location tables can be any table class with the
+        # dictionary interface, e.g. ChainingHashTable or
+        # OpenAddressingHashTable.  By default a DirectAddressTable is used
+        # when the ids are dense integers (see hashtable.build_table).
+        self.table_type = table_type
         self.locations = ChainingHashTable()
         self.packages = ChainingHashTable()
 
     def import_data(self):
-        self.distances = self.load_distances()
+        road_graph = not os.path.exists(self.data_dir + DataLoader.DISTANCES_FILENAME) and os.path.exists(self.data_dir + DataLoader.ROAD_EDGES_FILENAME)
+        # Snapshots only cover instances with an in-memory distance matrix,
+        # since road graphs and memory mapped matrices are never fully loaded.
+        use_snapshot = not road_graph and not self.mmap_distances
+        if use_snapshot:
+            snapshot_path = self.snapshot_path()
+            snapshot = InstanceSnapshot.load(snapshot_path)
+            if snapshot is not None:
+                self.packages, self.locations, self.distances = snapshot.restore(self.simulator.constants.start_of_day, self.table_type)
+                return DataLoader.Data(self.packages, self.locations, self.distances)
+
+        if road_graph:
+            self.distances = self.load_road_graph()
+        else:
+            self.distances = self.load_distances()
         self.locations = self.load_locations()
         self.packages = self.load_packages()
 
+        if use_snapshot:
+            try:
+                os.makedirs(self.data_dir + DataLoader.CACHE_DIRNAME, exist_ok=True)
+                InstanceSnapshot.compile(self.packages, self.locations, self.distances, self.simulator.constants.start_of_day).save(snapshot_path)
+                self.remove_stale_cache('instance-', os.path.basename(snapshot_path))
+            except OSError as e:
+                logging.warning('Unable to write instance snapshot: %s' % e)
+
         data = DataLoader.Data(
             self.packages,
             self.locations,
@@ -31,6 +83,42 @@ class DataLoader:
         )
         return data
 
+    def source_digest(self, filenames):
+        digest = hashlib.sha1()
+        for filename in filenames:
+            with open(self.data_dir + filename, 'rb') as f:
+                digest.update(f.read())
+        return digest.hexdigest()
+
+    def remove_stale_cache(self, prefix, current):
+        """
+        Delete the files in the cache directory whose names start with
+        prefix but not with current, the prefix of the files just written.
+        Cache keys change with every edit to the instance or the code, so
+        this keeps a single generation of each cache per data directory.
+        Temporary files of writes in progress are left alone.
+        """
+        cache_dir = self.data_dir + DataLoader.CACHE_DIRNAME
+        for name in os.listdir(cache_dir):
+            if name.startswith(prefix) and not name.startswith(current) and not name.endswith('.tmp'):
+                try:
+                    os.remove(cache_dir + name)
+                except OSError:
+                    pass
+
+    def snapshot_path(self):
+        """
+        The compiled instance snapshot is keyed by the hash of every source
+        file, of the code in SNAPSHOT_MODULES and of ROAD_FACTOR, so any edit
+        to the instance or to how it is read invalidates it.
+        """
+        digest = hashlib.sha1(self.source_digest([DataLoader.LOCATIONS_FILENAME, DataLoader.PACKAGES_FILENAME, DataLoader.DISTANCES_FILENAME]).encode())
+        for name in DataLoader.SNAPSHOT_MODULES:
+            with open(importlib.import_module(name).__file__, 'rb') as f:
+                digest.update(f.read())
+        digest.update(repr(DataLoader.ROAD_FACTOR).encode())
+        return self.data_dir + DataLoader.CACHE_DIRNAME + 'instance-%s.snap' % digest.hexdigest()
+
     def load_locations(self):
         """
         A custom hash table implementation is used by the DataLoader class
@@ -39,8 +127,9 @@ class DataLoader:
         The ChainHashTable self-adjusts its size as required, doubling or
         halving in size based on a load factor (item_count/bucket_count)
         to maintain O(1) average complexity for search/insert/delete operations.
+        The rows are collected first, so the table is sized once in bulk.
         """
-        locations_hashtable = ChainingHashTable()
+        locations = []
         with open(self.data_dir + DataLoader.LOCATIONS_FILENAME) as csvfile:
             reader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
             for row in reader:
@@ -60,37 +149,20 @@ class DataLoader:
                     self.distances[int(data['LocationID'])]
                 )
 
-                locations_hashtable[data['LocationID']] = loc
+                locations.append((data['LocationID'], loc))
 
-        return locations_hashtable
+        return build_table(locations, self.table_type)
 
     def load_packages(self):
-        packages_hashtable = ChainingHashTable()
-        today = date.today()
-        with open(self.data_dir + DataLoader.PACKAGES_FILENAME) as csvfile:
-            reader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
-            for row in reader:
-                data = dict(row)
-                if data['DeliveryDeadline'] == 'EOD':
-                    data['DeliveryDeadline'] = datetime(today.year, today.month, today.day,hour=23,minute=59,second=59)
-                else:
-                    data['DeliveryDeadline'] = datetime.combine(today, datetime.strptime(data['DeliveryDeadline'], "%I:%M %p").time())
-                data['Mass'] = int(data['Mass'])
-                data['PackageID'] = int(data['PackageID'])
-                data['LocationID'] = int(data['LocationID'])
-
-                package = Package(
-                    data['PackageID'],
-                    self.locations[data['LocationID']],
-                    self.simulator.constants.start_of_day,
-                    data['DeliveryDeadline'],
-                    data['Mass'],
-                    data['SpecialNotes']
-                )
-
-                packages_hashtable[data['PackageID']] = package
-
-        return packages_hashtable
+        """
+        Packages are read through a PackageStream, which parses each distinct
+        deadline and special note only once, and indexes delivery locations
+        by their position in the distance table.  Every Package is kept in
+        the package table, so this does not lower the peak memory of a load.
+        """
+        stream = PackageStream(self.data_dir + DataLoader.PACKAGES_FILENAME, self.distances.index)
+        packages = stream.packages(self.locations, self.simulator.constants.start_of_day)
+        return build_table([(package.id, package) for package in packages], self.table_type)
 
     def load_distances(self):
         """
@@ -98,38 +170,141 @@ class DataLoader:
         file are not always the shortest path between locations, which is an
         assumption of the TSP / VRP generalization.  To correct for this,
         the pairwise distances are used to represent a complete graph, which
-        is run through a shortest path algorithm (Dijkstra) to minimize the
-        distances between locations.
-        """
-        distances_hashtable = ChainingHashTable()
-        with open(self.data_dir + DataLoader.DISTANCES_FILENAME) as csvfile:
-            reader = csv.reader(csvfile, delimiter=',', quotechar='"')
-            locations_x = next(reader, None)
-            for i, row in enumerate(reader):
-                location_y = int(row[0])
-                distances_hashtable[location_y] = ChainingHashTable()
-                for j in range(1, len(row)):
-                    location_x = int(locations_x[j])
-                    distance = float(row[j])
-                    distances_hashtable[location_y][location_x] = distance
-
-        mapping = ChainingHashTable()
-        mapping_inv = ChainingHashTable()
-        for i, location_id in enumerate(distances_hashtable.keys()):
-            mapping[location_id] = i
-            mapping_inv[i] = location_id
-
-        adj_list = [None] * len(mapping)
-        for start, adjs in distances_hashtable.items():
-            neighbors = []
-            for end, weight in adjs.items():
-                neighbors.append((mapping[end], weight))
-            adj_list[mapping[start]] = neighbors
-
-        for start, adjs in distances_hashtable.items():
-            distances = dijkstra(adj_list, mapping, start)
-            for i, dist in enumerate(distances):
-                end = mapping_inv[i]
-                distances_hashtable[start][end] = dist
-
-        return distances_hashtable
\ No newline at end of file
+        is closed under shortest paths.  With NumPy installed this is a
+        vectorized Floyd-Warshall, and the resulting matrix is cached as a
+        .npy file keyed by a hash of distances.csv, so later runs only load
+        the array, and a cache that does not load is recomputed.  Without
+        NumPy, Dijkstra is run from every location.
+        With mmap_distances set, the closed matrix is instead stored as a
+        float32 (optionally upper-triangular) file that is memory mapped
+        read-only, so parallel solver processes share a single copy.
+        """
+        with open(self.data_dir + DataLoader.DISTANCES_FILENAME, 'rb') as csvfile:
+            raw = csvfile.read()
+        with open(self.data_dir + DataLoader.LOCATIONS_FILENAME, 'rb') as csvfile:
+            locations_raw = csvfile.read()
+        digest = hashlib.sha1(raw + locations_raw).hexdigest()
+
+        coords = {}
+        for row in csv.DictReader(locations_raw.decode('utf-8').splitlines(), delimiter=',', quotechar='"'):
+            coords[int(row['LocationID'])] = (float(row['Lat']), float(row['Lon']))
+
+        reader = csv.reader(raw.decode('utf-8').splitlines(), delimiter=',', quotechar='"')
+        locations_x = [int(location_id) for location_id in next(reader, None)[1:]]
+        # Locations without any road distances are appended, to be filled in
+        # from their coordinates.
+        header_len = len(locations_x)
+        in_header = set(locations_x)
+        locations_x += [location_id for location_id in coords if location_id not in in_header]
+
+        cache_path = self.data_dir + DataLoader.CACHE_DIRNAME + 'distances-%s.npy' % digest
+        if self.mmap_distances:
+            if np is None:
+                raise ImportError('Must install numpy to memory map distances.')
+            mmap_path = cache_path[:-len('.npy')] + ('.tri' if self.triangular else '') + '.f32.npy'
+            if os.path.exists(mmap_path) and os.path.exists(MappedDistanceMatrix.ids_path(mmap_path)):
+                return MappedDistanceMatrix(mmap_path)
+        if np is not None and os.path.exists(cache_path):
+            # A cache that does not load, or does not fit the locations, is
+            # treated as missing and rewritten.
+            try:
+                matrix = np.load(cache_path)
+            except (OSError, ValueError, EOFError) as e:
+                logging.warning('Ignoring unreadable distance cache: %s' % e)
+                matrix = None
+            if matrix is not None and matrix.shape == (len(locations_x), len(locations_x)):
+                if self.mmap_distances:
+                    return MappedDistanceMatrix.create(mmap_path, locations_x, matrix, self.triangular)
+                return DistanceMatrix(locations_x, matrix)
+
+        index = {location_id: i for i, location_id in enumerate(locations_x)}
+        matrix = [[None] * len(locations_x) for _ in locations_x]
+        for row in reader:
+            if not row:
+                continue
+            values = matrix[index[int(row[0])]]
+            for j, distance in enumerate(row[1:header_len+1]):
+                if distance.strip():
+                    values[j] = float(distance)
+        matrix = self.fill_missing_distances(locations_x, matrix, coords)
+
+        if np is not None:
+            matrix = floyd_warshall(matrix)
+            try:
+                os.makedirs(self.data_dir + DataLoader.CACHE_DIRNAME, exist_ok=True)
+                # Written under a temporary name and renamed into place, so
+                # another process never loads a partial cache.
+                tmp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, matrix)
+                os.replace(tmp_path, cache_path)
+                self.remove_stale_cache('distances-', 'distances-%s' % digest)
+            except OSError as e:
+                logging.warning('Unable to write distance cache: %s' % e)
+            if self.mmap_distances:
+                return MappedDistanceMatrix.create(mmap_path, locations_x, matrix, self.triangular)
+            return DistanceMatrix(locations_x, matrix)
+
+        adj_list = [list(enumerate(row)) for row in matrix]
+        matrix = [dijkstra(adj_list, index, location_id) for location_id in locations_x]
+        return DistanceMatrix(locations_x, matrix)
+
+    def fill_missing_distances(self, location_ids, matrix, coords):
+        """
+        Pairs missing from distances.csv (blank cells, or locations that only
+        appear in locations.csv) are estimated from the coordinates of both
+        locations as the haversine distance times ROAD_FACTOR, rather than
+        blocking the whole load.  Pairs without coordinates on either side
+        are left unconnected, to be closed through other locations.
+        """
+        missing = sum(value is None for row in matrix for value in row) - sum(matrix[i][i] is None for i in range(len(matrix)))
+        for i in range(len(matrix)):
+            if matrix[i][i] is None:
+                matrix[i][i] = 0.0
+        if not missing:
+            return matrix
+        logging.warning('Estimating %d missing distances from coordinates.' % missing)
+
+        known = [i for i, location_id in enumerate(location_ids) if location_id in coords]
+        estimates = coordinate_distances([coords[location_ids[i]] for i in known], 'haversine', DataLoader.ROAD_FACTOR)
+        position = {i: k for k, i in enumerate(known)}
+        inf = float('inf')
+        for i, row in enumerate(matrix):
+            p = position.get(i)
+            for j, value in enumerate(row):
+                if value is None:
+                    q = position.get(j)
+                    row[j] = inf if p is None or q is None else float(estimates[p][q])
+        return matrix
+
+    def load_address_changes(self):
+        """
+        The corrected addresses of packages listed with a wrong address, as
+        {package_id: location_id}, from the optional address_changes.csv of
+        the instance.  Corrections are instance data, so every copy of an
+        instance directory applies the same ones.
+        """
+        path = self.data_dir + DataLoader.ADDRESS_CHANGES_FILENAME
+        if not os.path.exists(path):
+            return {}
+        with open(path) as csvfile:
+            return {int(row['PackageID']): int(row['LocationID']) for row in csv.DictReader(csvfile, delimiter=',', quotechar='"')}
+
+    def load_road_graph(self):
+        """
+        For service areas too large for a dense distances.csv, a sparse
+        edges.csv of road segments can be provided instead.  Shortest paths
+        are then computed lazily per source location and kept in a bounded
+        LRU cache (see LazyDistanceTable).  As with distances.csv, the
+        distances of locations missing from edges.csv are estimated from
+        their coordinates, times ROAD_FACTOR.
+        """
+        table = LazyDistanceTable.from_csv(self.data_dir + DataLoader.ROAD_EDGES_FILENAME, DataLoader.ROAD_CACHE_SIZE)
+        coords = {}
+        with open(self.data_dir + DataLoader.LOCATIONS_FILENAME) as csvfile:
+            for row in csv.DictReader(csvfile, delimiter=',', quotechar='"'):
+                coords[int(row['LocationID'])] = (float(row['Lat']), float(row['Lon']))
+        missing = table.estimate_missing(coords, DataLoader.ROAD_FACTOR)
+        if missing:
+            logging.warning('Estimating the distances of %d locations missing from %s from coordinates.' % (len(missing), DataLoader.ROAD_EDGES_FILENAME))
+        return table
@@ -0,0 +1,208 @@
+from construction import PlanEvaluator, build_units, build_route, regret_insertion, route_trips, insertions
+from optimization import two_opt, held_karp
+from parallel import map_tasks, worker_simulator
+from route import Route
+from math import atan2, pi
+import os
+
+def _solve_cluster(task):
+    truck_idx, unit_ids = task
+    return truck_idx, solve_cluster(worker_simulator(), truck_idx, unit_ids).encode()
+
+def _improve_route(task):
+    truck_idx, encoded = task
+    simulator = worker_simulator()
+    route = Route.decode(simulator.depot.trucks[truck_idx], simulator.data.package_table, encoded)
+    return truck_idx, improve_route(simulator, route).encode()
+
+def improve_route(simulator, route):
+    """
+    Optimize a single route on its own, as no constraint of the problem
+    spans more than one route.
+    """
+    solution = two_opt([route], simulator.test_eval)
+    return held_karp(solution, simulator.test_eval)[0]
+
+def solve_cluster(simulator, truck_idx, unit_ids):
+    """
+    Route a cluster, given as lists of package ids that are loaded together,
+    on a single truck: regret insertion into trips, then 2-opt and exact
+    sequencing of each trip.
+    """
+    table = simulator.data.package_table
+    units = [([table[package_id] for package_id in unit], None) for unit in unit_ids]
+    trips = regret_insertion(simulator, plans=[[]], units=units)[0]
+    truck = simulator.depot.trucks[truck_idx]
+    route = build_route(truck, trips, PlanEvaluator(simulator).evaluate(trips)[2])
+    return improve_route(simulator, route)
+
+def sweep_clusters(simulator, units, n_clusters):
+    """
+    Cluster first: split the units into n_clusters sectors by polar angle
+    around the depot.  Units are first divided into time window bands (by
+    whether they have a deadline before the latest one, and whether they
+    are available after the start of the day), and each band is swept into
+    n_clusters sectors of equal package count from the same starting angle,
+    so that every cluster covers a contiguous region and gets its share of
+    each kind of time window.  The sweep starts at the widest angular gap
+    between units, so that no dense area is cut in two.
+    Returns the list of clusters, each a list of units in sweep order, and
+    the sweep angle of every unit.
+    """
+    lat0, lon0 = simulator.depot_location.coords
+    start = simulator.constants.start_of_day
+    latest = max(p.delivery_deadline for unit, _ in units for p in unit)
+
+    angles = []
+    for unit, _ in units:
+        lat, lon = unit[0].delivery_location.coords
+        angles.append(atan2(lat - lat0, lon - lon0) % (2 * pi))
+    ordered = sorted(angles)
+    gaps = [(ordered[(i + 1) % len(ordered)] - a) % (2 * pi) for i, a in enumerate(ordered)]
+    widest = max(range(len(gaps)), key=gaps.__getitem__)
+    origin = ordered[(widest + 1) % len(ordered)]
+    angles = [(a - origin) % (2 * pi) for a in angles]
+
+    bands = {}
+    for u, (unit, _) in enumerate(units):
+        band = (
+            any(p.delivery_deadline < latest for p in unit),
+            any(p.earliest_load > start for p in unit)
+        )
+        bands.setdefault(band, []).append(u)
+
+    clusters = [[] for _ in range(n_clusters)]
+    for band in bands.values():
+        band.sort(key=angles.__getitem__)
+        total = sum(len(units[u][0]) for u in band)
+        count = 0
+        for u in band:
+            k = min(count * n_clusters // total, n_clusters - 1)
+            clusters[k].append(u)
+            count += len(units[u][0])
+    for cluster in clusters:
+        cluster.sort(key=angles.__getitem__)
+    return clusters, angles
+
+def _assign_clusters(clusters, units, n_trucks):
+    """
+    Assign clusters to trucks.  A truck that some units are required on gets
+    the free cluster holding most of them, and those units then move to it.
+    Returns the cluster of every truck.
+    """
+    required = {}
+    for u, (_, truck_idx) in enumerate(units):
+        if truck_idx is not None:
+            required.setdefault(truck_idx, []).append(u)
+
+    owner = [None] * n_trucks
+    free = set(range(len(clusters)))
+    for truck_idx, members in sorted(required.items(), key=lambda item: -len(item[1])):
+        best = max(sorted(free), key=lambda k: sum(u in clusters[k] for u in members))
+        owner[truck_idx] = best
+        free.remove(best)
+    for truck_idx in range(n_trucks):
+        if owner[truck_idx] is None:
+            owner[truck_idx] = min(free)
+            free.remove(owner[truck_idx])
+
+    for truck_idx, members in required.items():
+        for cluster in clusters:
+            for u in members:
+                if u in cluster:
+                    cluster.remove(u)
+        clusters[owner[truck_idx]].extend(members)
+    return [clusters[k] for k in owner]
+
+def boundary_repair(evaluator, plans, units, unit_of, order, boundary=3, passes=2):
+    """
+    Route second repair: clusters are routed independently, so units near a
+    border between neighboring sectors may be cheaper on the other side.
+    For every pair of trucks with adjacent sectors (in sweep <order>), the
+    <boundary> units of each nearest the shared border are relocated to the
+    other truck at their best insertion whenever that lowers the combined
+    cost of both trucks.  Units that require a truck are never moved.
+    Returns the indices of the trucks whose plans changed.
+    """
+    changed = set()
+    scores = [evaluator.score(plan) for plan in plans]
+    for _ in range(passes):
+        improved = False
+        for i in range(len(order)):
+            a, b = order[i], order[(i + 1) % len(order)]
+            if a == b:
+                continue
+            # The last units of a's sector and the first of b's sector face
+            # each other across the border.
+            edge_a = unit_of[a][-boundary:]
+            edge_b = unit_of[b][:boundary]
+            for src, dst, edge in ((a, b, edge_a), (b, a, edge_b)):
+                for u in edge:
+                    unit, required = units[u]
+                    if required is not None or u not in unit_of[src]:
+                        continue
+                    ids = {p.id for p in unit}
+                    removed = [[p for p in trip if p.id not in ids] for trip in plans[src]]
+                    removed = [trip for trip in removed if trip]
+                    removed_score = evaluator.score(removed)
+                    best = None
+                    for plan in insertions(unit, plans[dst], evaluator.capacity):
+                        score = evaluator.score(plan)
+                        if best is None or score < best[0]:
+                            best = (score, plan)
+                    if removed_score + best[0] < scores[src] + scores[dst] - 1e-9:
+                        plans[src], plans[dst] = removed, best[1]
+                        scores[src], scores[dst] = removed_score, best[0]
+                        unit_of[src].remove(u)
+                        unit_of[dst].append(u)
+                        changed.update((src, dst))
+                        improved = True
+        if not improved:
+            break
+    return changed
+
+def decompose(simulator, workers=None, boundary=3, passes=2):
+    """
+    Cluster-first route-second decomposition for large fleets, where one
+    simulated annealing search over every route can not scale.  Packages
+    are swept into one cluster per truck by polar angle and time window
+    (sweep_clusters()), each cluster is routed on its own truck in parallel
+    worker processes, and a boundary repair pass then moves units between
+    trucks with adjacent sectors, re-optimizing the routes that changed.
+    The routes are loaded onto the trucks and returned as a solution.
+    It replaces the simulator's construction rather than following it: pass
+    construction='decompose' to DeliverySimulator, or construction=None to
+    create the simulator with empty routes and call decompose() on it.
+    """
+    n_trucks = simulator.constants.number_drivers
+    workers = workers or os.cpu_count() or 1
+    units = build_units(simulator)
+    clusters, angles = sweep_clusters(simulator, units, n_trucks)
+    unit_of = _assign_clusters(clusters, units, n_trucks)
+
+    tasks = [(t, [[p.id for p in units[u][0]] for u in unit_of[t]]) for t in range(n_trucks)]
+    routes = [None] * n_trucks
+    table = simulator.data.package_table
+    for truck_idx, encoded in map_tasks(simulator, _solve_cluster, tasks, workers):
+        routes[truck_idx] = Route.decode(simulator.depot.trucks[truck_idx], table, encoded)
+
+    # Trucks in sweep order of their sectors, by the mean angle of its units.
+    def mean_angle(t):
+        return sum(angles[u] for u in unit_of[t]) / len(unit_of[t]) if unit_of[t] else 2 * pi
+    order = sorted(range(n_trucks), key=mean_angle)
+    for t in range(n_trucks):
+        unit_of[t].sort(key=angles.__getitem__)
+
+    evaluator = PlanEvaluator(simulator)
+    plans = [route_trips(route) for route in routes]
+    changed = boundary_repair(evaluator, plans, units, unit_of, order, boundary, passes)
+
+    tasks = []
+    for t in sorted(changed):
+        tasks.append((t, build_route(simulator.depot.trucks[t], plans[t], evaluator.evaluate(plans[t])[2]).encode()))
+    for truck_idx, encoded in map_tasks(simulator, _improve_route, tasks, workers):
+        routes[truck_idx] = Route.decode(simulator.depot.trucks[truck_idx], table, encoded)
+
+    for truck, route in zip(simulator.depot.trucks, routes):
+        truck.route = route
+    return routes
@@ -1,13 +1,14 @@
 from depot import Depot
 from depotstop import DepotStop
-from optimization import nearest_neighbor
+from construction import construct
 from package import Package
 from dataloader import DataLoader
+from replan import replan as incremental_replan
+from timeline import DeliveryTimeline, STATUS_NAMES
 from enum import Enum
 from collections import namedtuple
 from copy import copy
 from datetime import timedelta
-from operator import attrgetter
 
 try:
     from matplotlib import pyplot as plt
@@ -23,6 +24,7 @@ class Constraint(Enum):
 
 class DeliverySimulator:
     Constants = namedtuple('Constants', ['number_drivers', 'truck_speed', 'truck_capacity', 'start_of_day'])
+    Constants.__qualname__ = 'DeliverySimulator.Constants'
     def __init__(
         self,
         depot_location,
@@ -30,16 +32,38 @@ class DeliverySimulator:
         truck_speed,
         truck_capacity,
         start_of_day,
-        data_dir
+        data_dir,
+        mmap_distances=False,
+        table_type=None,
+        construction='savings',
+        address_changes=None,
+        data=None
     ):
         self.constants = DeliverySimulator.Constants(number_drivers, truck_speed, truck_capacity, start_of_day)
-        self.data = DataLoader(self, data_dir).import_data()
+        # Instances in other formats are loaded by an adapter into a
+        # DataLoader.Data (e.g. solomon.load_solomon()), and given as data
+        # in place of a data directory.
+        loader = None
+        if data is None:
+            loader = DataLoader(self, data_dir, mmap_distances, table_type=table_type)
+            data = loader.import_data()
+        self.data = data
 
         self.depot_location = self.data.location_table[depot_location]
         self.depot = self.create_depot()
-
-        self.change_package_address(9, 1004)
-        self.initial_route()
+        self.timeline = None
+
+        # Corrected delivery addresses, as {package_id: location_id}.  By
+        # default they are read from the address_changes.csv of the instance.
+        if address_changes is None and loader is not None:
+            address_changes = loader.load_address_changes()
+        for package_id, location_id in (address_changes or {}).items():
+            self.change_package_address(package_id, location_id)
+        # With construction=None the trucks start with empty routes, for
+        # callers that build them another way.
+        self.construction = construction
+        if construction is not None:
+            self.initial_route()
 
     def current_solution(self):
         return self.depot.get_routes()
@@ -50,68 +74,37 @@ class DeliverySimulator:
     def change_package_address(self, package_id, location_id):
         self.data.package_table[package_id].change_delivery_location(self.data.location_table[location_id])
 
-    def initial_route(self):
-        packages = list(self.data.package_table.values())
-        packages.sort(key=attrgetter('delivery_deadline', 'earliest_load'))
-
-        linked_packages = self.depot.linked_packages
-        for group in linked_packages:
-            for package in group:
-                self.depot.trucks[0].load_package(package)
-
-        i = 0
-        while i < len(packages):
-            package = packages[i]
-            if package.required_truck_number is not None:
-                self.depot.trucks[package.required_truck_number - 1].load_package(package)
-                packages.remove(package)
-            elif any(package in group for group in self.depot.linked_packages):
-                packages.remove(package)
-            elif str(package.earliest_load.time()) == '09:05:00':
-                self.depot.trucks[1].load_package(package)
-                packages.remove(package)
-            else:
-                i += 1
-
-        i = 0
-        while i < len(packages):
-            package = packages[i]
-            if package.delivery_deadline.hour > 10 or package.earliest_load.hour > 8:
-                i += 1
-            else:
-                self.depot.trucks[0].load_package(package)
-                packages.remove(package)
-
-        self.depot.trucks[0].route.packages = nearest_neighbor(self.depot_location, self.depot.trucks[0].route.packages)
-
-        num_loaded = 0
-        while packages:
-            self.depot.trucks[num_loaded % self.constants.number_drivers].load_package(packages.pop(0))
-            num_loaded += 1
-
-        routes = self.depot.get_routes()
-        total = 0
-        for route in routes:
-            route.set_minimal_depot_stops()
-            total += len(route)
-        assert total == 40
-
-        routes[1].get_depot_stop(0).increase_wait(95)
+    def initial_route(self, method=None):
+        """
+        Build the initial routes with a construction heuristic from
+        construction.py, by default the one given to the simulator.
+        """
+        construct(self, method or self.construction)
 
-        for i in range(1, len(routes[0])):
-            assert routes[0].packages[i].id != routes[0].packages[i-1].id
-        for i in range(1, len(routes[1])):
-            assert routes[1].packages[i].id != routes[1].packages[i-1].id
+    def replan(self, cur_time, address_changes=None, arrivals=None, new_packages=None, time_limit=5):
+        """
+        Re-optimize the current routes for changes that become known at
+        cur_time, without re-solving the whole day.  See replan.replan().
+        """
+        return incremental_replan(self, self.current_solution(), cur_time, address_changes, arrivals, new_packages, time_limit)
 
     def insert_optimized_solution(self, solution):
+        """
+        Load the routes of a solution onto the trucks, recording the load and
+        delivery time of every package, and index the resulting day in a
+        DeliveryTimeline for status queries.
+        """
+        legs = {}
         for i, route in enumerate(solution):
             truck = self.depot.trucks[i]
             truck.route = route
+            truck_legs = legs[truck.number] = []
 
             cur_time = self.constants.start_of_day
             load_time = self.constants.start_of_day
             pred_loc = self.depot_location
             for step in route.gen_steps():
+                depart_time = cur_time
                 if type(step) is Package:
                     distance = pred_loc.distances[step.delivery_location.id]
                     cur_time += timedelta(hours=distance/self.constants.truck_speed)
@@ -119,17 +112,26 @@ class DeliverySimulator:
                     step.load_time = load_time
                     step.delivery_time = cur_time
 
+                    truck_legs.append((depart_time, cur_time, pred_loc, step.delivery_location))
                     pred_loc = step.delivery_location
                     self.data.package_table[step.id] = step
                 else:
                     distance = pred_loc.distances[self.depot_location.id]
-                    cur_time += timedelta(hours=distance/self.constants.truck_speed, minutes=step.wait_minutes)
+                    cur_time += timedelta(hours=distance/self.constants.truck_speed)
+                    truck_legs.append((depart_time, cur_time, pred_loc, self.depot_location))
+                    cur_time += timedelta(minutes=step.wait_minutes)
                     load_time = cur_time
                     pred_loc = self.depot_location
                 truck.miles_driven += distance
                 truck.current_location = pred_loc
+        self.timeline = DeliveryTimeline(self.constants.start_of_day, self.data.package_table.values(), legs)
 
-    def lookup_status(self, cur_time, package_ids):
+    def lookup_status(self, cur_time, package_ids=None):
+        """
+        Print a table of the status of packages at cur_time, of every
+        package when package_ids is None.  Statuses come from the timeline
+        once a solution has been inserted.
+        """
         def format_table(rows):
             col_lens = [max(list(map(lambda x:len(str(x.get(k))), rows)) + [len(str(k))]) for k in rows[0].keys()]
             col_seps = " | ".join("{:<%s}" % m for m in col_lens) + "\n"
@@ -138,9 +140,19 @@ class DeliverySimulator:
             ret += "".join(col_seps.format(*v) for v in [ [str(field) for field in row.values()] for row in rows ])
             return ret
 
+        if package_ids is None:
+            package_ids = sorted(package.id for package in self.data.package_table.values())
+        if self.timeline is not None:
+            codes = self.timeline.status_codes(cur_time)
+            index = self.timeline.index
+
         data = []
         for p_id in package_ids:
             package = self.data.package_table[p_id]
+            if self.timeline is not None:
+                status = STATUS_NAMES[codes[index[p_id]]]
+            else:
+                status = package.delivery_status(cur_time)
             row = {
                 'id': package.id,
                 'address': package.delivery_location.address,
@@ -148,7 +160,7 @@ class DeliverySimulator:
                 'city': package.delivery_location.city,
                 'zip': package.delivery_location.zipcode,
                 'weight': package.mass,
-                'status': package.delivery_status(cur_time)
+                'status': status
             }
             data.append(row)
         print(format_table(data))
@@ -171,8 +183,12 @@ class DeliverySimulator:
             total_miles += pred_loc.distances[self.depot_location.id]
         return total_miles
 
-    def test_eval(self, solution, return_early=False):
-        """Calculates the constraint satisfaction and cost of a solution."""
+    def test_eval(self, solution, return_early=False, start_times=None):
+        """
+        Calculates the constraint satisfaction and cost of a solution.
+        <start_times> optionally maps truck numbers to the time their route
+        leaves the depot, when it does not start at the start of the day.
+        """
         def update_status(cur_status, incoming_status):
             cur_status = cur_status is None or cur_status is True
             return cur_status and incoming_status
@@ -195,7 +211,9 @@ class DeliverySimulator:
         total_miles = 0
         for route in solution:
             cur_time = self.constants.start_of_day
-            load_time = self.constants.start_of_day
+            if start_times:
+                cur_time = start_times.get(route.truck.number, cur_time)
+            load_time = cur_time
             pred_loc = self.depot_location
             for step in route.gen_steps():
                 if type(step) is Package:
@@ -218,7 +236,9 @@ class DeliverySimulator:
                 total_miles += distance
             total_miles += pred_loc.distances[self.depot_location.id]
 
-        return constraints, total_miles
+        # A constraint that no package was checked against, such as required
+        # trucks in an instance without any, holds trivially.
+        return [value is not False for value in constraints], total_miles
 
     @staticmethod
     def validate_constraint(constraint, **kwargs):
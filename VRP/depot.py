@@ -14,8 +14,10 @@ class Depot:
         self._set_linked_packages()
 
     def _create_trucks(self):
-        for _ in range(self.truck_count):
-            self.trucks.append(Truck(self.location, self.constants))
+        # Trucks are numbered per depot, so that required truck numbers stay
+        # valid when more than one simulator is created in a process.
+        for i in range(self.truck_count):
+            self.trucks.append(Truck(self.location, self.constants, i + 1))
 
     @property
     def packages(self):
@@ -0,0 +1,171 @@
+import os
+
+try:
+    import numpy as np
+except:
+    np = None
+
+class DistanceRow:
+    """
+    The distances from a single location to every other location, indexed by
+    location id.  Rows share the id-to-index mapping of their DistanceMatrix,
+    so a lookup is a dictionary access followed by a list / array index.
+    """
+    __slots__ = ('values', 'index')
+
+    def __init__(self, values, index):
+        self.values = values
+        self.index = index
+
+    def __getitem__(self, location_id):
+        return self.values[self.index[location_id]]
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, location_id):
+        return location_id in self.index
+
+    def keys(self):
+        return self.index.keys()
+
+    def items(self):
+        return [(location_id, self.values[i]) for location_id, i in self.index.items()]
+
+class DistanceMatrix:
+    """
+    A dense, metric closed distance table between locations.  values is
+    either a NumPy array or a list of lists, where values[i][j] is the
+    distance from ids[i] to ids[j].  Indexing by a location id returns a
+    DistanceRow, so DistanceMatrix acts as a drop-in replacement for the
+    nested distance tables used by Location.distances.  Rows of a NumPy
+    matrix are converted to lists, as indexing a list with Python ints is
+    considerably faster than indexing an array in the evaluation loops.
+    """
+    def __init__(self, ids, values):
+        self.ids = list(ids)
+        self.index = {location_id: i for i, location_id in enumerate(self.ids)}
+        self.values = values
+
+    def __getitem__(self, location_id):
+        values = self.values[self.index[location_id]]
+        if np is not None and isinstance(values, np.ndarray):
+            values = values.tolist()
+        return DistanceRow(values, self.index)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, location_id):
+        return location_id in self.index
+
+    def keys(self):
+        return list(self.ids)
+
+    def items(self):
+        return [(location_id, self[location_id]) for location_id in self.ids]
+
+    def distance(self, start, end):
+        return float(self.values[self.index[start]][self.index[end]])
+
+class MappedDistanceRow:
+    """
+    The distances from a single location in a MappedDistanceMatrix.  Values
+    are read from the mapped file on access and returned as Python floats.
+    """
+    __slots__ = ('matrix', 'row')
+
+    def __init__(self, matrix, row):
+        self.matrix = matrix
+        self.row = row
+
+    def __getitem__(self, location_id):
+        return self.matrix.lookup(self.row, self.matrix.index[location_id])
+
+    def __len__(self):
+        return len(self.matrix.index)
+
+    def __contains__(self, location_id):
+        return location_id in self.matrix.index
+
+    def keys(self):
+        return self.matrix.index.keys()
+
+    def items(self):
+        return [(location_id, self.matrix.lookup(self.row, i)) for location_id, i in self.matrix.index.items()]
+
+class MappedDistanceMatrix(DistanceMatrix):
+    """
+    A DistanceMatrix backed by a read-only memory mapped .npy file, so that
+    every process working on the same service area shares a single copy of
+    the matrix through the OS page cache.  Pickling a MappedDistanceMatrix
+    (or any Location / DistanceRow referencing it) only stores the path, so
+    worker processes re-map the file instead of unpickling their own copy.
+    The matrix is stored as float32, and symmetric matrices can optionally be
+    stored as the packed upper triangle to halve the file size.
+    The location ids are stored next to the matrix in <path>.ids.npy.
+    """
+    def __init__(self, path):
+        if np is None:
+            raise ImportError('Must install numpy to memory map distances.')
+        self.path = path
+        mapped = np.load(path, mmap_mode='r')
+        # A plain ndarray view of the mapping avoids the per-access overhead
+        # of the np.memmap subclass, while still sharing the mapped pages.
+        values = np.asarray(mapped)
+        ids = np.load(MappedDistanceMatrix.ids_path(path)).tolist()
+        super().__init__(ids, values)
+        self.triangular = values.ndim == 1
+        n = len(self.ids)
+        self.offsets = [i * n - i * (i - 1) // 2 - i for i in range(n)] if self.triangular else None
+
+    def __reduce__(self):
+        return (MappedDistanceMatrix, (self.path,))
+
+    def __getitem__(self, location_id):
+        return MappedDistanceRow(self, self.index[location_id])
+
+    @staticmethod
+    def ids_path(path):
+        return path + '.ids.npy'
+
+    @staticmethod
+    def create(path, ids, values, triangular=False, dtype='float32'):
+        """
+        Write a distance matrix to path (and its location ids to
+        <path>.ids.npy) and return it memory mapped.  With triangular=True
+        only the upper triangle, row by row, is stored, which requires the
+        matrix to be symmetric.
+        Both files are written under temporary names and renamed into place,
+        the ids first, so another process never maps a partial matrix, and
+        a matrix file is only ever found next to its ids.
+        """
+        if np is None:
+            raise ImportError('Must install numpy to memory map distances.')
+        values = np.asarray(values, dtype=np.float64)
+        if triangular:
+            if not np.allclose(values, values.T):
+                raise ValueError('Only a symmetric distance matrix can be stored as a triangle.')
+            values = values[np.triu_indices(len(values))]
+        ids_path = MappedDistanceMatrix.ids_path(path)
+        tmp_ids_path = '%s.%d.tmp' % (ids_path, os.getpid())
+        with open(tmp_ids_path, 'wb') as f:
+            np.save(f, np.asarray(ids, dtype=np.int64))
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=values.shape)
+        out[...] = values
+        out.flush()
+        del out
+        os.replace(tmp_ids_path, ids_path)
+        os.replace(tmp_path, path)
+        return MappedDistanceMatrix(path)
+
+    def lookup(self, i, j):
+        if self.triangular:
+            if i > j:
+                i, j = j, i
+            return float(self.values[self.offsets[i] + j])
+        return float(self.values[i, j])
+
+    def distance(self, start, end):
+        return self.lookup(self.index[start], self.index[end])
@@ -0,0 +1,208 @@
+from package import Package
+from timeline import DeliveryTimeline
+from collections import namedtuple
+from datetime import timedelta
+import heapq
+
+# Event kinds.
+DEPART = 'depart'
+DELIVER = 'deliver'
+RETURN = 'return'
+WAIT = 'wait'
+DELAY = 'delay'
+FINISH = 'finish'
+
+Event = namedtuple('Event', ['time', 'kind', 'truck', 'package', 'location', 'minutes'])
+Result = namedtuple('Result', ['load_times', 'delivery_times', 'late', 'miles', 'finish_times', 'events'])
+
+class EventSimulator:
+    """
+    A discrete-event replay of a plan.  Every truck has at most one pending
+    event on a heap ordered by time, so a fleet-day of n route steps is
+    simulated in O(n log t) for t trucks.  The events of a truck are:
+        DEPART: the truck leaves the depot, loaded with the next trip.
+        DELIVER: a package is delivered.
+        RETURN: the truck is back at the depot to reload.
+        WAIT: the truck waits at the depot for <minutes>.
+        DELAY: the truck is held up for <minutes>, shifting the rest of its
+            route.
+        FINISH: the truck is back at the depot for the day.
+    Times are kept as float seconds after the start of the day, and events
+    are only built and sent when there are subscribers, so what-if replays
+    in bulk stay cheap.  Delays are injected with inject_delay() before
+    run().  The plan follows DeliverySimulator.test_eval(): a depot stop
+    returns the truck to the depot, waits, then loads the next trip.
+    """
+    def __init__(self, simulator, solution):
+        self.simulator = simulator
+        self.solution = solution
+        self.start_of_day = simulator.constants.start_of_day
+        self.speed = simulator.constants.truck_speed
+        self.depot_location = simulator.depot_location
+        self.subscribers = []
+        self.delays = []
+
+    def subscribe(self, callback):
+        """Call callback(event) with every Event as it is simulated."""
+        self.subscribers.append(callback)
+
+    def inject_delay(self, time, truck_number, minutes):
+        """Hold truck <truck_number> up for <minutes> from datetime <time>."""
+        self.delays.append(((time - self.start_of_day).total_seconds(), truck_number, minutes))
+
+    def _emit(self, t, kind, truck, package=None, location=None, minutes=0):
+        event = Event(self.start_of_day + timedelta(seconds=t), kind, truck, package, location, minutes)
+        for callback in self.subscribers:
+            callback(event)
+
+    def run(self, apply=False):
+        """
+        Simulate the day and return a Result, with load and delivery times in
+        seconds after the start of the day per package id, the ids of late
+        packages, total miles, the finish time of each truck and the number
+        of events.  With apply, the load and delivery times are written to
+        the packages, deliveries go through Truck.deliver_package(), and the
+        simulator's timeline is rebuilt from the replay.
+        """
+        depot = self.depot_location
+        depot_id = depot.id
+        speed_per_second = self.speed / 3600
+        emit = self._emit if self.subscribers else None
+        trucks = [route.truck for route in self.solution]
+        numbers = [truck.number for truck in trucks]
+        steps = [list(route.gen_steps()) for route in self.solution]
+        number_index = {number: i for i, number in enumerate(numbers)}
+
+        load_times = {}
+        delivery_times = {}
+        finish_times = {}
+        miles = 0.0
+        n_events = 0
+        pending = [0.0] * len(steps)
+        position = [0] * len(steps)
+        pred = [depot] * len(steps)
+        legs = {number: [] for number in numbers} if apply else None
+
+        heap = []
+        seq = 0
+        for t, number, minutes in self.delays:
+            if number in number_index:
+                heap.append((t, seq, number_index[number], DELAY, minutes))
+                seq += 1
+        heapq.heapify(heap)
+
+        def schedule(i, t):
+            """Queue the arrival of truck i at its next step, leaving at t."""
+            nonlocal seq
+            k = position[i]
+            route_steps = steps[i]
+            if k >= len(route_steps):
+                return
+            step = route_steps[k]
+            if type(step) is Package:
+                distance = pred[i].distances[step.delivery_location.id]
+                heapq.heappush(heap, (t + distance / speed_per_second, seq, i, DELIVER, (t, distance)))
+            elif pred[i].id == depot_id:
+                heapq.heappush(heap, (t, seq, i, RETURN, (t, 0.0)))
+            else:
+                distance = pred[i].distances[depot_id]
+                heapq.heappush(heap, (t + distance / speed_per_second, seq, i, RETURN, (t, distance)))
+            seq += 1
+
+        def load(i, t):
+            """Queue the departure with the packages up to the next depot stop."""
+            nonlocal seq
+            trip = []
+            for step in steps[i][position[i]:]:
+                if type(step) is not Package:
+                    break
+                trip.append(step)
+            if trip:
+                heapq.heappush(heap, (t, seq, i, DEPART, trip))
+                seq += 1
+            else:
+                schedule(i, t)
+
+        # Every truck starts the day at the depot, and loads right away when
+        # its route does not begin with a depot stop.
+        for i in range(len(steps)):
+            load(i, 0.0)
+
+        while heap:
+            t, _, i, kind, data = heapq.heappop(heap)
+            n_events += 1
+            number = numbers[i]
+            if kind == DELAY:
+                pending[i] += data * 60
+                if emit:
+                    emit(t, DELAY, number, minutes=data)
+                continue
+            if kind == DEPART:
+                if pending[i]:
+                    heapq.heappush(heap, (t + pending[i], seq, i, kind, data))
+                    seq += 1
+                    pending[i] = 0.0
+                    continue
+                for package in data:
+                    load_times[package.id] = t
+                if emit:
+                    emit(t, DEPART, number, location=depot)
+                schedule(i, t)
+                continue
+            if pending[i]:
+                # The truck is held up on this leg, so it arrives later.
+                heapq.heappush(heap, (t + pending[i], seq, i, kind, data))
+                seq += 1
+                pending[i] = 0.0
+                continue
+
+            depart, distance = data
+            miles += distance
+            step = steps[i][position[i]]
+            position[i] += 1
+            if kind == DELIVER:
+                location = step.delivery_location
+                delivery_times[step.id] = t
+                if apply:
+                    legs[number].append((depart, t, pred[i], location))
+                    trucks[i].miles_driven += distance
+                    trucks[i].deliver_package(step, self.start_of_day + timedelta(seconds=t))
+                pred[i] = location
+                if emit:
+                    emit(t, DELIVER, number, step, location)
+                schedule(i, t)
+            else:
+                if apply:
+                    legs[number].append((depart, t, pred[i], depot))
+                    trucks[i].miles_driven += distance
+                    trucks[i].current_location = depot
+                if distance and emit:
+                    emit(t, RETURN, number, location=depot)
+                pred[i] = depot
+                if step.route_index >= len(self.solution[i].packages) and position[i] >= len(steps[i]):
+                    finish_times[number] = t
+                    if emit:
+                        emit(t, FINISH, number, location=depot)
+                    continue
+                if step.wait_minutes and emit:
+                    emit(t, WAIT, number, location=depot, minutes=step.wait_minutes)
+                load(i, t + step.wait_minutes * 60)
+
+        late = []
+        start = self.start_of_day
+        for route in self.solution:
+            for package in route.packages:
+                delivered = delivery_times.get(package.id)
+                if delivered is not None and delivered > (package.delivery_deadline - start).total_seconds():
+                    late.append(package.id)
+
+        if apply:
+            for route in self.solution:
+                for package in route.packages:
+                    package.load_time = start + timedelta(seconds=load_times[package.id])
+            table = self.simulator.data.package_table
+            self.simulator.timeline = DeliveryTimeline(start, table.values(), {
+                number: [(start + timedelta(seconds=a), start + timedelta(seconds=b), x, y) for a, b, x, y in number_legs]
+                for number, number_legs in legs.items()
+            })
+        return Result(load_times, delivery_times, late, miles, finish_times, n_events)
@@ -7,6 +7,32 @@ class ListNode:
         self.val = val
         self.next = None
 
+class TableView:
+    """
+    A lazy view over the keys, values or items of a hash table, in the
+    manner of dict.keys() / dict.values() / dict.items().  Iterating walks the
+    table directly instead of first copying every entry into a new list.
+    """
+    __slots__ = ('table', 'kind')
+
+    def __init__(self, table, kind):
+        self.table = table
+        self.kind = kind
+
+    def __iter__(self):
+        return self.table._iter_entries(self.kind)
+
+    def __len__(self):
+        return len(self.table)
+
+    def __contains__(self, item):
+        if self.kind == 'keys':
+            return item in self.table
+        return any(entry == item for entry in self)
+
+    def __repr__(self):
+        return f"{type(self.table).__name__}.{self.kind}({list(self)})"
+
 class ChainingHashTable:
     """
         A custom hash table implementation created for educational purposes.
@@ -15,24 +41,45 @@ class ChainingHashTable:
         The ChainHashTable self-adjusts its size as required, doubling or
         halving in size based on a load factor (item_count/bucket_count)
         to maintain O(1) average complexity for search/insert/delete operations.
+        When the number of entries is known up front, with_capacity(),
+        from_items() and update() size the table once and insert without
+        any intermediate resizing.
     """
     def __init__(self, init_cap=10):
-        self.table = [None] * init_cap
+        self.init_cap = max(init_cap, 1)
+        self.table = [None] * self.init_cap
         self.count = 0
 
+    @classmethod
+    def with_capacity(cls, capacity):
+        """Create a table with enough buckets for capacity entries."""
+        return cls(max(capacity, 1))
+
+    @classmethod
+    def from_items(cls, items):
+        """Build a table from an iterable of (key, value) pairs."""
+        items = items if hasattr(items, '__len__') else list(items)
+        table = cls.with_capacity(len(items))
+        table.update(items)
+        return table
+
     def analyze(func):
         # Decorator function (closure) to wrap the insert(), remove(), and
         # clear() methods, so as to subsequently recalculate the table's load
         # factor and resize the table as necessary to maintain average O(1)
-        # complexity.
+        # complexity.  The table only grows after an insertion and only
+        # shrinks after a removal, so a presized table is not halved by
+        # its first insertions.
         @wraps(func)
         def func_wrapper(inst, *args, **kwargs):
+            count = inst.count
             ret = func(inst, *args, **kwargs)
-            lf = inst._load_factor()
-            if lf > 1:
-                inst._resize(2)
-            elif lf < 0.25:
-                inst._resize(0.5)
+            if inst.count > count:
+                if inst.count > len(inst.table):
+                    inst._resize(2)
+            elif inst.count < count:
+                if inst.count * 4 < len(inst.table):
+                    inst._resize(0.5)
             return ret
         return func_wrapper
 
@@ -48,26 +95,54 @@ class ChainingHashTable:
     def __delitem__(self, key):
         self.remove(key)
 
-    @analyze
+    def __iter__(self):
+        return self._iter_entries('keys')
+
     def clear(self):
-        self.table.clear()
+        self.table = [None] * self.init_cap
         self.count = 0
 
+    def update(self, items):
+        """
+        Insert every (key, value) pair, resizing at most once up front
+        instead of checking the load factor after each insertion.
+        """
+        items = items if hasattr(items, '__len__') else list(items)
+        needed = self.count + len(items)
+        if needed > len(self.table):
+            self._resize(needed / len(self.table))
+        for key, val in items:
+            self._insert(key, val)
+        if self.count > len(self.table):
+            self._resize(2)
+
     def has_key(self, key):
-        return self.search(key) is not None
+        return key in self
 
     def keys(self):
-        return [node.key for node in self._gen_nodes()]
+        return TableView(self, 'keys')
 
     def values(self):
-        return [node.val for node in self._gen_nodes()]
+        return TableView(self, 'values')
 
     def items(self):
-        return [(node.key, node.val) for node in self._gen_nodes()]
+        return TableView(self, 'items')
 
-    def __contains__(self, item):
-        node = self.search(hash(item))
-        return node is not None and node is item
+    def __contains__(self, key):
+        try:
+            self.search(key)
+        except KeyError:
+            return False
+        return True
+
+    def _iter_entries(self, kind):
+        for node in self._gen_nodes():
+            if kind == 'keys':
+                yield node.key
+            elif kind == 'values':
+                yield node.val
+            else:
+                yield (node.key, node.val)
 
     def _gen_nodes(self):
         for node in self.table:
@@ -80,28 +155,20 @@ class ChainingHashTable:
         return self.count / len(self.table)
 
     def _resize(self, factor):
+        # Bucket order within a chain is irrelevant, so moved nodes are
+        # pushed onto the head of their new chain in O(1).
         new_table = [None] * max(ceil(len(self.table) * factor), 1)
+        new_len = len(new_table)
         for node_to_move in self.table:
             while node_to_move:
                 suc_node_to_move = node_to_move.next
-                node_to_move.next = None
-                bucket_idx = hash(node_to_move.key) % len(new_table)
-                cur_node = new_table[bucket_idx]
-                
-                if cur_node is None:
-                    new_table[bucket_idx] = node_to_move
-                else:
-                    while True:
-                        if not cur_node.next:
-                            break
-                        else:
-                            cur_node = cur_node.next
-                    cur_node.next = node_to_move
+                bucket_idx = hash(node_to_move.key) % new_len
+                node_to_move.next = new_table[bucket_idx]
+                new_table[bucket_idx] = node_to_move
                 node_to_move = suc_node_to_move
         self.table = new_table
 
-    @analyze
-    def insert(self, key, val):
+    def _insert(self, key, val):
         bucket_idx = hash(key) % len(self.table)
         cur_node = self.table[bucket_idx]
         
@@ -121,6 +188,10 @@ class ChainingHashTable:
         cur_node.next = ListNode(key, val)
         self.count += 1
 
+    @analyze
+    def insert(self, key, val):
+        self._insert(key, val)
+
     def search(self, key):
         bucket_idx = hash(key) % len(self.table)
         cur_node = self.table[bucket_idx]
@@ -152,7 +223,397 @@ class ChainingHashTable:
                 else:
                     pred_node.next = cur_node.next
                 self.count -= 1
+                return
 
             if not cur_node.next:
                 return
             pred_node, cur_node = cur_node, cur_node.next
+
+class _Empty:
+    def __repr__(self):
+        return '<empty>'
+
+_EMPTY = _Empty()
+
+class OpenAddressingHashTable:
+    """
+        An open addressing hash table with Robin Hood linear probing, with
+        the same dictionary interface as ChainingHashTable.
+        Keys and values are kept in parallel, contiguous lists instead of a
+        ListNode object per entry, so a lookup is a short probe over adjacent
+        slots rather than a walk over a chain of heap-allocated nodes.
+        Each slot also stores its probe distance (how far it sits from the
+        slot its key hashes to).  On insert, an entry that is further from
+        its home slot takes the place of a closer one ("robs from the rich"),
+        which keeps probe sequences short even at high load factors, and
+        lets a search stop as soon as it passes entries closer to home than
+        itself.  Removal shifts the following entries back one slot, so no
+        tombstones are needed.
+        The capacity is a power of two, doubled above a 0.8 load factor and
+        halved below 0.2.  As with ChainingHashTable, with_capacity(),
+        from_items() and update() size the table once for bulk insertion.
+    """
+    MAX_LOAD = 0.8
+    MIN_LOAD = 0.2
+
+    def __init__(self, init_cap=8):
+        cap = 8
+        while cap < init_cap:
+            cap *= 2
+        self.init_cap = cap
+        self._allocate(cap)
+        self.count = 0
+
+    @classmethod
+    def with_capacity(cls, capacity):
+        """Create a table that holds capacity entries without resizing."""
+        return cls(int(capacity / cls.MAX_LOAD) + 1)
+
+    @classmethod
+    def from_items(cls, items):
+        """Build a table from an iterable of (key, value) pairs."""
+        items = items if hasattr(items, '__len__') else list(items)
+        table = cls.with_capacity(len(items))
+        table.update(items)
+        return table
+
+    def _allocate(self, cap):
+        self.slot_keys = [_EMPTY] * cap
+        self.slot_vals = [None] * cap
+        self.slot_dists = [0] * cap
+        self.mask = cap - 1
+        self.grow_at = int(cap * OpenAddressingHashTable.MAX_LOAD)
+        self.shrink_at = int(cap * OpenAddressingHashTable.MIN_LOAD) if cap > self.init_cap else -1
+
+    def __setitem__(self, key, item):
+        self.insert(key, item)
+
+    def __len__(self):
+        return self.count
+
+    def __delitem__(self, key):
+        self.remove(key)
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __iter__(self):
+        return self._iter_entries('keys')
+
+    def clear(self):
+        self._allocate(self.init_cap)
+        self.count = 0
+
+    def update(self, items):
+        """
+        Insert every (key, value) pair, growing the table at most once up
+        front instead of checking the load factor after each insertion.
+        """
+        items = items if hasattr(items, '__len__') else list(items)
+        cap = len(self.slot_keys)
+        while self.count + len(items) > int(cap * OpenAddressingHashTable.MAX_LOAD):
+            cap *= 2
+        if cap != len(self.slot_keys):
+            self._resize(cap)
+        for key, val in items:
+            self._insert(key, val)
+
+    def has_key(self, key):
+        return self._find(key) >= 0
+
+    def keys(self):
+        return TableView(self, 'keys')
+
+    def values(self):
+        return TableView(self, 'values')
+
+    def items(self):
+        return TableView(self, 'items')
+
+    def _iter_entries(self, kind):
+        keys = self.slot_keys
+        vals = self.slot_vals
+        for idx in range(len(keys)):
+            key = keys[idx]
+            if key is _EMPTY:
+                continue
+            if kind == 'keys':
+                yield key
+            elif kind == 'values':
+                yield vals[idx]
+            else:
+                yield (key, vals[idx])
+
+    def _load_factor(self):
+        return self.count / len(self.slot_keys)
+
+    def _resize(self, cap):
+        old_items = list(self.items())
+        self._allocate(cap)
+        self.count = 0
+        for key, val in old_items:
+            self._insert(key, val)
+
+    def _find(self, key):
+        """Return the slot index holding key, or -1."""
+        mask = self.mask
+        keys = self.slot_keys
+        dists = self.slot_dists
+        idx = hash(key) & mask
+        dist = 0
+        while True:
+            slot_key = keys[idx]
+            if slot_key is _EMPTY or dists[idx] < dist:
+                return -1
+            if slot_key == key:
+                return idx
+            idx = (idx + 1) & mask
+            dist += 1
+
+    def _insert(self, key, val):
+        mask = self.mask
+        keys = self.slot_keys
+        vals = self.slot_vals
+        dists = self.slot_dists
+        idx = hash(key) & mask
+        dist = 0
+        while True:
+            slot_key = keys[idx]
+            if slot_key is _EMPTY:
+                keys[idx], vals[idx], dists[idx] = key, val, dist
+                self.count += 1
+                return
+            if slot_key == key:
+                vals[idx] = val
+                return
+            if dists[idx] < dist:
+                # Robin Hood: the resident entry is closer to its home slot,
+                # so it is displaced and carried forward instead.
+                keys[idx], key = key, slot_key
+                vals[idx], val = val, vals[idx]
+                dists[idx], dist = dist, dists[idx]
+                # The displaced key is known to be absent further along.
+                idx = (idx + 1) & mask
+                dist += 1
+                while keys[idx] is not _EMPTY:
+                    if dists[idx] < dist:
+                        keys[idx], key = key, keys[idx]
+                        vals[idx], val = val, vals[idx]
+                        dists[idx], dist = dist, dists[idx]
+                    idx = (idx + 1) & mask
+                    dist += 1
+                keys[idx], vals[idx], dists[idx] = key, val, dist
+                self.count += 1
+                return
+            idx = (idx + 1) & mask
+            dist += 1
+
+    def insert(self, key, val):
+        self._insert(key, val)
+        if self.count > self.grow_at:
+            self._resize(len(self.slot_keys) * 2)
+
+    def search(self, key):
+        # The probe loop of _find() is repeated here, as search is by far the
+        # most frequent operation.
+        keys = self.slot_keys
+        idx = hash(key) & self.mask
+        slot_key = keys[idx]
+        if slot_key == key and slot_key is not _EMPTY:
+            return self.slot_vals[idx]
+        mask = self.mask
+        dists = self.slot_dists
+        dist = 0
+        while True:
+            if slot_key is _EMPTY or dists[idx] < dist:
+                raise KeyError(key)
+            if slot_key == key:
+                return self.slot_vals[idx]
+            idx = (idx + 1) & mask
+            dist += 1
+            slot_key = keys[idx]
+
+    __getitem__ = search
+
+    def remove(self, key):
+        idx = self._find(key)
+        if idx < 0:
+            return
+        mask = self.mask
+        keys = self.slot_keys
+        vals = self.slot_vals
+        dists = self.slot_dists
+        # Backward shift deletion: pull every following displaced entry one
+        # slot closer to home until an empty or home-positioned slot.
+        nxt = (idx + 1) & mask
+        while keys[nxt] is not _EMPTY and dists[nxt] > 0:
+            keys[idx], vals[idx], dists[idx] = keys[nxt], vals[nxt], dists[nxt] - 1
+            idx, nxt = nxt, (nxt + 1) & mask
+        keys[idx], vals[idx], dists[idx] = _EMPTY, None, 0
+        self.count -= 1
+        if self.count < self.shrink_at:
+            self._resize(len(self.slot_keys) // 2)
+
+class DirectAddressTable:
+    """
+        A direct-addressed table for small, dense integer keys, such as
+        package ids 1..n or a contiguous block of location ids.  The key range
+        [lo, lo + len(slots)) is mapped onto a flat list of values, and an
+        occupancy bitmap (one bit per key) records which keys are present,
+        so every operation is a subtraction and an index with no hashing,
+        probing or chain walking.  Inserting a key outside of the current
+        range extends the range to cover it, at least doubling it.
+        Implements the same dictionary interface as ChainingHashTable.
+    """
+    def __init__(self, lo=0, size=0):
+        self.lo = lo
+        self.slots = [None] * size
+        self.bitmap = bytearray((size + 7) // 8)
+        self.count = 0
+
+    @classmethod
+    def with_capacity(cls, capacity, lo=0):
+        return cls(lo, capacity)
+
+    @classmethod
+    def from_items(cls, items):
+        items = items if hasattr(items, '__len__') else list(items)
+        if not items:
+            return cls()
+        keys = [key for key, _ in items]
+        table = cls(min(keys), max(keys) - min(keys) + 1)
+        table.update(items)
+        return table
+
+    def __setitem__(self, key, item):
+        self.insert(key, item)
+
+    def __len__(self):
+        return self.count
+
+    def __delitem__(self, key):
+        self.remove(key)
+
+    def __contains__(self, key):
+        if type(key) is not int:
+            return False
+        i = key - self.lo
+        return 0 <= i < len(self.slots) and self.bitmap[i >> 3] >> (i & 7) & 1 == 1
+
+    def __iter__(self):
+        return self._iter_entries('keys')
+
+    def clear(self):
+        self.slots = []
+        self.bitmap = bytearray()
+        self.count = 0
+
+    def has_key(self, key):
+        return key in self
+
+    def keys(self):
+        return TableView(self, 'keys')
+
+    def values(self):
+        return TableView(self, 'values')
+
+    def items(self):
+        return TableView(self, 'items')
+
+    def update(self, items):
+        items = items if hasattr(items, '__len__') else list(items)
+        if items:
+            keys = [key for key, _ in items]
+            self._extend(min(keys), max(keys))
+        for key, val in items:
+            self.insert(key, val)
+
+    def _iter_entries(self, kind):
+        bitmap = self.bitmap
+        slots = self.slots
+        for i in range(len(slots)):
+            if bitmap[i >> 3] >> (i & 7) & 1:
+                if kind == 'keys':
+                    yield self.lo + i
+                elif kind == 'values':
+                    yield slots[i]
+                else:
+                    yield (self.lo + i, slots[i])
+
+    def _extend(self, lo, hi):
+        """
+        Grow the key range to cover [lo, hi].  The range at least doubles
+        in each direction it grows, so inserting keys one at a time beyond
+        the range is amortized O(1), and the existing slots and bitmap are
+        copied into the new ones at an offset.  The low end moves by whole
+        bytes of the bitmap, so its bits keep their places within a byte.
+        """
+        if not self.slots:
+            self.lo = lo
+            self.slots = [None] * (hi - lo + 1)
+            self.bitmap = bytearray((hi - lo + 8) // 8)
+            return
+        size = len(self.slots)
+        old_hi = self.lo + size - 1
+        if lo >= self.lo and hi <= old_hi:
+            return
+        below = above = 0
+        if lo < self.lo:
+            below = max(self.lo - lo, size)
+            below += -below % 8
+        if hi > old_hi:
+            above = max(hi - old_hi, size)
+        self.lo -= below
+        self.slots = [None] * below + self.slots + [None] * above
+        bitmap = bytearray(below // 8) + self.bitmap
+        bitmap.extend(bytes((len(self.slots) + 7) // 8 - len(bitmap)))
+        self.bitmap = bitmap
+
+    def insert(self, key, val):
+        if type(key) is not int:
+            raise TypeError('DirectAddressTable keys must be integers: %r' % (key,))
+        i = key - self.lo
+        if not 0 <= i < len(self.slots):
+            self._extend(key, key)
+            i = key - self.lo
+        bit = 1 << (i & 7)
+        if not self.bitmap[i >> 3] & bit:
+            self.bitmap[i >> 3] |= bit
+            self.count += 1
+        self.slots[i] = val
+
+    def search(self, key):
+        if type(key) is int:
+            i = key - self.lo
+            if 0 <= i < len(self.slots) and self.bitmap[i >> 3] >> (i & 7) & 1:
+                return self.slots[i]
+        raise KeyError(key)
+
+    __getitem__ = search
+
+    def remove(self, key):
+        if key in self:
+            i = key - self.lo
+            self.bitmap[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+            self.slots[i] = None
+            self.count -= 1
+
+# Integer keys spanning at most this many times their count are stored in a
+# DirectAddressTable by build_table().
+DENSE_KEY_SPAN = 2
+
+def build_table(items, table_type=None):
+    """
+    Build a table from (key, value) pairs.  Without an explicit table_type,
+    a DirectAddressTable is chosen when the keys are integers dense enough
+    that a flat array is at most DENSE_KEY_SPAN times larger than needed,
+    and a ChainingHashTable otherwise.
+    """
+    items = items if hasattr(items, '__len__') else list(items)
+    if table_type is None:
+        table_type = ChainingHashTable
+        keys = [key for key, _ in items]
+        if keys and all(type(key) is int for key in keys):
+            if max(keys) - min(keys) + 1 <= DENSE_KEY_SPAN * len(keys):
+                table_type = DirectAddressTable
+    return table_type.from_items(items)
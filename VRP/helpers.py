@@ -1,5 +1,10 @@
 import heapq
 
+try:
+    import numpy as np
+except:
+    np = None
+
 def compile_neighbor(solution, swaps):
     """
     <swaps> parameter is in form of [(swap_index, new_route),] sorted ascending
@@ -17,11 +22,11 @@ def compile_neighbor(solution, swaps):
 
     return new_solution
 
-def print_progress_bar(cur_iter, expected_iter, decimals = 1, length = 100, fill = '█', printEnd = "\r"):
+def print_progress_bar(cur_iter, expected_iter, decimals = 1, length = 100, fill = '█', printEnd = "\r", suffix = ''):
     percent = ("{0:." + str(decimals) + "f}").format(100 * (cur_iter / float(expected_iter)))
     filledLength = int(length * cur_iter // expected_iter)
     bar = fill * filledLength + '-' * (length - filledLength)
-    print(f'\r |{bar}| {percent}%', end = printEnd)
+    print(f'\r |{bar}| {percent}% {suffix}', end = printEnd)
     if cur_iter == expected_iter: 
         print()
 
@@ -44,4 +49,17 @@ def dijkstra(adj_list, mapping, start):
                 dists[i] = distance
                 parents[i] = cur_node
                 heapq.heappush(pq, (distance, i))
-    return dists
\ No newline at end of file
+    return dists
+
+def floyd_warshall(matrix):
+    """
+    All-pairs shortest paths over a dense distance matrix.  Each pass relaxes
+    every pair through intermediate node k as a single vectorized min-plus
+    update, so the Θ(V^3) work runs in NumPy rather than the interpreter.
+    """
+    if np is None:
+        raise ImportError('Must install numpy to run floyd_warshall.')
+    dists = np.array(matrix, dtype=np.float64)
+    for k in range(len(dists)):
+        np.minimum(dists, dists[:, k, None] + dists[None, k, :], out=dists)
+    return dists
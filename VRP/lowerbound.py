@@ -0,0 +1,152 @@
+from math import ceil
+
+class LowerBound:
+    """
+    Lower bounds on the total miles of any feasible solution, used to report
+    the optimality gap of a solution and to stop the search once the gap is
+    small enough.
+    Every solution is a set of closed trips from the depot, and since no more
+    than truck_capacity packages can be loaded per trip, at least
+    m = ceil(n / truck_capacity) trips are needed.  Two relaxations of this
+    structure are computed:
+    - The degree bound, where every package is entered and left once through
+      its cheapest edges and the depot is entered and left once per trip.
+    - The m-tree bound, where removing one depot edge from every trip leaves
+      a spanning tree, so a minimum spanning tree plus the m cheapest depot
+      edges bounds the cost.  The m-tree bound is tightened with Lagrangian
+      penalties on the package degrees (the Held-Karp bound for the TSP).
+    The distances are symmetrized with min(d(i, j), d(j, i)), so both bounds
+    remain valid for asymmetric distance tables.  <distance>(a, b) optionally
+    replaces the distance table of the locations, for instances whose table
+    holds more than travel distances.
+    """
+    def __init__(self, depot_location, packages, truck_capacity, iterations=100, upper_bound=None, distance=None):
+        self.packages = list(packages)
+        self.n = len(self.packages)
+        self.trips = ceil(self.n / truck_capacity) if self.n else 0
+
+        locs = [depot_location] + [p.delivery_location for p in self.packages]
+        if distance is None:
+            self.costs = [
+                [min(a.distances[b.id], b.distances[a.id]) for b in locs]
+                for a in locs
+            ]
+        else:
+            self.costs = [[min(distance(a, b), distance(b, a)) for b in locs] for a in locs]
+
+        self.degree_bound = self._degree_bound()
+        self.tree_bound = self._tree_bound(iterations, upper_bound)
+        self.value = max(self.degree_bound, self.tree_bound)
+
+    def __float__(self):
+        return float(self.value)
+
+    def __repr__(self):
+        return f"<LowerBound: {round(self.value, 1)}>"
+
+    def gap(self, cost):
+        """Relative gap between a solution cost and the lower bound."""
+        if cost <= 0:
+            return 0.0
+        return max(cost - self.value, 0.0) / cost
+
+    def _degree_bound(self):
+        """
+        Every package has two incident edges (or the same depot edge twice
+        for a trip with a single package) and the depot has two incident
+        edges per trip, where each package edge can be used at most twice.
+        Each edge is counted from both of its ends, so the sum is halved.
+        Θ(n^2)
+        """
+        if self.n == 0:
+            return 0.0
+        c = self.costs
+        total = 0.0
+        for v in range(1, self.n + 1):
+            incident = sorted(c[v][u] for u in range(self.n + 1) if u != v)
+            total += min(incident[0] + incident[1] if len(incident) > 1 else float('inf'), 2 * c[0][v])
+        depot_edges = sorted(c[0][1:] * 2)
+        total += sum(depot_edges[:2 * self.trips])
+        return total / 2
+
+    def _m_tree(self, pi):
+        """
+        Compute the minimum m-tree under the penalized costs
+        c(i, j) + pi[i] + pi[j] with Prim's algorithm.  Depot edges beyond
+        the required m trips are added while their penalized cost is
+        negative, since a solution may use more trips than the minimum.
+        Returns the penalized cost and the degree of every node.
+        Θ(n^2)
+        """
+        c = self.costs
+        size = self.n + 1
+        inf = float('inf')
+        in_tree = [False] * size
+        best = [inf] * size
+        parent = [-1] * size
+        degrees = [0] * size
+        best[0] = 0.0
+        total = 0.0
+        for _ in range(size):
+            v = -1
+            for u in range(size):
+                if not in_tree[u] and (v < 0 or best[u] < best[v]):
+                    v = u
+            in_tree[v] = True
+            total += best[v]
+            if parent[v] >= 0:
+                degrees[v] += 1
+                degrees[parent[v]] += 1
+            row = c[v]
+            pv = pi[v]
+            for u in range(size):
+                if not in_tree[u]:
+                    w = row[u] + pv + pi[u]
+                    if w < best[u]:
+                        best[u] = w
+                        parent[u] = v
+
+        depot_edges = sorted((c[0][v] + pi[v], v) for v in range(1, size))
+        for k, (w, v) in enumerate(depot_edges):
+            if k >= self.trips and w >= 0:
+                break
+            total += w
+            degrees[0] += 1
+            degrees[v] += 1
+        return total, degrees
+
+    def _tree_bound(self, iterations, upper_bound):
+        """
+        Subgradient optimization of the Lagrangian m-tree bound.  Penalties
+        are raised on packages with more than two incident edges and lowered
+        on leaves, using the Polyak step size towards upper_bound.
+        """
+        if self.n == 0:
+            return 0.0
+        if upper_bound is None:
+            upper_bound = 2 * self.degree_bound
+        pi = [0.0] * (self.n + 1)
+        best = 0.0
+        step_scale = 2.0
+        stale = 0
+        for _ in range(iterations):
+            cost, degrees = self._m_tree(pi)
+            value = cost - 2 * sum(pi)
+            if value > best + 1e-9:
+                best = value
+                stale = 0
+            else:
+                stale += 1
+                if stale >= 10:
+                    step_scale /= 2
+                    stale = 0
+            subgradient = [0] + [degrees[v] - 2 for v in range(1, self.n + 1)]
+            norm = sum(g * g for g in subgradient)
+            if norm == 0:
+                # The m-tree is a set of trips, so the bound is tight.
+                break
+            step = step_scale * max(upper_bound - value, 0.0) / norm
+            if step <= 1e-9:
+                break
+            pi = [pi[v] + step * subgradient[v] for v in range(self.n + 1)]
+        return best
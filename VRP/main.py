@@ -1,5 +1,6 @@
 from deliverysimulator import DeliverySimulator, Constraint
-from optimization import two_opt, iterative_stochastic_optimization
+from optimization import two_opt, held_karp, iterative_stochastic_optimization
+from lowerbound import LowerBound
 from datetime import datetime, date
 import logging
 
@@ -11,7 +12,7 @@ def show_package_statuses(cur_time, simulator):
         ans = input()
         if ans == 'y':
             cur_time = datetime.strptime(cur_time, "%I:%M %p").time()
-            simulator.lookup_status(datetime.combine(today, cur_time), range(1,41))
+            simulator.lookup_status(datetime.combine(today, cur_time))
             exit_input = 1
         elif ans == 'c':
             while True:
@@ -23,7 +24,7 @@ def show_package_statuses(cur_time, simulator):
                     custom_time = datetime.strptime(ans, "%I:%M %p").time()
                 except:
                     continue
-                simulator.lookup_status(datetime.combine(today, custom_time), range(1,41))
+                simulator.lookup_status(datetime.combine(today, custom_time))
                 exit_input = 1
                 break
         elif ans == 'n':
@@ -32,18 +33,23 @@ def show_package_statuses(cur_time, simulator):
 def main():
     today = date.today()
     # Construct main delivery simulator object, from which all function and
-    # optimization occurs.
-    simulator = DeliverySimulator(999, 2, 18, 16, datetime(today.year, today.month, today.day, hour=8), '../data/')
+    # optimization occurs.  The corrected address of package 9 becomes
+    # known during the day, as noted in the package manifest, and is read
+    # from the instance's address_changes.csv.
+    simulator = DeliverySimulator(
+        999, 2, 18, 16, datetime(today.year, today.month, today.day, hour=8), '../data/'
+    )
     
-    # Evaluate cost of initial, naive solution.
+    # Evaluate cost of the initial, constructed solution.
     sol = simulator.current_solution()
     feas, cost = simulator.test_eval(sol)
     print(f"Initial routing solution requires {round(cost,1)} total miles.\n")
 
     # Perform local optimization of the initial solution using a 2-opt
-    # greedy strategy.
+    # greedy strategy, then sequence each load segment exactly.
     print("Performing greedy local optimization...")
     sol = two_opt(sol, simulator.test_eval)
+    sol = held_karp(sol, simulator.test_eval)
     feas, cost = simulator.test_eval(sol)
     print('Done!')
     print(f"Locally optimal routing solution requires {round(cost,1)} total miles.\n")
@@ -53,8 +59,13 @@ def main():
 
     # Perform further optimization through probabilistic simulated annealing
     # technique.
+    # A lower bound on the total miles lets the optimizer report how far
+    # from optimal the current solution can be, and stop once it is close.
+    lower_bound = LowerBound(simulator.depot_location, simulator.depot.packages, simulator.constants.truck_capacity, upper_bound=cost)
+    print(f"Lower bound on total miles is {round(lower_bound.value,1)} (gap {round(100*lower_bound.gap(cost),1)}%).\n")
+
     print("Performing stochastic optimization through simulated annealing...")
-    best_sol = iterative_stochastic_optimization(sol, simulator.test_eval, 1, 20)
+    best_sol = iterative_stochastic_optimization(sol, simulator.test_eval, 1, 20, lower_bound, gap_threshold=0.01)
 
     # As outlined in the SimulatedAnnealing and NeighborhoodOperator classes,
     # heuristic techniques are applied via random step changes to the current
@@ -0,0 +1,250 @@
+from deliverysimulator import DeliverySimulator
+from depotstop import DepotStop
+from helpers import compile_neighbor
+from neighborhoodoperators import NeighborhoodOperators
+from package import Package
+from perturbations import Perturbations
+from robustness import RobustnessEvaluator
+from route import Route
+from simulatedannealing import SimulatedAnnealing
+from collections import namedtuple
+import argparse
+import gc
+import inspect
+import json
+import linecache
+import random
+import tracemalloc
+
+MemoryStats = namedtuple('MemoryStats', ['step', 'temperature', 'traced', 'peak', 'labels', 'routes', 'depot_stops', 'packages', 'solutions'])
+
+# Allocations are labelled by the functions on their traceback: an operator
+# frame labels an allocation as that operator's, then the innermost helper
+# neighbors are built with, then the innermost evaluator stage, and last the
+# search loop.
+OPERATOR_FUNCTIONS = [
+    NeighborhoodOperators.local_swap,
+    NeighborhoodOperators.local_flip,
+    NeighborhoodOperators.local_insertion,
+    NeighborhoodOperators.nonlocal_insertion,
+    NeighborhoodOperators.nonlocal_swap,
+    NeighborhoodOperators.local_add_hub,
+    NeighborhoodOperators.local_remove_hub,
+    NeighborhoodOperators.local_move_hub,
+    NeighborhoodOperators.local_add_pause,
+    NeighborhoodOperators.local_remove_pause,
+    NeighborhoodOperators.local_three_opt,
+    Perturbations.double_bridge
+]
+NEIGHBOR_FUNCTIONS = [
+    compile_neighbor,
+    Route.opt_copy_packages,
+    Route.opt_copy_depot_stops
+]
+STAGE_FUNCTIONS = [
+    DeliverySimulator.test_eval,
+    DeliverySimulator.validate_constraint,
+    DeliverySimulator.eval,
+    Route.gen_steps,
+    RobustnessEvaluator.evaluate
+]
+SEARCH_FUNCTIONS = [
+    SimulatedAnnealing.run
+]
+
+def _function_spans(functions, prefix):
+    spans = []
+    for function in functions:
+        lines, first = inspect.getsourcelines(function)
+        spans.append((function.__code__.co_filename, first, first + len(lines) - 1, prefix + function.__name__))
+    return spans
+
+class MemoryProfiler:
+    """
+    An opt-in memory profile of a SimulatedAnnealing search, given to it as
+    memory_profiler.  tracemalloc traces every allocation from the start of
+    the run, at a large cost in speed, and every interval temperature steps
+    a snapshot records:
+    - The traced memory, and the peak traced since the last snapshot.
+    - The live memory by label: the operator that allocated it, or the
+      helper that copied routes for a neighbor, the evaluator stage
+      (test_eval, validate_constraint, eval, gen_steps or the robustness
+      evaluation), or the search loop itself.  Memory allocated elsewhere
+      is labelled other.
+    - The resident Route, DepotStop and Package objects, and the lists of
+      Routes, that is solutions, found by the garbage collector.  These
+      include unreachable cycles not yet collected.
+    Snapshots hold the memory still live at the boundary, so they show what
+    searches retain rather than what each iteration allocates and frees.
+    """
+    def __init__(self, interval=10, frames=16, top=10):
+        self.interval = interval
+        self.frames = frames
+        self.top = top
+        self.steps = 0
+        self.records = []
+        self.first = None
+        self.last = None
+        self._started_tracing = False
+        self._labels = {}
+        self._spans = {}
+        for functions, prefix in ((OPERATOR_FUNCTIONS, 'operator/'), (NEIGHBOR_FUNCTIONS, 'neighbor/'), (STAGE_FUNCTIONS, 'evaluate/'), (SEARCH_FUNCTIONS, 'search/')):
+            for filename, first, last, label in _function_spans(functions, prefix):
+                self._spans.setdefault(filename, []).append((first, last, label))
+        self._excluded = {tracemalloc.__file__, __file__, linecache.__file__, '<frozen importlib._bootstrap>', '<unknown>'}
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        self.snapshot(None)
+
+    def stop(self):
+        self.snapshot(None)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def temperature_done(self, temperature):
+        self.steps += 1
+        if self.steps % self.interval == 0:
+            self.snapshot(temperature)
+
+    def _label(self, traceback):
+        label = self._labels.get(traceback)
+        if label is None:
+            operator = neighbor = stage = None
+            # Frames run from the oldest to the most recent.
+            for frame in reversed(traceback):
+                for first, last, name in self._spans.get(frame.filename, ()):
+                    if first <= frame.lineno <= last:
+                        if name.startswith('operator/'):
+                            operator = name
+                        elif name.startswith('neighbor/'):
+                            neighbor = neighbor or name
+                        else:
+                            stage = stage or name
+            label = operator or neighbor or stage or 'other'
+            # Allocations of the profiler and of tracemalloc are left out.
+            if traceback[-1].filename in self._excluded:
+                label = ''
+            self._labels[traceback] = label
+        return label
+
+    def snapshot(self, temperature):
+        """Record the memory live now, and the peak since the last snapshot."""
+        if not tracemalloc.is_tracing():
+            return
+        traced, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        labels = {}
+        for stat in snapshot.statistics('traceback'):
+            label = self._label(stat.traceback)
+            if not label:
+                continue
+            size, count = labels.get(label, (0, 0))
+            labels[label] = size + stat.size, count + stat.count
+
+        routes = depot_stops = packages = solutions = 0
+        for obj in gc.get_objects():
+            kind = type(obj)
+            if kind is Route:
+                routes += 1
+            elif kind is DepotStop:
+                depot_stops += 1
+            elif kind is Package:
+                packages += 1
+            elif kind is list and obj and type(obj[0]) is Route:
+                solutions += 1
+        del obj
+
+        self.records.append(MemoryStats(self.steps, temperature, traced, peak, labels, routes, depot_stops, packages, solutions))
+        if self.first is None:
+            self.first = snapshot
+        self.last = snapshot
+        tracemalloc.reset_peak()
+
+    def summary(self):
+        """Return the profile as a JSON-serializable dict."""
+        if not self.records:
+            return {'snapshots': []}
+        peak = max(self.records, key=lambda stats: stats.peak)
+        most = max(self.records, key=lambda stats: stats.routes)
+        first, last = self.records[0], self.records[-1]
+        growth = {
+            label: last.labels.get(label, (0, 0))[0] - first.labels.get(label, (0, 0))[0]
+            for label in set(first.labels) | set(last.labels)
+        }
+        lines = []
+        filters = [tracemalloc.Filter(False, filename) for filename in self._excluded]
+        for stat in self.last.filter_traces(filters).compare_to(self.first.filter_traces(filters), 'lineno')[:self.top]:
+            frame = stat.traceback[0]
+            lines.append({'line': '%s:%d' % (frame.filename, frame.lineno), 'size': stat.size, 'size_diff': stat.size_diff, 'count_diff': stat.count_diff})
+        return {
+            'peak_traced': peak.peak,
+            'peak_step': peak.step,
+            'peak_routes': most.routes,
+            'peak_solutions': max(stats.solutions for stats in self.records),
+            'peak_routes_step': most.step,
+            'growth_by_label': dict(sorted(growth.items(), key=lambda item: -item[1])),
+            'top_growth_lines': lines,
+            'snapshots': [
+                dict(stats._asdict(), labels={label: {'size': size, 'count': count} for label, (size, count) in stats.labels.items()})
+                for stats in self.records
+            ]
+        }
+
+    def print_report(self):
+        summary = self.summary()
+        if not self.records:
+            print('No snapshots taken.')
+            return
+        print('Peak traced memory %.1f KiB at step %d' % (summary['peak_traced'] / 1024, summary['peak_step']))
+        print('Peak resident routes %d (at step %d), solutions %d' % (summary['peak_routes'], summary['peak_routes_step'], summary['peak_solutions']))
+        print('%-36s %12s %12s' % ('label', 'live KiB', 'growth KiB'))
+        last = self.records[-1]
+        for label, growth in summary['growth_by_label'].items():
+            print('%-36s %12.1f %12.1f' % (label, last.labels.get(label, (0, 0))[0] / 1024, growth / 1024))
+        print('Largest growth by line:')
+        for line in summary['top_growth_lines']:
+            print('  %-60s %+10.1f KiB %+8d blocks' % (line['line'], line['size_diff'] / 1024, line['count_diff']))
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+def main():
+    # Imported here, as parallel imports the simulator lazily too.
+    from parallel import instance_simulator, ADDRESS_CHANGES_HELP
+
+    parser = argparse.ArgumentParser(description='Profile the memory of a simulated annealing run on an instance.')
+    parser.add_argument('--data-dir', default='../data/')
+    parser.add_argument('--address-changes', type=json.loads, help=ADDRESS_CHANGES_HELP)
+    parser.add_argument('--construction', default='savings')
+    parser.add_argument('--time-limit', type=float, default=60)
+    parser.add_argument('--init-temp', type=float, default=1000)
+    parser.add_argument('--final-temp', type=float, default=0.01)
+    parser.add_argument('--iter-per-temp', type=int, default=20)
+    parser.add_argument('--alpha', type=float, default=0.9995)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--interval', type=int, default=10, help='temperature steps between snapshots')
+    parser.add_argument('--frames', type=int, default=16, help='traceback frames stored per allocation')
+    parser.add_argument('-o', '--output', help='write the profile as JSON to this file')
+    args = parser.parse_args()
+
+    simulator, initial = instance_simulator({'data_dir': args.data_dir, 'construction': args.construction, 'address_changes': args.address_changes})
+    trucks = simulator.depot.trucks
+    solution = [Route.decode(trucks[t], simulator.data.package_table, encoded) for t, encoded in enumerate(initial)]
+    random.seed(args.seed)
+    profiler = MemoryProfiler(args.interval, args.frames)
+    sa = SimulatedAnnealing(
+        simulator.test_eval, solution, args.init_temp, args.final_temp, args.iter_per_temp, args.alpha,
+        verbose=False, time_limit=args.time_limit, memory_profiler=profiler
+    )
+    sa.run()
+    profiler.print_report()
+    if args.output:
+        profiler.write_json(args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+from deliverysimulator import DeliverySimulator
+from dataloader import DataLoader
+from hashtable import ChainingHashTable
+from helpers import compile_neighbor, dijkstra
+from neighborhoodoperators import NeighborhoodOperators
+from perturbations import Perturbations
+from datetime import datetime, date
+from math import hypot
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+# Per-call timings are the best of REPEATS measurements, each of enough
+# calls to take at least MIN_SECONDS.
+REPEATS = 7
+MIN_SECONDS = 0.1
+
+OPERATORS = [
+    NeighborhoodOperators.local_swap,
+    NeighborhoodOperators.local_flip,
+    NeighborhoodOperators.local_insertion,
+    NeighborhoodOperators.nonlocal_insertion,
+    NeighborhoodOperators.nonlocal_swap,
+    NeighborhoodOperators.local_add_hub,
+    NeighborhoodOperators.local_remove_hub,
+    NeighborhoodOperators.local_move_hub,
+    NeighborhoodOperators.local_add_pause,
+    NeighborhoodOperators.local_remove_pause,
+    NeighborhoodOperators.local_three_opt,
+    Perturbations.double_bridge
+]
+
+def write_instance(data_dir, n_packages, seed=0):
+    """
+    Write a synthetic instance of n_packages packages in the bundled CSV
+    format: one location per two packages around a depot, road distances of
+    1.3 times the straight-line distance, and a deadline on one package in
+    five.
+    """
+    rng = random.Random(seed)
+    n_locations = max(2, n_packages // 2)
+    ids = [999] + [1000 + i for i in range(n_locations)]
+    coords = {999: (40.7, -111.9)}
+    for location_id in ids[1:]:
+        coords[location_id] = (40.7 + rng.uniform(-0.1, 0.1), -111.9 + rng.uniform(-0.1, 0.1))
+    with open(os.path.join(data_dir, DataLoader.LOCATIONS_FILENAME), 'w') as f:
+        f.write('LocationID,Address,City,State,ZIP,Lat,Lon\n')
+        for location_id in ids:
+            f.write('%d,%d Main St,Salt Lake City,UT,84107,%f,%f\n' % (location_id, location_id, coords[location_id][0], coords[location_id][1]))
+    with open(os.path.join(data_dir, DataLoader.DISTANCES_FILENAME), 'w') as f:
+        f.write(',' + ','.join(str(location_id) for location_id in ids) + '\n')
+        for a in ids:
+            row = [round(hypot(coords[a][0] - coords[b][0], coords[a][1] - coords[b][1]) * 69 * 1.3, 1) for b in ids]
+            f.write('%d,%s\n' % (a, ','.join(str(d) for d in row)))
+    with open(os.path.join(data_dir, DataLoader.PACKAGES_FILENAME), 'w') as f:
+        f.write('PackageID,LocationID,DeliveryDeadline,Mass,SpecialNotes\n')
+        for package_id in range(1, n_packages + 1):
+            deadline = '12:00 PM' if package_id % 5 == 0 else 'EOD'
+            f.write('%d,%d,%s,%d,\n' % (package_id, rng.choice(ids[1:]), deadline, rng.randint(1, 50)))
+
+def per_call(func, *args):
+    """
+    Best per-call time in seconds of func(*args).  As with timeit, garbage
+    collection is paused while timing.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _per_call(func, *args)
+    finally:
+        if enabled:
+            gc.enable()
+
+def _per_call(func, *args):
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func(*args)
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SECONDS:
+            break
+        number *= 2
+    best = elapsed
+    for _ in range(REPEATS - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best / number
+
+def simulator_for(data_dir, n_packages):
+    start = datetime.combine(date.today(), datetime.min.time()).replace(hour=8)
+    return DeliverySimulator(999, max(2, n_packages // 20), 18, 16, start, data_dir, construction='nearest')
+
+def bench_size(n_packages, seed=0):
+    """Time every kernel on a synthetic instance of n_packages packages."""
+    results = {}
+    data_dir = tempfile.mkdtemp(prefix='vrp-microbench-') + os.sep
+    try:
+        write_instance(data_dir, n_packages, seed)
+
+        simulator = simulator_for(data_dir, n_packages)
+        # A cold import reads the CSV files and closes the distances under
+        # shortest paths, and is timed once as it is slow on large
+        # instances.  Later imports read the compiled snapshot.
+        shutil.rmtree(data_dir + DataLoader.CACHE_DIRNAME)
+        start = time.perf_counter()
+        DataLoader(simulator, data_dir).import_data()
+        results['import_data/cold'] = time.perf_counter() - start
+        results['import_data/snapshot'] = per_call(lambda: DataLoader(simulator, data_dir).import_data())
+
+        solution = simulator.current_solution()
+        results['test_eval'] = per_call(simulator.test_eval, solution)
+        results['test_eval/return_early'] = per_call(lambda: simulator.test_eval(solution, return_early=True))
+        results['eval'] = per_call(simulator.eval, solution)
+        results['gen_steps'] = per_call(lambda: [list(route.gen_steps()) for route in solution])
+
+        # Every call of an operator draws the same move from the same random
+        # state, so timings do not vary with the moves drawn.  The cost of
+        # restoring the state is measured alone and subtracted.
+        random.seed(seed)
+        state = random.getstate()
+        restore = per_call(random.setstate, state)
+        for operator in OPERATORS:
+            def call():
+                random.setstate(state)
+                operator(solution)
+            results['operator/%s' % operator.__name__] = max(per_call(call) - restore, 0.0)
+        swaps = [(0, solution[0].opt_copy_packages())]
+        results['compile_neighbor'] = per_call(compile_neighbor, solution, swaps)
+
+        keys = list(range(n_packages * 10))
+        def insert():
+            table = ChainingHashTable()
+            for key in keys:
+                table.insert(key, key)
+            return table
+        table = insert()
+        def search():
+            for key in keys:
+                table.search(key)
+        results['hashtable/insert'] = per_call(insert) / len(keys)
+        results['hashtable/search'] = per_call(search) / len(keys)
+        results['hashtable/resize'] = per_call(lambda: table._resize(1))
+
+        distances = simulator.data.distance_table
+        location_ids = distances.ids
+        index = {location_id: i for i, location_id in enumerate(location_ids)}
+        adj_list = [list(enumerate(distances.values[i])) for i in range(len(location_ids))]
+        results['dijkstra'] = per_call(dijkstra, adj_list, index, location_ids[0])
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return {'%s/n=%d' % (name, n_packages): seconds for name, seconds in results.items()}
+
+def compare(results, baseline, tolerance):
+    """
+    Return (name, baseline seconds, seconds, ratio) of every kernel slower
+    than its baseline by more than tolerance, as a fraction.
+    """
+    regressions = []
+    for name, seconds in sorted(results.items()):
+        before = baseline.get(name)
+        if before and seconds > before * (1 + tolerance):
+            regressions.append((name, before, seconds, seconds / before))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the hot kernels on synthetic instances, and flag regressions against a baseline.')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[40, 200, 1000], help='numbers of packages')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='write the results as a JSON baseline to this file')
+    parser.add_argument('--baseline', help='JSON baseline to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown over the baseline, as a fraction')
+    args = parser.parse_args()
+
+    results = {}
+    for n in args.sizes:
+        results.update(bench_size(n, args.seed))
+    for name, seconds in sorted(results.items()):
+        print('%-45s %12.3f us' % (name, seconds * 1e6))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'results': results
+            }, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for name, before, after, ratio in regressions:
+            print('REGRESSION %s: %.3f us -> %.3f us (%.2fx)' % (name, before * 1e6, after * 1e6, ratio))
+        if regressions:
+            sys.exit(1)
+        print('No regressions beyond %d%% of the baseline.' % round(args.tolerance * 100))
+
+if __name__ == "__main__":
+    main()
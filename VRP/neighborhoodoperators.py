@@ -1,6 +1,7 @@
 from perturbations import Perturbations
 from helpers import compile_neighbor
 import random
+import time
 from copy import copy
 
 class NeighborhoodOperators:
@@ -125,7 +126,7 @@ class NeighborhoodOperators:
         route_idx = random.randint(0, len(solution) - 1)
         new_route = solution[route_idx].opt_copy_depot_stops()
 
-        if len(new_route) < 1:
+        if len(new_route) < 2:
             return None
 
         hub_indices = new_route.get_depot_stop_indices()
@@ -166,6 +167,11 @@ class NeighborhoodOperators:
         """
         route_idx = random.randint(0, len(solution) - 1)
         new_route = solution[route_idx].opt_copy_depot_stops()
+
+        # Short routes, which construction can produce with many trucks,
+        # leave no other index to move a stop to.
+        if len(new_route) < 4:
+            return None
         
         hub_indices = new_route.get_depot_stop_indices()
         if hub_indices:
@@ -303,10 +309,11 @@ class NeighborhoodOperators:
         return compile_neighbor(solution, swaps)
 
     @staticmethod
-    def generate_neighbors(solution):
+    def generate_neighbors(solution, telemetry=None):
         """
         A generator function to yield neighbors to a given solution in
-        random order.
+        random order.  With a Telemetry, every operator call is counted and
+        timed, and the operator of each yielded neighbor is recorded.
         Θ(n)
         """
         ops = [
@@ -325,6 +332,11 @@ class NeighborhoodOperators:
         ]
         random.shuffle(ops)
         for gen in ops:
-            neighbor = gen(solution)
+            if telemetry is None:
+                neighbor = gen(solution)
+            else:
+                start = time.process_time()
+                neighbor = gen(solution)
+                telemetry.operator_called(gen.__name__, time.process_time() - start, neighbor)
             if neighbor:
                 yield neighbor
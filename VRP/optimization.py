@@ -1,7 +1,14 @@
 from neighborhoodoperators import NeighborhoodOperators
 from perturbations import Perturbations
 from simulatedannealing import SimulatedAnnealing
+from datetime import timedelta
 import logging
+import time
+
+try:
+    import numpy as np
+except:
+    np = None
 
 def nearest_neighbor(start_loc, packages):
     cur_loc = start_loc
@@ -22,7 +29,12 @@ def nearest_neighbor(start_loc, packages):
         i += 1
     return new_packages
 
-def two_opt(solution, test_eval):
+def two_opt(solution, test_eval, time_limit=None):
+    """
+    Greedy 2-opt of every route in turn.  After time_limit seconds the
+    routes are returned as improved so far.
+    """
+    started = time.time()
     ret = []
     for route_idx, route in enumerate(solution):
         best = route.opt_copy_packages()
@@ -31,6 +43,9 @@ def two_opt(solution, test_eval):
         while improved:
             improved = False
             for i in range(1, len(route.packages)-2):
+                if time_limit is not None and time.time() - started >= time_limit:
+                    improved = False
+                    break
                 for j in range(i+1, len(route.packages)+1):
                     if j-i == 1: continue # changes nothing
                     new_route = route.opt_copy_packages()
@@ -82,6 +97,178 @@ def three_opt(solution, test_eval):
     assert sum(len(r.packages) for r in solution) == sum(len(r.packages) for r in ret)
     return ret
 
+def held_karp_segment(depot_location, packages, start_time, speed, upper_bound=float('inf')):
+    """
+    Exact sequencing of a single load segment (depot -> packages -> depot)
+    through bitmask dynamic programming.  dp[mask][last] holds the shortest
+    distance that starts at the depot, visits every package in mask, and
+    ends at last.  As no waiting occurs between depot stops, the arrival time
+    at a package is a monotonic function of this distance, so a partial path
+    that misses a delivery deadline can be pruned without losing optimality.
+    The pure-Python kernel also prunes partial paths that can not return to
+    the depot under upper_bound, which is valid since the distance table is
+    metric closed.
+    Returns (order, cost) or (None, inf) when no ordering satisfies the
+    deadlines below the upper bound.
+    Θ(2^n * n^2)
+    """
+    n = len(packages)
+    if n == 0:
+        return [], 0.0
+    locs = [p.delivery_location for p in packages]
+    out = [depot_location.distances[loc.id] for loc in locs]
+    back = [loc.distances[depot_location.id] for loc in locs]
+    dist = [[a.distances[b.id] for b in locs] for a in locs]
+    # Deadlines are converted into the maximum distance that can be driven
+    # from the start of the segment before the package is late.
+    limits = [(p.delivery_deadline - start_time).total_seconds() / 3600 * speed for p in packages]
+
+    if np is not None:
+        return _held_karp_numpy(packages, out, back, dist, limits, upper_bound)
+    inf = float('inf')
+    full = (1 << n) - 1
+    dp = [inf] * ((full + 1) * n)
+    parent = [-1] * ((full + 1) * n)
+    for j in range(n):
+        if out[j] <= limits[j]:
+            dp[(1 << j) * n + j] = out[j]
+
+    for mask in range(1, full):
+        base = mask * n
+        rem = full ^ mask
+        for last in range(n):
+            cost = dp[base + last]
+            if cost == inf or cost + back[last] >= upper_bound:
+                continue
+            row = dist[last]
+            for j in range(n):
+                if not rem >> j & 1:
+                    continue
+                new_cost = cost + row[j]
+                if new_cost > limits[j]:
+                    continue
+                idx = (mask | 1 << j) * n + j
+                if new_cost < dp[idx]:
+                    dp[idx] = new_cost
+                    parent[idx] = last
+
+    best_cost, best_last = inf, -1
+    base = full * n
+    for last in range(n):
+        cost = dp[base + last] + back[last]
+        if cost < best_cost and cost < upper_bound:
+            best_cost, best_last = cost, last
+    if best_last < 0:
+        return None, inf
+
+    order = []
+    mask, last = full, best_last
+    while last >= 0:
+        order.append(packages[last])
+        mask, last = mask ^ (1 << last), parent[mask * n + last]
+    order.reverse()
+    return order, best_cost
+
+def _held_karp_numpy(packages, out, back, dist, limits, upper_bound):
+    """
+    Vectorized kernel for held_karp_segment().  Subsets are processed one
+    cardinality layer at a time, so every transition out of a layer into a
+    given package is a single (subsets x n) array operation.
+    """
+    n = len(packages)
+    full = (1 << n) - 1
+    out, back = np.array(out), np.array(back)
+    dist, limits = np.array(dist), np.array(limits)
+
+    dp = np.full((full + 1, n), np.inf)
+    parent = np.full((full + 1, n), -1, dtype=np.int8)
+    first = out <= limits
+    dp[(1 << np.arange(n))[first], np.arange(n)[first]] = out[first]
+
+    masks = np.arange(full + 1)
+    popcount = np.zeros(full + 1, dtype=np.int8)
+    for j in range(n):
+        popcount += (masks >> j) & 1
+
+    for layer in range(1, n):
+        layer_masks = masks[popcount == layer]
+        layer_dp = dp[layer_masks]
+        for j in range(n):
+            rows = ((layer_masks >> j) & 1) == 0
+            cand = layer_dp[rows] + dist[:, j]
+            best_last = cand.argmin(axis=1)
+            best = cand[np.arange(len(best_last)), best_last]
+            ok = best <= limits[j]
+            targets = layer_masks[rows][ok] | (1 << j)
+            dp[targets, j] = best[ok]
+            parent[targets, j] = best_last[ok]
+
+    final = dp[full] + back
+    best_last = int(final.argmin())
+    best_cost = float(final[best_last])
+    if best_cost == np.inf or best_cost >= upper_bound:
+        return None, float('inf')
+
+    order = []
+    mask, last = full, best_last
+    while last >= 0:
+        order.append(packages[last])
+        mask, last = mask ^ (1 << last), int(parent[mask, last])
+    order.reverse()
+    return order, best_cost
+
+def held_karp(solution, test_eval, max_segment=16, time_limit=None):
+    """
+    Re-sequence every load segment (the packages between two depot stops)
+    of every route optimally with held_karp_segment().  Segments longer than
+    max_segment are left to the two_opt() / three_opt() heuristics.  Since
+    reordering a segment changes the time the truck returns to the depot,
+    each new segment is only kept if the full solution stays feasible and
+    does not get more expensive.  After time_limit seconds the remaining
+    segments are left as they are.
+    """
+    started = time.time()
+    ret = list(solution)
+    cur_feas, cur_cost = test_eval(ret)
+    for route_idx, route in enumerate(solution):
+        truck = route.truck
+        depot_location = truck.depot_location
+        speed = truck.speed
+        route = route.opt_copy_packages()
+        stops = route.get_depot_stop_indices()
+        bounds = sorted(set(stops) | {0, len(route.packages)})
+
+        cur_time = truck.start_of_day
+        pred_loc = depot_location
+        for k in range(len(bounds) - 1):
+            start, end = bounds[k], bounds[k+1]
+            cur_time += timedelta(hours=pred_loc.distances[depot_location.id]/speed)
+            if start in stops:
+                cur_time += timedelta(minutes=stops[start].wait_minutes)
+            pred_loc = depot_location
+            segment = route.packages[start:end]
+
+            if 1 < len(segment) <= max_segment and (time_limit is None or time.time() - started < time_limit):
+                seg_cost = depot_location.distances[segment[0].delivery_location.id]
+                for a, b in zip(segment, segment[1:]):
+                    seg_cost += a.delivery_location.distances[b.delivery_location.id]
+                seg_cost += segment[-1].delivery_location.distances[depot_location.id]
+                order, cost = held_karp_segment(depot_location, segment, cur_time, speed, seg_cost)
+                if order is not None and order != segment:
+                    new_route = route.opt_copy_packages()
+                    new_route.packages[start:end] = order
+                    candidate = ret[:route_idx] + [new_route] + ret[route_idx+1:]
+                    new_feas, new_cost = test_eval(candidate)
+                    if (all(new_feas) or not all(cur_feas)) and new_cost <= cur_cost:
+                        route, ret, cur_feas, cur_cost = new_route, candidate, new_feas, new_cost
+                        segment = order
+
+            for package in segment:
+                cur_time += timedelta(hours=pred_loc.distances[package.delivery_location.id]/speed)
+                pred_loc = package.delivery_location
+    assert sum(len(r.packages) for r in solution) == sum(len(r.packages) for r in ret)
+    return ret
+
 def local_search(solution, test_eval):
     i = 0
     STUCK_THRESHOLD = 100
@@ -130,11 +317,14 @@ def local_search(solution, test_eval):
             improved = True
     return best_feasible
 
-def iterative_local_search(initial_solution, test_eval, iterations):
+def iterative_local_search(initial_solution, test_eval, iterations, time_limit=None):
+    started = time.time()
     best = initial_solution
     assert all(test_eval(best)[0]) == True
     best_cost = test_eval(initial_solution)[1]
     for i in range(iterations):
+        if time_limit is not None and time.time() - started >= time_limit:
+            break
         print(f"Round {i+1}/{iterations}...")
         initial_solution = two_opt(initial_solution, test_eval)
         ls_solution = local_search(initial_solution, test_eval)
@@ -154,7 +344,7 @@ def iterative_local_search(initial_solution, test_eval, iterations):
                 break
             # p_solution = NeighborhoodOperators.local_three_opt(best)
             p_solution = Perturbations.double_bridge(best)
-            if all(test_eval(p_solution)[0]):
+            if p_solution is not None and all(test_eval(p_solution)[0]):
                 initial_solution = p_solution
                 break
         print('New neighborhood cost: %s' % test_eval(initial_solution)[1])
@@ -162,13 +352,27 @@ def iterative_local_search(initial_solution, test_eval, iterations):
     assert all(test_eval(best)[0]) == True
     return best
 
-def iterative_stochastic_optimization(solution, test_eval, iterations, iter_per_temp):
+def iterative_stochastic_optimization(solution, test_eval, iterations, iter_per_temp, lower_bound=None, gap_threshold=None, time_limit=None):
+    """
+    Repeated rounds of simulated annealing and 2-opt, perturbing the best
+    solution with a double-bridge move whenever a round fails to improve it.
+    When a lower_bound is given, the optimality gap of the best solution is
+    reported after every round, and the search stops early once the gap is
+    at or below gap_threshold.  No new round is started after time_limit
+    seconds, and annealing stops at that point.
+    """
+    started = time.time()
     best_sol = solution
     prev_sol = solution
     cur_sol = solution
     for i in range(iterations):
+        remaining = None
+        if time_limit is not None:
+            remaining = time_limit - (time.time() - started)
+            if remaining <= 0:
+                break
         print(f"Round {i+1}/{iterations}...")
-        sim = SimulatedAnnealing(test_eval, cur_sol, 1000, 0.01, iter_per_temp, 0.9995)
+        sim = SimulatedAnnealing(test_eval, cur_sol, 1000, 0.01, iter_per_temp, 0.9995, lower_bound, gap_threshold, time_limit=remaining)
         sim.run()
         cur_feas, cur_cost = sim.test_eval(sim.solution)
         if all(cur_feas) and cur_cost < test_eval(cur_sol)[1]:
@@ -180,8 +384,16 @@ def iterative_stochastic_optimization(solution, test_eval, iterations, iter_per_
 
         if sim.test_eval(cur_sol)[1] < sim.test_eval(best_sol)[1]:
             best_sol = cur_sol
-        print('Current best solution cost: %s' % sim.test_eval(best_sol)[1])
-        
+        best_cost = sim.test_eval(best_sol)[1]
+        if lower_bound is None:
+            print('Current best solution cost: %s' % best_cost)
+        else:
+            gap = lower_bound.gap(best_cost)
+            print('Current best solution cost: %s (gap %.1f%% to lower bound %s)' % (best_cost, 100 * gap, round(lower_bound.value, 1)))
+            if gap_threshold is not None and gap <= gap_threshold:
+                print('Optimality gap within threshold. Stopping...')
+                break
+
         if prev_sol is cur_sol:
             k = 0
             while True:
@@ -190,12 +402,61 @@ def iterative_stochastic_optimization(solution, test_eval, iterations, iter_per_
                     logging.warning("Unable to find feasible perturbation.")
                     break
                 p_sol = Perturbations.double_bridge(best_sol)
-                if all(sim.test_eval(p_sol)[0]):
+                if p_sol is not None and all(sim.test_eval(p_sol)[0]):
                     cur_sol = p_sol
                     break
-            print('New neighborhood cost: %s' % test_eval(p_sol)[1])
+            print('New neighborhood cost: %s' % test_eval(cur_sol)[1])
             print()
 
         prev_sol = cur_sol
-    assert all(sim.test_eval(best_sol)[0]) == True
-    return best_sol
\ No newline at end of file
+    assert all(test_eval(best_sol)[0]) == True
+    return best_sol
+
+class CountingEvaluator:
+    """
+    Wraps a test_eval function to count the solutions it evaluates, for
+    reporting the number of evaluations and evaluations per second of a
+    search.
+    """
+    def __init__(self, test_eval):
+        self.test_eval = test_eval
+        self.count = 0
+
+    def __call__(self, solution, *args, **kwargs):
+        self.count += 1
+        return self.test_eval(solution, *args, **kwargs)
+
+def anneal_best(solution, test_eval, init_temp=1000, final_temp=0.01, iter_per_temp=20, alpha=0.9995, lower_bound=None, time_limit=None, progress=None, should_stop=None):
+    """
+    One run of simulated annealing that keeps the best feasible solution
+    seen at the end of any temperature step, rather than the one it ends on,
+    and finishes with 2-opt over it.  progress(sa, best, best_cost) is called
+    after every temperature step, and should_stop and time_limit end the
+    run early as in SimulatedAnnealing.
+    Returns the best feasible solution, or None if none was found.
+    """
+    feas, cost = test_eval(solution)
+    best = [solution if all(feas) else None, cost if all(feas) else None]
+
+    def keep(sa):
+        if sa.feasible and (best[1] is None or sa.cur_cost < best[1] - 1e-9):
+            best[0], best[1] = sa.solution, sa.cur_cost
+
+    def report(sa):
+        keep(sa)
+        if progress is not None:
+            progress(sa, best[0], best[1])
+
+    sa = SimulatedAnnealing(
+        test_eval, solution, init_temp, final_temp, iter_per_temp, alpha, lower_bound,
+        verbose=False, time_limit=time_limit, progress=report, should_stop=should_stop
+    )
+    sa.run()
+    keep(sa)
+    if best[0] is None:
+        return None
+    local_opt = two_opt(best[0], test_eval)
+    feas, cost = test_eval(local_opt)
+    if all(feas) and cost < best[1]:
+        return local_opt
+    return best[0]
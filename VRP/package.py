@@ -1,8 +1,58 @@
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 import re
 
+# Special note constraint codes.
+NOTE_NONE = 0
+NOTE_DELAYED = 1
+NOTE_WRONG_ADDRESS = 2
+NOTE_REQUIRED_TRUCK = 3
+NOTE_LINKED = 4
+
+# Packages with a wrong address can not be loaded until the correct address
+# is known, in minutes after midnight.
+WRONG_ADDRESS_AVAILABLE = 10 * 60 + 20
+
+# The note rules are compiled once at import rather than per package.
+_DELAYED_RE = re.compile(r"Delayed on flight---will not arrive to depot until (\d{1,2}):(\d{2}) ?([ap]m)", re.IGNORECASE)
+_WRONG_ADDRESS_RE = re.compile(r"Wrong address listed")
+_REQUIRED_TRUCK_RE = re.compile(r"Can only be on truck (\d+)")
+_LINKED_RE = re.compile(r"Must be delivered with")
+_ID_RE = re.compile(r"(\d+)")
+
+def parse_notes(notes):
+    """
+    Interpret the special notes of a package.  Returns the constraint code,
+    the earliest load time in minutes after midnight (or None), the required
+    truck number (or None) and the list of linked package ids.
+    """
+    if not notes:
+        return NOTE_NONE, None, None, []
+    match = _DELAYED_RE.search(notes)
+    if match:
+        hour = int(match.group(1)) % 12 + (12 if match.group(3).lower() == 'pm' else 0)
+        return NOTE_DELAYED, hour * 60 + int(match.group(2)), None, []
+    if _WRONG_ADDRESS_RE.search(notes):
+        return NOTE_WRONG_ADDRESS, WRONG_ADDRESS_AVAILABLE, None, []
+    match = _REQUIRED_TRUCK_RE.search(notes)
+    if match:
+        return NOTE_REQUIRED_TRUCK, None, int(match.group(1)), []
+    if _LINKED_RE.search(notes):
+        return NOTE_LINKED, None, None, [int(p) for p in _ID_RE.findall(notes)]
+    return NOTE_NONE, None, None, []
+
 class Package:
-    def __init__(self, id, delivery_location, earliest_load, delivery_deadline, mass, notes):
+    def __new__(cls, id=None, *args, **kwargs):
+        # Packages are hashed by id, so the id is set before unpickling
+        # restores the rest of the state, as linked package group sets that
+        # refer back to the package may be rebuilt first.
+        self = object.__new__(cls)
+        self.id = id
+        return self
+
+    def __getnewargs__(self):
+        return (self.id,)
+
+    def __init__(self, id, delivery_location, earliest_load, delivery_deadline, mass, notes, parse_notes=True):
         self.id = id
         self.delivery_location = delivery_location
         self.earliest_load = earliest_load
@@ -14,7 +64,8 @@ class Package:
         self.required_truck_number = None
         self.linked_package_ids = []
         self.linked_package_group = None
-        self._parse_notes()
+        if parse_notes:
+            self._parse_notes()
 
         self.load_time = None
         self.delivery_time = None
@@ -27,16 +78,14 @@ class Package:
         return self.id
 
     def _parse_notes(self):
-        if self.notes == "Delayed on flight---will not arrive to depot until 9:05 am":
-            today = date.today()
-            self.earliest_load = datetime(today.year, today.month, today.day, hour=9, minute=5)
-        elif self.notes == "Wrong address listed":
+        code, earliest_load, required_truck, linked_ids = parse_notes(self.notes)
+        if earliest_load is not None:
             today = date.today()
-            self.earliest_load = datetime(today.year, today.month, today.day, hour=10, minute=20)
-        elif self.notes == "Can only be on truck 2":
-            self.required_truck_number = 2
-        elif "Must be delivered with" in self.notes:
-            self.linked_package_ids = [int(p) for p in re.findall("([\d]+)", self.notes)]
+            self.earliest_load = datetime(today.year, today.month, today.day) + timedelta(minutes=earliest_load)
+        if required_truck is not None:
+            self.required_truck_number = required_truck
+        if linked_ids:
+            self.linked_package_ids = linked_ids
 
     def assign_truck(self, truck):
         self.assigned_truck = truck
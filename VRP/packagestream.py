@@ -0,0 +1,126 @@
+from package import Package, parse_notes
+from array import array
+from collections import namedtuple
+from datetime import datetime, timedelta
+from itertools import islice
+import csv
+
+# Deadlines are stored in minutes after midnight, where end of day is the
+# last second of the day.
+EOD_MINUTES = 24 * 60 - 1 / 60
+
+PackageColumns = namedtuple('PackageColumns', [
+    'ids',
+    'location_ids',
+    'location_index',
+    'deadline_minutes',
+    'masses',
+    'constraint_codes',
+    'earliest_load_minutes',
+    'required_trucks',
+    'linked_offsets',
+    'linked_ids',
+    'notes'
+])
+
+class PackageStream:
+    """
+    Streaming ingestion of a package manifest.  Rows are parsed in chunks of
+    chunk_size into column arrays instead of a Package object per row, so a
+    consumer of chunks() holds one chunk of the file at a time.  packages()
+    builds a Package per row from those chunks, and the memory of whatever
+    keeps the packages, such as DataLoader's package table, is unchanged.
+    Per column:
+    - location_index is the position of the delivery location in
+      location_index (for example the index of a DistanceMatrix), or -1.
+    - earliest_load_minutes is -1 when the package is available at the start
+      of the day, and required_trucks is 0 when any truck may deliver it.
+    - The linked package ids of row i are
+      linked_ids[linked_offsets[i]:linked_offsets[i+1]].
+    Deadline strings and special notes repeat heavily across a manifest, so
+    both are parsed once per distinct value.
+    """
+    def __init__(self, path, location_index=None, chunk_size=4096):
+        self.path = path
+        self.location_index = location_index or {}
+        self.chunk_size = chunk_size
+        self._deadlines = {}
+        self._notes = {}
+
+    def _deadline_minutes(self, deadline):
+        minutes = self._deadlines.get(deadline)
+        if minutes is None:
+            if deadline == 'EOD':
+                minutes = EOD_MINUTES
+            else:
+                time = datetime.strptime(deadline, "%I:%M %p")
+                minutes = time.hour * 60 + time.minute
+            self._deadlines[deadline] = minutes
+        return minutes
+
+    def _parse_notes(self, notes):
+        parsed = self._notes.get(notes)
+        if parsed is None:
+            parsed = parse_notes(notes)
+            self._notes[notes] = parsed
+        return parsed
+
+    def chunks(self):
+        """Yield a PackageColumns of up to chunk_size packages at a time."""
+        with open(self.path, newline='') as csvfile:
+            reader = csv.reader(csvfile, delimiter=',', quotechar='"')
+            header = next(reader, None)
+            col = {name: i for i, name in enumerate(header)}
+            c_id, c_loc, c_deadline = col['PackageID'], col['LocationID'], col['DeliveryDeadline']
+            c_mass, c_notes = col['Mass'], col['SpecialNotes']
+            location_index = self.location_index
+            while True:
+                rows = list(islice(reader, self.chunk_size))
+                if not rows:
+                    return
+                columns = PackageColumns(
+                    array('q'), array('q'), array('q'), array('d'), array('q'),
+                    array('b'), array('d'), array('q'), array('q', [0]), array('q'), []
+                )
+                for row in rows:
+                    if not row:
+                        continue
+                    location_id = int(row[c_loc])
+                    notes = row[c_notes]
+                    code, earliest_load, required_truck, linked_ids = self._parse_notes(notes)
+                    columns.ids.append(int(row[c_id]))
+                    columns.location_ids.append(location_id)
+                    columns.location_index.append(location_index.get(location_id, -1))
+                    columns.deadline_minutes.append(self._deadline_minutes(row[c_deadline]))
+                    columns.masses.append(int(row[c_mass]))
+                    columns.constraint_codes.append(code)
+                    columns.earliest_load_minutes.append(-1 if earliest_load is None else earliest_load)
+                    columns.required_trucks.append(required_truck or 0)
+                    columns.linked_ids.extend(linked_ids)
+                    columns.linked_offsets.append(len(columns.linked_ids))
+                    columns.notes.append(notes)
+                yield columns
+
+    def packages(self, location_table, start_of_day):
+        """
+        Yield Package objects one at a time, built from the column chunks,
+        with deadlines and earliest load times on the day of start_of_day.
+        """
+        midnight = datetime(start_of_day.year, start_of_day.month, start_of_day.day)
+        for columns in self.chunks():
+            offsets = columns.linked_offsets
+            for i in range(len(columns.ids)):
+                package = Package(
+                    columns.ids[i],
+                    location_table[columns.location_ids[i]],
+                    start_of_day,
+                    midnight + timedelta(minutes=columns.deadline_minutes[i]),
+                    columns.masses[i],
+                    columns.notes[i],
+                    parse_notes=False
+                )
+                if columns.earliest_load_minutes[i] >= 0:
+                    package.earliest_load = midnight + timedelta(minutes=columns.earliest_load_minutes[i])
+                package.required_truck_number = columns.required_trucks[i] or None
+                package.linked_package_ids = columns.linked_ids[offsets[i]:offsets[i+1]].tolist()
+                yield package
@@ -0,0 +1,92 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, date
+import json
+import os
+
+# The simulator of a worker process, set once by the pool initializer so
+# that only package ids and encoded routes are sent per task.
+_SIMULATOR = None
+
+# Simulators of a process by instance, so that repeated solves of the same
+# instance in a long-lived worker skip loading and construction.
+_INSTANCES = {}
+
+# Defaults of an instance description, matching main.py.  Without
+# address_changes, the corrections in the address_changes.csv of the
+# instance are applied, as by DeliverySimulator.
+INSTANCE_DEFAULTS = {
+    'data_dir': '../data/',
+    'depot': 999,
+    'drivers': 2,
+    'speed': 18,
+    'capacity': 16,
+    'start': '08:00',
+    'construction': 'savings',
+    'address_changes': None,
+    'mmap_distances': False
+}
+# Help of the --address-changes option of the command line tools.
+ADDRESS_CHANGES_HELP = 'corrected addresses as JSON, {"package_id": location_id} (default: those in the address_changes.csv of the instance)'
+
+def init_worker(simulator):
+    global _SIMULATOR
+    _SIMULATOR = simulator
+
+def worker_simulator():
+    """Return the simulator of the current worker process."""
+    return _SIMULATOR
+
+def worker_pool(simulator, workers):
+    """
+    Return a process pool whose workers hold simulator, to be reused over
+    several map_tasks() calls, or None for a single worker.
+    """
+    if workers == 1:
+        return None
+    return ProcessPoolExecutor(workers, initializer=init_worker, initargs=(simulator,))
+
+def map_tasks(simulator, func, tasks, workers, pool=None):
+    """
+    Run func over tasks in a process pool whose workers hold simulator, or
+    in this process when there is a single worker or task.  func must be a
+    module level function, and gets the simulator from worker_simulator().
+    A pool from worker_pool() is used when given, rather than a new one.
+    """
+    if workers == 1 or len(tasks) < 2:
+        init_worker(simulator)
+        return [func(task) for task in tasks]
+    chunksize = max(1, len(tasks) // (4 * workers))
+    if pool is not None:
+        return list(pool.map(func, tasks, chunksize=chunksize))
+    with worker_pool(simulator, workers) as pool:
+        return list(pool.map(func, tasks, chunksize=chunksize))
+
+def instance_simulator(instance):
+    """
+    Return the simulator of an instance description, a dict over the keys
+    of INSTANCE_DEFAULTS, and the encoded routes of its constructed initial
+    solution.  Both are cached in this process per instance and day, so
+    every solve starts by decoding the initial routes rather than touching
+    the shared simulator's routes.
+    """
+    # Imported here, as the simulator itself imports the modules that run
+    # their work through this one.
+    from deliverysimulator import DeliverySimulator
+
+    spec = dict(INSTANCE_DEFAULTS, **instance)
+    # DataLoader joins file names onto the directory as strings.
+    spec['data_dir'] = os.path.join(spec['data_dir'], '')
+    today = date.today()
+    key = json.dumps([str(today), spec], sort_keys=True)
+    if key not in _INSTANCES:
+        start = datetime.strptime(spec['start'], '%H:%M').time()
+        simulator = DeliverySimulator(
+            spec['depot'], spec['drivers'], spec['speed'], spec['capacity'],
+            datetime.combine(today, start), spec['data_dir'],
+            construction=spec['construction'],
+            mmap_distances=spec['mmap_distances'],
+            address_changes={int(k): v for k, v in spec['address_changes'].items()} if spec['address_changes'] is not None else None
+        )
+        initial = [route.encode() for route in simulator.current_solution()]
+        _INSTANCES[key] = simulator, initial
+    return _INSTANCES[key]
@@ -11,7 +11,8 @@ class Perturbations:
         new_route = solution[route_idx].opt_copy_packages()
         n = len(new_route)
         
-        if n < 4:
+        # Four distinct cuts are drawn from the n - 1 inner positions.
+        if n < 5:
             return None
 
         while True:
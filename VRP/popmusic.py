@@ -0,0 +1,136 @@
+from optimization import two_opt, held_karp
+from parallel import map_tasks, worker_pool, worker_simulator
+from route import Route
+from simulatedannealing import SimulatedAnnealing
+from spatial import GridIndex
+import os
+import random
+import time
+
+# A subproblem only holds a few routes, so it is annealed on a far shorter
+# schedule than the full solution.
+SUBPROBLEM_INIT_TEMP = 10
+SUBPROBLEM_FINAL_TEMP = 0.01
+SUBPROBLEM_ALPHA = 0.99
+
+def route_centroid(route, depot_location):
+    """Mean (lat, lon) of the delivery locations of a route."""
+    if not route.packages:
+        return depot_location.coords
+    n = len(route.packages)
+    lat = sum(p.delivery_location.coords[0] for p in route.packages) / n
+    lon = sum(p.delivery_location.coords[1] for p in route.packages) / n
+    return lat, lon
+
+def optimize_subproblem(simulator, routes, method='anneal', iter_per_temp=20, test_eval=None, time_limit=None):
+    """
+    Optimize a small solution of a few routes on its own, by simulated
+    annealing followed by 2-opt and exact segment sequencing ('anneal'), or
+    by the latter alone ('two_opt').  Since every constraint is checked per
+    route, test_eval() over the subproblem only walks its own routes.
+    Every stage stops early once time_limit seconds have passed in all.
+    Returns the improved routes, or None if no feasible improvement was found.
+    """
+    started = time.time()
+    test_eval = test_eval or simulator.test_eval
+    feas, cost = test_eval(routes)
+    candidate = routes
+    if method == 'anneal':
+        sim = SimulatedAnnealing(
+            test_eval, routes, SUBPROBLEM_INIT_TEMP, SUBPROBLEM_FINAL_TEMP,
+            iter_per_temp, SUBPROBLEM_ALPHA, verbose=False, time_limit=time_limit
+        )
+        annealed = sim.run()
+        if all(test_eval(annealed)[0]):
+            candidate = annealed
+    elif method != 'two_opt':
+        raise ValueError('Unknown subproblem method: %s' % method)
+    if all(test_eval(candidate)[0]):
+        remaining = max(time_limit - (time.time() - started), 0) if time_limit is not None else None
+        candidate = two_opt(candidate, test_eval, remaining)
+        remaining = max(time_limit - (time.time() - started), 0) if time_limit is not None else None
+        candidate = held_karp(candidate, test_eval, time_limit=remaining)
+
+    new_feas, new_cost = test_eval(candidate)
+    if all(new_feas) and (new_cost < cost - 1e-9 or not all(feas)):
+        return candidate
+    return None
+
+def _optimize_subproblem(task):
+    seed, encoded_routes, method, iter_per_temp = task
+    simulator = worker_simulator()
+    table = simulator.data.package_table
+    routes = [Route.decode(simulator.depot.trucks[t], table, encoded) for t, encoded in encoded_routes]
+    # map_tasks() runs a single task in the caller's process, whose random
+    # state is restored after the seeded search.
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        improved = optimize_subproblem(simulator, routes, method, iter_per_temp)
+    finally:
+        random.setstate(state)
+    if improved is None:
+        return None
+    return [(t, route.encode()) for (t, _), route in zip(encoded_routes, improved)]
+
+def popmusic(simulator, solution, k=3, workers=None, method='anneal', iter_per_temp=20, max_rounds=None, time_limit=None, seed=None):
+    """
+    POPMUSIC improvement of a large solution.  A subproblem is a seed route
+    and its k nearest routes by centroid, optimized alone as a small
+    solution (optimize_subproblem()) and spliced back into the full one.
+    Each round draws as many subproblems as possible that share no route,
+    and runs them concurrently in a process pool.  A seed whose subproblem
+    does not improve is set aside, while an improvement puts every route of
+    its subproblem back in play, so the search ends once no seed improves,
+    after max_rounds rounds, or after time_limit seconds.
+    solution[i] must be the route of truck i.  The improved routes are
+    loaded onto the trucks and returned.
+    """
+    rng = random.Random(seed)
+    workers = workers or os.cpu_count() or 1
+    trucks = simulator.depot.trucks
+    table = simulator.data.package_table
+    routes = list(solution)
+    k = min(k, len(routes) - 1)
+    pending = set(range(len(routes)))
+    start = time.time()
+    rounds = 0
+
+    # One pool serves every round, so worker processes and their copy of the
+    # simulator are only set up once.
+    pool = worker_pool(simulator, workers)
+    try:
+        while pending:
+            if max_rounds is not None and rounds >= max_rounds:
+                break
+            if time_limit is not None and time.time() - start >= time_limit:
+                break
+            rounds += 1
+
+            centroids = [route_centroid(route, simulator.depot_location) for route in routes]
+            grid = GridIndex(enumerate(centroids))
+            seeds = sorted(pending)
+            rng.shuffle(seeds)
+            taken = set()
+            batch = []
+            for s in seeds:
+                members = [s] + [t for _, t in grid.nearest(centroids[s], k, exclude={s})]
+                if taken.isdisjoint(members):
+                    taken.update(members)
+                    batch.append(members)
+
+            tasks = [(rng.randrange(2 ** 32), [(t, routes[t].encode()) for t in members], method, iter_per_temp) for members in batch]
+            for members, result in zip(batch, map_tasks(simulator, _optimize_subproblem, tasks, workers, pool)):
+                if result is None:
+                    pending.discard(members[0])
+                else:
+                    for t, encoded in result:
+                        routes[t] = Route.decode(trucks[t], table, encoded)
+                    pending.update(members)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    for truck, route in zip(trucks, routes):
+        truck.route = route
+    return routes
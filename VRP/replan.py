@@ -0,0 +1,154 @@
+from construction import PlanEvaluator, build_units, build_route, regret_insertion, route_trips
+from depotstop import DepotStop
+from package import Package
+from popmusic import optimize_subproblem
+from route import Route
+from datetime import timedelta
+from functools import partial
+import logging
+import time
+
+def split_route(simulator, route, cur_time):
+    """
+    Find the frozen prefix of a route at cur_time: every trip that has left
+    the depot by then is committed, as its packages are already on the
+    truck.  Returns the number of frozen packages and the time the truck is
+    back at the depot after them.
+    """
+    start = simulator.constants.start_of_day
+    if cur_time < start:
+        return 0, start
+    speed = simulator.constants.truck_speed
+    depot = simulator.depot_location
+    n = len(route.packages)
+    time_at = start
+    pred_loc = depot
+    for step in route.gen_steps():
+        if type(step) is Package:
+            time_at += timedelta(hours=pred_loc.distances[step.delivery_location.id]/speed)
+            pred_loc = step.delivery_location
+        else:
+            time_at += timedelta(hours=pred_loc.distances[depot.id]/speed)
+            pred_loc = depot
+            if step.route_index >= n:
+                break
+            if time_at + timedelta(minutes=step.wait_minutes) > cur_time:
+                return step.route_index, time_at
+            time_at += timedelta(minutes=step.wait_minutes)
+    return n, time_at
+
+def replan(simulator, solution, cur_time, address_changes=None, arrivals=None, new_packages=None, time_limit=5, iter_per_temp=20):
+    """
+    Incremental re-optimization of a solution in progress at cur_time.
+        <address_changes>: {package_id: location_id} of corrected addresses.
+        <arrivals>: {package_id: datetime} of packages arriving at the depot
+            later than planned.
+        <new_packages>: Package objects added to the day's deliveries.
+    The trips that already left the depot are frozen (split_route()), and
+    only the open remainder of each route can change.  Changed packages in
+    open trips are taken out, and together with new packages re-inserted by
+    regret insertion into the open plans of every truck, each starting when
+    the truck is back from its frozen trips.  The trucks that lost or gained
+    packages are then re-optimized together by a short simulated annealing
+    run, warm started from their current sequences; every other route stays
+    untouched.  The insertion and every optimization stage share the budget
+    of time_limit seconds, and cut their work short when it runs out.
+    solution[i] must be the route of truck i.  The new routes are only loaded
+    onto the trucks, and returned, when they satisfy every constraint;
+    otherwise the trucks keep their routes and a ValueError is raised.
+    """
+    started = time.time()
+    table = simulator.data.package_table
+    trucks = simulator.depot.trucks
+    start = simulator.constants.start_of_day
+
+    splits = [split_route(simulator, route, cur_time) for route in solution]
+    frozen = {}
+    for t, route in enumerate(solution):
+        for package in route.packages[:splits[t][0]]:
+            frozen[package.id] = t
+
+    changed = set()
+    for package_id, location_id in (address_changes or {}).items():
+        package = table[package_id]
+        if package_id in frozen and package.delivery_location.id != location_id:
+            logging.warning('Package %d is already on truck %d, and is delivered to the new address in its planned order.' % (package_id, frozen[package_id] + 1))
+        else:
+            changed.add(package_id)
+        simulator.change_package_address(package_id, location_id)
+    for package_id, arrival in (arrivals or {}).items():
+        if package_id in frozen:
+            logging.warning('Package %d was already loaded on truck %d, ignoring its late arrival.' % (package_id, frozen[package_id] + 1))
+            continue
+        table[package_id].earliest_load = arrival
+        changed.add(package_id)
+    for package in new_packages or []:
+        table[package.id] = package
+        changed.add(package.id)
+
+    # Linked groups move as a whole, unless some of the group is frozen.
+    units = []
+    moving = set()
+    frozen_ids = set(frozen)
+    for unit, required in build_units(simulator):
+        ids = {p.id for p in unit}
+        if ids & changed and not ids & frozen_ids:
+            units.append((unit, required))
+            moving |= ids
+
+    evaluator = PlanEvaluator(simulator)
+    start_times = [(back - start).total_seconds() / 3600 for _, back in splits]
+    plans = []
+    affected = set()
+    for t, route in enumerate(solution):
+        open_route = Route(route.truck)
+        open_route.packages = route.packages[splits[t][0]:]
+        open_route.depot_stops = [DepotStop(stop.route_index - splits[t][0]) for stop in route.depot_stops if stop.route_index >= splits[t][0]]
+        trips = route_trips(open_route)
+        kept = [[p for p in trip if p.id not in moving] for trip in trips]
+        kept = [trip for trip in kept if trip]
+        if sum(len(trip) for trip in kept) != len(open_route.packages):
+            affected.add(t)
+        plans.append(kept)
+
+    remaining = max(time_limit - (time.time() - started), 0) if time_limit is not None else None
+    new_plans = regret_insertion(simulator, plans=[list(plan) for plan in plans], units=units, start_times=start_times, time_limit=remaining)
+    for t in range(len(solution)):
+        if new_plans[t] != plans[t]:
+            affected.add(t)
+
+    # Each open route leaves the depot when its truck is back from its
+    # frozen trips.
+    back_times = {trucks[t].number: back for t, (_, back) in enumerate(splits)}
+    test_eval = partial(simulator.test_eval, start_times=back_times)
+    affected = sorted(affected)
+    open_routes = []
+    for t in affected:
+        waits = evaluator.evaluate(new_plans[t], start_times[t])[2]
+        open_routes.append(build_route(trucks[t], new_plans[t], waits))
+    if open_routes:
+        remaining = max(time_limit - (time.time() - started), 0) if time_limit is not None else None
+        improved = optimize_subproblem(simulator, open_routes, 'anneal', iter_per_temp, test_eval, remaining)
+        if improved is not None:
+            open_routes = improved
+    # Rebuilding the open routes from their trips restores the depot stop
+    # at their start, which annealing may have removed, and trims the depot
+    # waits to the least that the earliest load times require.
+    for i, t in enumerate(affected):
+        trips = route_trips(open_routes[i])
+        open_routes[i] = build_route(trucks[t], trips, evaluator.evaluate(trips, start_times[t])[2])
+
+    routes = list(solution)
+    for t, open_route in zip(affected, open_routes):
+        n = splits[t][0]
+        route = solution[t]
+        ids = [p.id for p in route.packages[:n]] + [p.id for p in open_route.packages]
+        stops = [(stop.route_index, stop.wait_minutes) for stop in route.depot_stops if stop.route_index < n]
+        stops += [(stop.route_index + n, stop.wait_minutes) for stop in open_route.depot_stops]
+        routes[t] = Route.decode(trucks[t], table, (ids, stops))
+
+    if not all(simulator.test_eval(routes)[0]):
+        raise ValueError('Re-planned solution does not satisfy every constraint, the trucks keep their previous routes.')
+    for truck, route in zip(trucks, routes):
+        truck.route = route
+    return routes
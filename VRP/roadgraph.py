@@ -0,0 +1,130 @@
+from helpers import dijkstra
+from spatial import haversine
+from collections import OrderedDict
+import csv
+
+class LazyDistanceRow:
+    """
+    The distances from a single location in a LazyDistanceTable.  The row
+    does not hold the distances itself, so a Location keeping a reference to
+    its row does not pin the row in memory past its eviction from the cache.
+    """
+    __slots__ = ('table', 'source')
+
+    def __init__(self, table, source):
+        self.table = table
+        self.source = source
+
+    def __getitem__(self, location_id):
+        return self.table.distance(self.source, location_id)
+
+    def __len__(self):
+        return len(self.table)
+
+    def __contains__(self, location_id):
+        return location_id in self.table
+
+    def keys(self):
+        return self.table.keys()
+
+class LazyDistanceTable:
+    """
+    Shortest path distances over a sparse road graph, computed on demand.
+    The first lookup from a source location runs Dijkstra from that source,
+    and the resulting row is kept in a least-recently-used cache bounded to
+    cache_size rows.  Memory therefore scales with the number of road
+    segments plus the cached rows, rather than with every pair of locations,
+    and only the distances the solver actually touches are ever computed.
+    Graph nodes do not need to be delivery locations, so intersections can
+    be included in the edge list.  Locations missing from the graph can be
+    given coordinates with estimate_missing(), so that their distances are
+    estimated rather than failing the lookup.
+    """
+    def __init__(self, edges, cache_size=1024, directed=False):
+        self.ids = []
+        self.index = {}
+        self.adj_list = []
+        for start, end, distance in edges:
+            for node in (start, end):
+                if node not in self.index:
+                    self.index[node] = len(self.ids)
+                    self.ids.append(node)
+                    self.adj_list.append([])
+            self.adj_list[self.index[start]].append((self.index[end], distance))
+            if not directed:
+                self.adj_list[self.index[end]].append((self.index[start], distance))
+
+        self.coords = {}
+        self.estimated = set()
+        self.road_factor = 1.0
+
+        self.cache_size = cache_size
+        self.rows = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def from_csv(path, cache_size=1024, directed=False):
+        """
+        Load an edge list with a header row and one road segment per line,
+        as start location id, end location id and distance.
+        """
+        with open(path) as csvfile:
+            reader = csv.reader(csvfile, delimiter=',', quotechar='"')
+            next(reader, None)
+            edges = [(int(row[0]), int(row[1]), float(row[2])) for row in reader if row]
+        return LazyDistanceTable(edges, cache_size, directed)
+
+    def __getitem__(self, location_id):
+        if location_id not in self:
+            raise KeyError(location_id)
+        return LazyDistanceRow(self, location_id)
+
+    def __len__(self):
+        return len(self.ids) + len(self.estimated)
+
+    def __contains__(self, location_id):
+        return location_id in self.index or location_id in self.estimated
+
+    def keys(self):
+        return list(self.ids) + sorted(self.estimated)
+
+    def estimate_missing(self, coords, road_factor=1.0):
+        """
+        <coords> maps location ids to (lat, lon).  Locations that are not
+        in the graph are added, with their distance to and from any
+        location estimated as the haversine distance times road_factor.
+        Graph nodes without coordinates are unreachable from them.
+        Returns the ids of the added locations.
+        """
+        self.coords = coords
+        self.road_factor = road_factor
+        self.estimated = {location_id for location_id in coords if location_id not in self.index}
+        return self.estimated
+
+    def row(self, source):
+        """Return the list of distances from source, indexed by node index."""
+        rows = self.rows
+        dists = rows.get(source)
+        if dists is not None:
+            self.hits += 1
+            rows.move_to_end(source)
+            return dists
+        self.misses += 1
+        dists = dijkstra(self.adj_list, self.index, source)
+        rows[source] = dists
+        if len(rows) > self.cache_size:
+            rows.popitem(last=False)
+        return dists
+
+    def distance(self, start, end):
+        if start in self.estimated or end in self.estimated:
+            if start == end:
+                return 0.0
+            if start not in self.coords or end not in self.coords:
+                return float('inf')
+            return self.road_factor * haversine(self.coords[start], self.coords[end])
+        return self.row(start)[self.index[end]]
+
+    def cache_info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.rows), 'max_size': self.cache_size}
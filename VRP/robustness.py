@@ -0,0 +1,127 @@
+from package import Package
+from collections import namedtuple
+from math import log, sqrt
+
+try:
+    import numpy as np
+except:
+    np = None
+
+RobustnessReport = namedtuple('RobustnessReport', ['on_time', 'expected_misses', 'all_on_time', 'misses'])
+
+class RobustnessEvaluator:
+    """
+    Monte Carlo evaluation of how a solution holds up when travel is not as
+    planned.  Every leg a truck drives gets a random speed factor, drawn
+    from a lognormal distribution with mean 1 and coefficient of variation
+    speed_cv, and every delivery gets a random service delay, drawn from an
+    exponential distribution with mean service_minutes.  A truck leaves the
+    depot at its planned departure, or later if it returns late, so depot
+    waits absorb early returns.
+    All scenarios are simulated at once as numpy arrays over the edges of
+    the solution, one trip at a time, rather than one scenario at a time
+    through test_eval().  The random draws are made once per evaluator and
+    reused (common random numbers), so two solutions are compared under the
+    same scenarios, which keeps the comparison stable inside a search.
+    """
+    def __init__(self, simulator, scenarios=1000, speed_cv=0.1, service_minutes=0.0, seed=None):
+        if np is None:
+            raise ImportError('Must install numpy to evaluate robustness.')
+        self.depot_location = simulator.depot_location
+        self.speed = simulator.constants.truck_speed
+        self.start_of_day = simulator.constants.start_of_day
+        self.scenarios = scenarios
+        self.speed_cv = speed_cv
+        self.service_minutes = service_minutes
+        self.rng = np.random.default_rng(seed)
+        self.factors = np.empty((scenarios, 0))
+        self.service = np.empty((scenarios, 0))
+
+    def _draws(self, n_edges):
+        """Return the speed factors and service delays (hours) of the first n_edges edges."""
+        have = self.factors.shape[1]
+        if n_edges > have:
+            extra = max(n_edges - have, have)
+            sigma = sqrt(log(1 + self.speed_cv ** 2))
+            factors = self.rng.lognormal(-sigma ** 2 / 2, sigma, (self.scenarios, extra))
+            if self.service_minutes:
+                service = self.rng.exponential(self.service_minutes / 60, (self.scenarios, extra))
+            else:
+                service = np.zeros((self.scenarios, extra))
+            self.factors = np.concatenate([self.factors, factors], axis=1)
+            self.service = np.concatenate([self.service, service], axis=1)
+        return self.factors[:, :n_edges], self.service[:, :n_edges]
+
+    def _trips(self, route):
+        """
+        Split a route into trips of (planned departure in hours after the
+        start of the day, distances of the legs out to each package and back
+        to the depot, packages), following the timing of test_eval().
+        """
+        depot = self.depot_location
+        trips = []
+        cur_time = 0.0
+        pred_loc = depot
+        distances = []
+        packages = []
+        departure = 0.0
+        for step in route.gen_steps():
+            if type(step) is Package:
+                distance = pred_loc.distances[step.delivery_location.id]
+                cur_time += distance / self.speed
+                distances.append(distance)
+                packages.append(step)
+                pred_loc = step.delivery_location
+            else:
+                distance = pred_loc.distances[depot.id]
+                cur_time += distance / self.speed
+                if packages:
+                    distances.append(distance)
+                    trips.append((departure, distances, packages))
+                cur_time += step.wait_minutes / 60
+                departure = cur_time
+                distances = []
+                packages = []
+                pred_loc = depot
+        if packages:
+            distances.append(pred_loc.distances[depot.id])
+            trips.append((departure, distances, packages))
+        return trips
+
+    def evaluate(self, solution):
+        """
+        Return a RobustnessReport: the probability that each package (by
+        id) is delivered by its deadline, the expected number of deadline
+        misses, the probability that every package is on time, and the
+        number of misses in each scenario.
+        """
+        routes = [self._trips(route) for route in solution]
+        n_edges = sum(len(distances) for trips in routes for _, distances, _ in trips)
+        factors, service = self._draws(n_edges)
+        start = self.start_of_day
+
+        on_time = {}
+        misses = np.zeros(self.scenarios)
+        e = 0
+        for trips in routes:
+            back = np.zeros(self.scenarios)
+            for departure, distances, packages in trips:
+                m = len(distances)
+                travel = np.asarray(distances) / self.speed / factors[:, e:e+m]
+                delay = service[:, e:e+m].copy()
+                delay[:, -1] = 0.0
+                depart = np.maximum(back, departure)
+                # Arrival at each stop is the departure plus the driving up
+                # to it and the service at every earlier delivery.
+                arrivals = depart[:, None] + np.cumsum(travel, axis=1) + np.cumsum(delay, axis=1) - delay
+                deadlines = np.array([(p.delivery_deadline - start).total_seconds() / 3600 for p in packages])
+                late = arrivals[:, :-1] > deadlines
+                misses += late.sum(axis=1)
+                for package, probability in zip(packages, 1 - late.mean(axis=0)):
+                    on_time[package.id] = float(probability)
+                back = arrivals[:, -1]
+                e += m
+        return RobustnessReport(on_time, float(misses.mean()), float((misses == 0).mean()), misses)
+
+    def expected_misses(self, solution):
+        return self.evaluate(solution).expected_misses
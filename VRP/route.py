@@ -25,6 +25,23 @@ class Route:
         newone.depot_stops = [copy(stop) for stop in self.depot_stops]
         return newone
 
+    def encode(self):
+        """
+        Return the route as plain (package_ids, [(route_index, wait_minutes)])
+        data, which is cheap to send between processes.
+        """
+        return [p.id for p in self.packages], [(stop.route_index, stop.wait_minutes) for stop in self.depot_stops]
+
+    @staticmethod
+    def decode(truck, package_table, encoded):
+        """Rebuild a route of truck from the data returned by encode()."""
+        package_ids, stops = encoded
+        route = Route(truck)
+        for package_id in package_ids:
+            route.add_package(package_table[package_id])
+        route.depot_stops = [DepotStop(route_index, wait_minutes) for route_index, wait_minutes in stops]
+        return route
+
     def gen_steps(self):
         ds_idx = 0
         p_idx = 0
@@ -0,0 +1,356 @@
+from lowerbound import LowerBound
+from optimization import two_opt, held_karp, anneal_best, CountingEvaluator
+from parallel import instance_simulator
+from route import Route
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Manager
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import time
+
+# Solver settings of a job, overridden by the settings it is submitted with.
+SOLVE_DEFAULTS = {
+    'time_limit': 60,
+    'init_temp': 1000,
+    'final_temp': 0.01,
+    'iter_per_temp': 20,
+    'alpha': 0.9995,
+    'seed': None
+}
+# The outcome of solve(): the final solution with its cost and feasibility,
+# the cost of the constructed solution, the LowerBound, the number of
+# solutions evaluated, and the seconds spent loading and solving.
+SolveResult = namedtuple('SolveResult', ['solution', 'cost', 'feasible', 'initial_cost', 'lower_bound', 'evaluations', 'load_seconds', 'solve_seconds'])
+# Least number of seconds between two progress events of a job.
+PROGRESS_INTERVAL = 0.5
+
+# Job states.
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+
+def encode_solution(solution):
+    return [
+        {'truck': route.truck.number, 'packages': package_ids, 'depot_stops': stops}
+        for route, (package_ids, stops) in ((route, route.encode()) for route in solution)
+    ]
+
+def solve(instance, settings, progress=None, should_stop=None):
+    """
+    The solve pipeline shared by solve_job and batch.py: decode the cached
+    constructed solution of the instance, 2-opt and exact segment sequencing
+    of it, then simulated annealing until the time limit, the final
+    temperature or should_stop, and a last 2-opt pass over its result.
+    progress(sa, best, best_cost, lower_bound) is called after every
+    temperature step.  Every solution evaluated is counted through a
+    CountingEvaluator.
+    Returns a SolveResult.
+    """
+    started = time.time()
+    if settings['seed'] is not None:
+        random.seed(settings['seed'])
+
+    simulator, initial = instance_simulator(instance)
+    loaded = time.time()
+    trucks = simulator.depot.trucks
+    table = simulator.data.package_table
+    test_eval = CountingEvaluator(simulator.test_eval)
+    solution = [Route.decode(trucks[t], table, encoded) for t, encoded in enumerate(initial)]
+    initial_cost = test_eval(solution)[1]
+    solution = held_karp(two_opt(solution, test_eval), test_eval)
+    lower_bound = LowerBound(simulator.depot_location, simulator.depot.packages, simulator.constants.truck_capacity, upper_bound=test_eval(solution)[1])
+
+    report = None
+    if progress is not None:
+        def report(sa, best, best_cost):
+            progress(sa, best, best_cost, lower_bound)
+
+    time_limit = settings['time_limit']
+    if time_limit is not None:
+        time_limit = max(time_limit - (time.time() - started), 0)
+    best = anneal_best(
+        solution, test_eval, settings['init_temp'], settings['final_temp'],
+        settings['iter_per_temp'], settings['alpha'], lower_bound, time_limit,
+        progress=report, should_stop=should_stop
+    )
+    if best is not None:
+        simulator.minimize_wait_times(best)
+    final = best if best is not None else solution
+    solved = time.time()
+
+    feas, cost = simulator.test_eval(final)
+    return SolveResult(
+        final, cost, all(feas), initial_cost, lower_bound,
+        test_eval.count, loaded - started, solved - loaded
+    )
+
+def solve_job(task):
+    """
+    Solve an instance in a worker process with solve(), stopping early on
+    cancellation.  Progress events go to the <events> queue as
+    (job_id, event), at most every PROGRESS_INTERVAL seconds, and carry the
+    best feasible routes whenever they improved since the last event.
+    Returns the final event.
+    """
+    job_id, instance, settings, events, cancel = task
+    started = time.time()
+    events.put((job_id, {'event': 'started'}))
+
+    last = {'time': 0.0, 'sent': None}
+
+    def report(sa, best, best_cost, lower_bound):
+        now = time.time()
+        if now - last['time'] < PROGRESS_INTERVAL:
+            return
+        last['time'] = now
+        event = {
+            'event': 'progress',
+            'cost': sa.cur_cost,
+            'feasible': sa.feasible,
+            'best_cost': best_cost,
+            'temperature': sa.cur_temp,
+            'gap': lower_bound.gap(best_cost) if best_cost is not None else None,
+            'iteration': sa.cur_iter,
+            'elapsed': now - started
+        }
+        if best is not None and best is not last['sent']:
+            event['routes'] = encode_solution(best)
+            last['sent'] = best
+        events.put((job_id, event))
+
+    result = solve(instance, settings, progress=report, should_stop=cancel.is_set)
+    return {
+        'event': 'done',
+        'cost': result.cost,
+        'feasible': result.feasible,
+        'gap': result.lower_bound.gap(result.cost) if result.feasible else None,
+        'cancelled': cancel.is_set(),
+        'elapsed': time.time() - started,
+        'routes': encode_solution(result.solution)
+    }
+
+class Job:
+    def __init__(self, job_id, instance, settings):
+        self.id = job_id
+        self.instance = instance
+        self.settings = settings
+        self.state = QUEUED
+        self.future = None
+        self.cancel = None
+        self.progress = None
+        self.best = None
+        self.result = None
+        self.error = None
+        self.watchers = set()
+
+    def describe(self):
+        return {'job': self.id, 'state': self.state, 'progress': self.progress, 'error': self.error}
+
+class SolveService:
+    """
+    A long running solve service.  Jobs run in a pool of worker processes,
+    each of which keeps the simulators of the instances it has solved
+    (parallel.instance_simulator()), so a repeated instance costs neither
+    process startup nor data loading.  Workers stream progress events
+    through a shared queue, which a single task of the event loop pumps to
+    the jobs and to everyone watching them.
+    Cancelling a queued job drops it, while a running job is asked to stop
+    and finishes with its best solution so far.
+    """
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.jobs = {}
+        self.ids = itertools.count(1)
+        self.pool = None
+        self.manager = None
+        self.events = None
+        self.pump = None
+
+    def start(self):
+        self.manager = Manager()
+        self.events = self.manager.Queue()
+        self.pool = ProcessPoolExecutor(self.workers)
+        self.pump = asyncio.ensure_future(self._pump())
+
+    async def close(self):
+        for job in self.jobs.values():
+            if job.state in (QUEUED, RUNNING):
+                self.cancel(job.id)
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.events.put(None)
+        await self.pump
+        self.manager.shutdown()
+
+    async def _pump(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await loop.run_in_executor(None, self.events.get)
+            if item is None:
+                return
+            job_id, event = item
+            job = self.jobs.get(job_id)
+            if job is None or job.state not in (QUEUED, RUNNING):
+                continue
+            job.state = RUNNING
+            if event['event'] == 'progress':
+                if 'routes' in event:
+                    job.best = {'cost': event['best_cost'], 'routes': event.pop('routes')}
+                job.progress = event
+            self._publish(job, event)
+
+    def _publish(self, job, event):
+        event = dict(event, job=job.id)
+        for watcher in job.watchers:
+            watcher.put_nowait(event)
+
+    def submit(self, instance, settings=None):
+        unknown = set(settings or {}) - set(SOLVE_DEFAULTS)
+        if unknown:
+            raise ValueError('Unknown settings: %s' % ', '.join(sorted(unknown)))
+        job = Job(next(self.ids), instance, dict(SOLVE_DEFAULTS, **(settings or {})))
+        job.cancel = self.manager.Event()
+        job.future = self.pool.submit(solve_job, (job.id, instance, job.settings, self.events, job.cancel))
+        self.jobs[job.id] = job
+        asyncio.ensure_future(self._finish(job))
+        return job
+
+    async def _finish(self, job):
+        try:
+            job.result = await asyncio.wrap_future(job.future)
+        except asyncio.CancelledError:
+            job.state = CANCELLED
+            event = {'event': CANCELLED}
+        except Exception as e:
+            logging.warning('Job %d failed: %s' % (job.id, e))
+            job.state = FAILED
+            job.error = str(e)
+            event = {'event': FAILED, 'error': job.error}
+        else:
+            job.state = CANCELLED if job.result['cancelled'] else DONE
+            job.best = {'cost': job.result['cost'], 'routes': job.result['routes']}
+            event = job.result
+        self._publish(job, event)
+        for watcher in job.watchers:
+            watcher.put_nowait(None)
+
+    def job(self, job_id):
+        if job_id not in self.jobs:
+            raise KeyError('Unknown job: %s' % job_id)
+        return self.jobs[job_id]
+
+    def cancel(self, job_id):
+        job = self.job(job_id)
+        if job.state in (QUEUED, RUNNING) and not job.future.cancel():
+            job.cancel.set()
+        return job
+
+    async def watch(self, job_id):
+        """Yield the events of a job until it ends, starting with its latest progress."""
+        job = self.job(job_id)
+        if job.state not in (QUEUED, RUNNING):
+            yield dict(job.result or {'event': job.state, 'error': job.error}, job=job.id)
+            return
+        watcher = asyncio.Queue()
+        job.watchers.add(watcher)
+        try:
+            if job.progress is not None:
+                yield dict(job.progress, job=job.id)
+            while True:
+                event = await watcher.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            job.watchers.discard(watcher)
+
+    async def handle(self, reader, writer):
+        """
+        Serve a connection speaking JSON lines.  Each request is an object
+        with an 'op':
+            submit: queue a job for 'instance' (see parallel.INSTANCE_DEFAULTS)
+                with solver 'settings' (see SOLVE_DEFAULTS), and stream its
+                events when 'watch' is true.
+            watch: stream the events of 'job' until it ends.
+            status: the state and latest progress of 'job'.
+            best: the best routes of 'job' so far.
+            cancel: cancel 'job'.
+            jobs: the state of every job.
+        Errors are answered with an object holding an 'error'.  A connection
+        watching a job answers nothing else until the job ends.
+        """
+        async def send(message):
+            writer.write((json.dumps(message) + '\n').encode())
+            await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    op = request.get('op')
+                    if op == 'submit':
+                        job = self.submit(request['instance'], request.get('settings'))
+                        await send(job.describe())
+                        if request.get('watch'):
+                            async for event in self.watch(job.id):
+                                await send(event)
+                    elif op == 'watch':
+                        async for event in self.watch(request['job']):
+                            await send(event)
+                    elif op == 'status':
+                        await send(self.job(request['job']).describe())
+                    elif op == 'best':
+                        job = self.job(request['job'])
+                        await send(dict(job.best or {'cost': None, 'routes': None}, job=job.id, state=job.state))
+                    elif op == 'cancel':
+                        await send(self.cancel(request['job']).describe())
+                    elif op == 'jobs':
+                        await send({'jobs': [job.describe() for job in self.jobs.values()]})
+                    else:
+                        raise ValueError('Unknown operation: %s' % op)
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    await send({'error': str(e)})
+        except (ConnectionError, asyncio.CancelledError):
+            # The connection went away, or the server is shutting down.
+            pass
+        finally:
+            writer.close()
+
+async def serve(host='127.0.0.1', port=8765, path=None, workers=None):
+    """Run the service on a TCP port, or on a Unix socket at path, until cancelled."""
+    service = SolveService(workers)
+    service.start()
+    if path is not None:
+        server = await asyncio.start_unix_server(service.handle, path)
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve route optimization jobs over JSON lines.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='serve on a Unix socket at this path instead of TCP')
+    parser.add_argument('--workers', type=int, help='number of worker processes (default: all cores)')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
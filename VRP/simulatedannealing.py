@@ -1,7 +1,9 @@
 from neighborhoodoperators import NeighborhoodOperators
 from helpers import print_progress_bar
+from convergence import ConvergenceTracer
 import random
 import math
+import time
 
 try:
     from matplotlib import pyplot as plt
@@ -42,7 +44,7 @@ class SimulatedAnnealing:
         As with other heuristics, there is no guarantee that the global
         optima will be found.
     """
-    def __init__(self, test_eval_func, init_solution, init_temp, final_temp, iter_per_temp=100, alpha=10):
+    def __init__(self, test_eval_func, init_solution, init_temp, final_temp, iter_per_temp=100, alpha=10, lower_bound=None, gap_threshold=None, verbose=True, time_limit=None, robustness=None, robustness_weight=1.0, progress=None, should_stop=None, telemetry=None, memory_profiler=None, convergence=None):
         self.test_eval = test_eval_func
         self.solution = init_solution
         self.cur_feas, self.cur_cost = test_eval_func(init_solution)
@@ -54,8 +56,37 @@ class SimulatedAnnealing:
         self.cur_iter = 0
         self.exp_iter = self.calc_iterations()
         self.feasible = all(self.cur_feas)
+        self.lower_bound = lower_bound
+        self.gap_threshold = gap_threshold
+        self.verbose = verbose
+        self.time_limit = time_limit
+        self.start_time = None
+        # An optional secondary objective: robustness_weight miles are added
+        # to the cost per expected deadline miss under travel-time noise, as
+        # estimated by a RobustnessEvaluator.
+        self.robustness = robustness
+        self.robustness_weight = robustness_weight
+        self.cur_risk = robustness.expected_misses(init_solution) if robustness is not None else 0.0
+        # Hooks for callers running the search in the background:
+        # progress(self) is called after every temperature step, and the
+        # search stops as soon as should_stop() returns True.
+        self.progress = progress
+        self.should_stop = should_stop
+        # An optional Telemetry, counting operators, evaluations, constraint
+        # failures and acceptance per temperature.
+        self.telemetry = telemetry
+        # An optional MemoryProfiler, snapshotting traced memory at
+        # temperature boundaries.
+        self.memory_profiler = memory_profiler
+        # The convergence of the search, a ConvergenceTracer that keeps a
+        # bounded, downsampled history in memory, and streams every
+        # temperature step to a file when it was given a path.
+        self.convergence = convergence if convergence is not None else ConvergenceTracer()
 
-        self.plot_costs = []
+    @property
+    def plot_costs(self):
+        """The current cost at the temperature steps of the downsampled history."""
+        return [record.cost for record in self.convergence.records()]
 
     def decrement_temp(self):
         """Decrement the current temperature according to a geometric reduction."""
@@ -74,21 +105,57 @@ class SimulatedAnnealing:
             cur_temp *= self.alpha
         return i
 
+    def gap(self):
+        """Return the optimality gap of the current solution, or None when
+        no lower bound was given or the current solution is infeasible."""
+        if self.lower_bound is None or not self.feasible:
+            return None
+        return self.lower_bound.gap(self.cur_cost)
+
     def isTerminationCriteriaMet(self):
         """Return True when the current temperature is less than or equal to
-        the specified final temperature."""
+        the specified final temperature, when the current solution is
+        within the gap threshold of the lower bound, when the time limit
+        in seconds has passed, or when should_stop() returns True."""
+        if self.should_stop is not None and self.should_stop():
+            return True
+        if self.time_limit is not None and time.time() - self.start_time >= self.time_limit:
+            return True
+        if self.gap_threshold is not None:
+            gap = self.gap()
+            if gap is not None and gap <= self.gap_threshold:
+                return True
         return self.cur_temp <= self.final_temp
 
     def plot_cost_graph(self):
         if plt is None:
             raise ImportError('Must install matplotlib to plot route.')
 
-        plt.plot(list(range(len(self.plot_costs))), self.plot_costs)
+        records = self.convergence.records()
+        plt.plot([record.iteration for record in records], [record.cost for record in records])
         plt.xlabel('Iteration')
         plt.ylabel('Cost')
         plt.show()
 
     def run(self):
+        """
+        Anneal the solution and return it.  The memory profiler is stopped
+        and the convergence tracer closed however the run ends.
+        """
+        self.start_time = time.time()
+        if self.memory_profiler is not None:
+            self.memory_profiler.start()
+        try:
+            self._anneal()
+        finally:
+            if self.memory_profiler is not None:
+                self.memory_profiler.stop()
+            self.convergence.close()
+        if self.telemetry is not None:
+            self.telemetry.finish()
+        return self.solution
+
+    def _anneal(self):
         cur_prog = 0.0
         # Continue looping until the initial temperature reduces down below the
         # final temperature as set by the SimulatedAnnealing object instantiation
@@ -105,8 +172,10 @@ class SimulatedAnnealing:
             # O(1)
             self.cur_iter += 1
             new_prog = round(self.cur_iter/self.exp_iter, 2)
-            if new_prog > cur_prog or self.cur_iter == self.exp_iter:
-                print_progress_bar(self.cur_iter, self.exp_iter, decimals=0)
+            if self.verbose and (new_prog > cur_prog or self.cur_iter == self.exp_iter):
+                gap = self.gap()
+                suffix = f'gap {gap:.1%}' if gap is not None else ''
+                print_progress_bar(self.cur_iter, self.exp_iter, decimals=0, suffix=suffix)
                 cur_prog = new_prog
             # For each discrete temperature, run the neighborhood generation
             # and solution comparison steps for a specified number of iterations
@@ -119,7 +188,7 @@ class SimulatedAnnealing:
                 # Runtime complexity is determined by the specific operators
                 # used to generate the neighborhood, but this implementation is
                 # sadly Θ(n) due to copying of list-based routes.
-                neighbors = NeighborhoodOperators.generate_neighbors(self.solution)
+                neighbors = NeighborhoodOperators.generate_neighbors(self.solution, self.telemetry)
                 # Choose the first neighbor solution from the neighborhood
                 # generator function.  The generator randomly chooses the type
                 # of solution-modulating operator that is applied to create
@@ -135,9 +204,19 @@ class SimulatedAnnealing:
                 # meaning solutions that do not satisfy all problem constraints.
                 # O(n)
                 cur_cost = self.cur_cost
-                new_feas, new_cost = self.test_eval(new_solution, return_early=True)
+                if self.telemetry is None:
+                    new_feas, new_cost = self.test_eval(new_solution, return_early=True)
+                else:
+                    start = time.process_time()
+                    new_feas, new_cost = self.test_eval(new_solution, return_early=True)
+                    self.telemetry.evaluated(new_feas, time.process_time() - start)
                 cur_cost_adj, new_cost_adj = cur_cost, new_cost
                 feasible = all(new_feas)
+                new_risk = 0.0
+                if self.robustness is not None and feasible:
+                    new_risk = self.robustness.expected_misses(new_solution)
+                    new_cost_adj += self.robustness_weight*new_risk
+                    cur_cost_adj += self.robustness_weight*self.cur_risk
                 if not feasible:
                     new_cost_adj += self.init_temp*1000
                 if not self.feasible:
@@ -152,6 +231,9 @@ class SimulatedAnnealing:
                     self.solution = new_solution
                     self.feasible = feasible
                     self.cur_cost = new_cost
+                    self.cur_risk = new_risk
+                    if self.telemetry is not None:
+                        self.telemetry.accepted(delta_cost < 0)
                 # Per the simulated annealing algorithm, if the new solution
                 # is not better, accept it with a probability of e^(-delta_cost/temp).
                 # To do this we generate a random value [0,1] and compare it to
@@ -162,10 +244,18 @@ class SimulatedAnnealing:
                         self.solution = new_solution
                         self.feasible = feasible
                         self.cur_cost = new_cost
+                        self.cur_risk = new_risk
+                        if self.telemetry is not None:
+                            self.telemetry.accepted(False)
             # Decrement the temperature according to the geometric function
             # temp = temp*alpha where alpha is a value less than 1 set during
             # the SimulatedAnnealing object instantiation.
             # O(1)
-            self.plot_costs.append(self.cur_cost)
+            self.convergence.record(self.cur_iter, self.cur_temp, self.cur_cost, self.feasible)
+            if self.telemetry is not None:
+                self.telemetry.temperature_done(self.cur_temp, self.cur_cost, self.feasible)
+            if self.memory_profiler is not None:
+                self.memory_profiler.temperature_done(self.cur_temp)
             self.decrement_temp()
-        return self.solution
+            if self.progress is not None:
+                self.progress(self)
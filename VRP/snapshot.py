@@ -0,0 +1,147 @@
+from location import Location
+from package import Package
+from distancematrix import DistanceMatrix
+from hashtable import build_table
+from array import array
+from datetime import datetime, timedelta
+import json
+import os
+import struct
+import sys
+
+def seconds_of_day(dt):
+    return dt.hour * 3600 + dt.minute * 60 + dt.second
+
+class InstanceSnapshot:
+    """
+    A compiled problem instance, stored as flat typed arrays so that it can
+    be written to and read from a compact binary file far faster than the
+    source CSV files can be parsed, the special notes of every package
+    re-interpreted, and the distance matrix closed under shortest paths.
+    Times are stored as seconds since midnight and combined with the date of
+    the start of the day on restore, so a snapshot stays valid across days.
+    Packages that are available at the start of the day store an earliest
+    load of -1, as the start of the day is a simulator setting rather than
+    instance data.
+    The file starts with a magic string, a format version and the length of
+    a JSON section, which holds the text columns and the name, type code and
+    length of every array.  The raw bytes of the arrays follow in that
+    order, so loading a snapshot never executes anything from the file.  A
+    snapshot written by a different version, or that does not parse, is
+    ignored rather than misread.
+    """
+    MAGIC = b'VRPSNAP\0'
+    VERSION = 2
+    HEADER = struct.Struct('<8sII')
+    TEXT_COLUMNS = ('location_text', 'package_notes')
+    TYPECODES = ('q', 'd')
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    @staticmethod
+    def compile(package_table, location_table, distance_table, start_of_day):
+        locations = list(location_table.values())
+        packages = list(package_table.values())
+        columns = {
+            'location_ids': array('q', [loc.id for loc in locations]),
+            'location_lat': array('d', [loc.coords[0] for loc in locations]),
+            'location_lon': array('d', [loc.coords[1] for loc in locations]),
+            'location_text': [(loc.address, loc.city, loc.state, loc.zipcode) for loc in locations],
+            'distance_ids': array('q', distance_table.ids),
+            'distances': array('d', (float(d) for row in distance_table.values for d in row)),
+            'package_ids': array('q', [p.id for p in packages]),
+            'package_location_ids': array('q', [p.delivery_location.id for p in packages]),
+            'package_deadlines': array('q', [seconds_of_day(p.delivery_deadline) for p in packages]),
+            'package_earliest_loads': array('q'),
+            'package_masses': array('q', [p.mass for p in packages]),
+            'package_notes': [p.notes for p in packages],
+            'package_required_trucks': array('q', [p.required_truck_number or 0 for p in packages]),
+            'linked_offsets': array('q', [0]),
+            'linked_ids': array('q'),
+        }
+        for p in packages:
+            columns['package_earliest_loads'].append(-1 if p.earliest_load == start_of_day else seconds_of_day(p.earliest_load))
+            columns['linked_ids'].extend(p.linked_package_ids)
+            columns['linked_offsets'].append(len(columns['linked_ids']))
+        return InstanceSnapshot(columns)
+
+    def save(self, path):
+        arrays = [(name, column) for name, column in sorted(self.columns.items()) if name not in InstanceSnapshot.TEXT_COLUMNS]
+        meta = json.dumps({
+            'byteorder': sys.byteorder,
+            'arrays': [[name, column.typecode, len(column)] for name, column in arrays],
+            'text': {name: self.columns[name] for name in InstanceSnapshot.TEXT_COLUMNS}
+        }).encode('utf-8')
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(InstanceSnapshot.HEADER.pack(InstanceSnapshot.MAGIC, InstanceSnapshot.VERSION, len(meta)))
+            f.write(meta)
+            for _, column in arrays:
+                column.tofile(f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        """Return the snapshot at path, or None if it is missing, stale or malformed."""
+        try:
+            with open(path, 'rb') as f:
+                magic, version, meta_size = InstanceSnapshot.HEADER.unpack(f.read(InstanceSnapshot.HEADER.size))
+                if magic != InstanceSnapshot.MAGIC or version != InstanceSnapshot.VERSION:
+                    return None
+                meta = json.loads(f.read(meta_size).decode('utf-8'))
+                columns = {name: meta['text'][name] for name in InstanceSnapshot.TEXT_COLUMNS}
+                for name, typecode, length in meta['arrays']:
+                    if typecode not in InstanceSnapshot.TYPECODES:
+                        return None
+                    column = array(typecode)
+                    data = f.read(length * column.itemsize)
+                    if len(data) != length * column.itemsize:
+                        return None
+                    column.frombytes(data)
+                    if meta['byteorder'] != sys.byteorder:
+                        column.byteswap()
+                    columns[name] = column
+        except (OSError, struct.error, ValueError, KeyError, TypeError):
+            return None
+        columns['location_text'] = [tuple(text) for text in columns['location_text']]
+        return InstanceSnapshot(columns)
+
+    def restore(self, start_of_day, table_type=None):
+        """Rebuild the package, location and distance tables."""
+        c = self.columns
+        midnight = datetime(start_of_day.year, start_of_day.month, start_of_day.day)
+
+        n = len(c['distance_ids'])
+        flat = c['distances']
+        distances = DistanceMatrix(c['distance_ids'], [flat[i*n:(i+1)*n].tolist() for i in range(n)])
+
+        locations = []
+        for i, location_id in enumerate(c['location_ids']):
+            address, city, state, zipcode = c['location_text'][i]
+            locations.append((location_id, Location(
+                location_id, address, city, state, zipcode,
+                c['location_lat'][i], c['location_lon'][i],
+                distances[location_id]
+            )))
+        locations = build_table(locations, table_type)
+
+        packages = []
+        offsets = c['linked_offsets']
+        for i, package_id in enumerate(c['package_ids']):
+            package = Package(
+                package_id,
+                locations[c['package_location_ids'][i]],
+                start_of_day,
+                midnight + timedelta(seconds=c['package_deadlines'][i]),
+                c['package_masses'][i],
+                c['package_notes'][i],
+                parse_notes=False
+            )
+            if c['package_earliest_loads'][i] >= 0:
+                package.earliest_load = midnight + timedelta(seconds=c['package_earliest_loads'][i])
+            package.required_truck_number = c['package_required_trucks'][i] or None
+            package.linked_package_ids = c['linked_ids'][offsets[i]:offsets[i+1]].tolist()
+            packages.append((package_id, package))
+
+        return build_table(packages, table_type), locations, distances
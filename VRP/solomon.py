@@ -0,0 +1,101 @@
+from dataloader import DataLoader
+from distancematrix import DistanceMatrix
+from hashtable import build_table
+from location import Location
+from package import Package
+from collections import namedtuple
+from datetime import timedelta
+from math import hypot
+
+SolomonInstance = namedtuple('SolomonInstance', ['name', 'vehicles', 'capacity', 'packages_per_trip', 'depot_id', 'service_total', 'data'])
+
+# One unit of distance is driven in one unit of time, taken as a minute, so
+# a simulator of an adapted instance runs at SOLOMON_SPEED miles per hour.
+SOLOMON_SPEED = 60
+
+def read_solomon(path):
+    """
+    Parse a Solomon or Gehring-Homberger instance file.  Returns the name,
+    the number of vehicles, their capacity and the customer rows as
+    (id, x, y, demand, ready, due, service), the depot first.
+    """
+    with open(path) as f:
+        lines = [line.split() for line in f]
+    lines = [line for line in lines if line]
+    name = lines[0][0]
+    vehicles = capacity = None
+    customers = []
+    for i, line in enumerate(lines):
+        if line[0].upper() == 'VEHICLE':
+            vehicles, capacity = int(lines[i+2][0]), int(lines[i+2][1])
+        elif len(line) == 7 and all(value.replace('.', '', 1).isdigit() for value in line):
+            customer_id, x, y, demand, ready, due, service = line
+            customers.append((int(customer_id), float(x), float(y), int(float(demand)), float(ready), float(due), float(service)))
+    if vehicles is None or not customers:
+        raise ValueError('Not a Solomon instance file: %s' % path)
+    return name, vehicles, capacity, customers
+
+def load_solomon(path, start_of_day, table_type=None):
+    """
+    Adapt a Solomon or Gehring-Homberger CVRPTW instance into a
+    DataLoader.Data, to be given to DeliverySimulator as data.  The
+    simulator's model differs from the standard one, so the adapted instance
+    is close to, but not the same as, the published problem:
+    - Every customer is one package, delivered to a location of its own,
+      with the due date as its deadline.  Location coordinates are (x, y).
+    - Service times are folded into the distances, as d(i, j) + service(i)
+      for a customer i, so deadlines are checked against the true arrival
+      times.  Every customer is left exactly once, so this adds the constant
+      service_total to the cost of every solution.
+    - Truck capacity counts packages rather than demand, so
+      packages_per_trip is the capacity over the mean demand.
+    - Ready times are not modelled, as trucks never wait at a customer, and
+      trucks can make more than one trip.
+    Euclidean distances are kept at full precision.
+    """
+    name, vehicles, capacity, customers = read_solomon(path)
+    depot_id = customers[0][0]
+    ids = [c[0] for c in customers]
+    service = {c[0]: c[6] for c in customers}
+    values = [
+        [0.0 if a[0] == b[0] else hypot(a[1] - b[1], a[2] - b[2]) + (service[a[0]] if a[0] != depot_id else 0.0) for b in customers]
+        for a in customers
+    ]
+    distances = DistanceMatrix(ids, values)
+
+    locations = build_table([
+        (c[0], Location(c[0], 'Customer %d' % c[0], name, '', '', c[1], c[2], distances[c[0]]))
+        for c in customers
+    ], table_type)
+    packages = build_table([
+        (c[0], Package(c[0], locations[c[0]], start_of_day, start_of_day + timedelta(minutes=c[5]), c[3], '', parse_notes=False))
+        for c in customers[1:]
+    ], table_type)
+
+    demands = [c[3] for c in customers[1:]]
+    packages_per_trip = max(1, int(capacity / (sum(demands) / len(demands)))) if demands and sum(demands) else capacity
+    service_total = sum(c[6] for c in customers[1:])
+    data = DataLoader.Data(packages, locations, distances)
+    return SolomonInstance(name, vehicles, capacity, packages_per_trip, depot_id, service_total, data)
+
+def travel_distance(a, b):
+    """
+    The Euclidean distance between two locations of an adapted instance,
+    without the service time folded into its distance table.
+    """
+    return hypot(a.coords[0] - b.coords[0], a.coords[1] - b.coords[1])
+
+def trip_demands(solution):
+    """Return the total demand (package mass) of every trip of a solution."""
+    demands = []
+    for route in solution:
+        demand = 0
+        for step in route.gen_steps():
+            if type(step) is Package:
+                demand += step.mass
+            elif demand:
+                demands.append(demand)
+                demand = 0
+        if demand:
+            demands.append(demand)
+    return demands
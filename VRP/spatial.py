@@ -0,0 +1,195 @@
+from math import radians, sin, cos, asin, sqrt, ceil, floor
+
+try:
+    import numpy as np
+except:
+    np = None
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE = radians(1) * EARTH_RADIUS_MILES
+
+def haversine(coords1, coords2):
+    """Great-circle distance in miles between two (lat, lon) pairs."""
+    lat1, lon1 = radians(coords1[0]), radians(coords1[1])
+    lat2, lon2 = radians(coords2[0]), radians(coords2[1])
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * asin(sqrt(min(a, 1.0)))
+
+def equirectangular(coords1, coords2):
+    """
+    Planar approximation of the distance in miles between two (lat, lon)
+    pairs, accurate over the extent of a single service area and cheaper
+    than haversine().
+    """
+    lat1, lon1 = radians(coords1[0]), radians(coords1[1])
+    lat2, lon2 = radians(coords2[0]), radians(coords2[1])
+    x = (lon2 - lon1) * cos((lat1 + lat2) / 2)
+    y = lat2 - lat1
+    return EARTH_RADIUS_MILES * sqrt(x * x + y * y)
+
+def coordinate_distances(coords, method='haversine', road_factor=1.0):
+    """
+    The matrix of distances in miles between every pair of (lat, lon)
+    coordinates, scaled by road_factor to approximate the detour of roads
+    over a straight line.  Vectorized with NumPy when it is installed,
+    otherwise returned as a list of lists.
+    """
+    if method not in ('haversine', 'equirectangular'):
+        raise ValueError('Unknown coordinate distance method: %s' % method)
+    if np is None:
+        func = haversine if method == 'haversine' else equirectangular
+        return [[road_factor * func(a, b) for b in coords] for a in coords]
+
+    rad = np.radians(np.asarray(coords, dtype=np.float64).reshape(-1, 2))
+    lat, lon = rad[:, 0], rad[:, 1]
+    dlat = lat[None, :] - lat[:, None]
+    dlon = lon[None, :] - lon[:, None]
+    if method == 'haversine':
+        a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2) ** 2
+        dists = 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+    else:
+        x = dlon * np.cos((lat[:, None] + lat[None, :]) / 2)
+        dists = EARTH_RADIUS_MILES * np.sqrt(x * x + dlat * dlat)
+    return road_factor * dists
+
+class GridIndex:
+    """
+    A uniform grid spatial index over (lat, lon) points for nearest neighbor
+    and radius queries.  Points are projected onto a plane in miles around
+    the mean latitude, and bucketed into square cells of cell_size miles.
+    A query only scans the rings of cells around the query point until no
+    closer point can exist outside of them, so queries are O(1) on average
+    for evenly spread locations rather than O(n).
+    """
+    def __init__(self, points, cell_size=0.5):
+        """<points> is an iterable of (key, (lat, lon)) pairs."""
+        points = list(points)
+        self.cell_size = cell_size
+        lats = [coords[0] for _, coords in points]
+        self.ref_lat = radians(sum(lats) / len(lats)) if lats else 0.0
+        self.cells = {}
+        self.points = {}
+        # The number of non-empty cells in every column and row of the grid,
+        # and the bounds (min x, max x, min y, max y) of the non-empty cells,
+        # kept up to date so that a query knows how far to search in O(1).
+        self.columns = {}
+        self.rows = {}
+        self.bounds = None
+        for key, coords in points:
+            self.insert(key, coords)
+
+    @staticmethod
+    def from_locations(locations, cell_size=0.5):
+        return GridIndex(((loc.id, loc.coords) for loc in locations), cell_size)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _project(self, coords):
+        return (coords[1] * MILES_PER_DEGREE * cos(self.ref_lat), coords[0] * MILES_PER_DEGREE)
+
+    def _cell(self, xy):
+        return (floor(xy[0] / self.cell_size), floor(xy[1] / self.cell_size))
+
+    def insert(self, key, coords):
+        xy = self._project(coords)
+        self.points[key] = xy
+        cell = self._cell(xy)
+        if cell not in self.cells:
+            self.cells[cell] = []
+            x, y = cell
+            self.columns[x] = self.columns.get(x, 0) + 1
+            self.rows[y] = self.rows.get(y, 0) + 1
+            if self.bounds is None:
+                self.bounds = [x, x, y, y]
+            else:
+                b = self.bounds
+                b[0], b[1], b[2], b[3] = min(b[0], x), max(b[1], x), min(b[2], y), max(b[3], y)
+        self.cells[cell].append(key)
+
+    def remove(self, key):
+        xy = self.points.pop(key)
+        cell = self._cell(xy)
+        keys = self.cells[cell]
+        keys.remove(key)
+        if keys:
+            return
+        del self.cells[cell]
+        x, y = cell
+        self.columns[x] -= 1
+        if not self.columns[x]:
+            del self.columns[x]
+        self.rows[y] -= 1
+        if not self.rows[y]:
+            del self.rows[y]
+        if not self.cells:
+            self.bounds = None
+            return
+        # A bound only moves inwards past empty columns or rows, which takes
+        # amortized O(1) steps per removal.
+        b = self.bounds
+        while b[0] not in self.columns:
+            b[0] += 1
+        while b[1] not in self.columns:
+            b[1] -= 1
+        while b[2] not in self.rows:
+            b[2] += 1
+        while b[3] not in self.rows:
+            b[3] -= 1
+
+    def _ring(self, center, r):
+        cx, cy = center
+        if r == 0:
+            yield center
+            return
+        for dx in range(-r, r + 1):
+            yield (cx + dx, cy - r)
+            yield (cx + dx, cy + r)
+        for dy in range(-r + 1, r):
+            yield (cx - r, cy + dy)
+            yield (cx + r, cy + dy)
+
+    def nearest(self, coords, k=1, exclude=None):
+        """
+        Return up to k (distance, key) pairs closest to coords, nearest
+        first, skipping any keys in exclude.
+        """
+        if not self.points:
+            return []
+        xy = self._project(coords)
+        center = self._cell(xy)
+        min_x, max_x, min_y, max_y = self.bounds
+        max_r = max(abs(center[0] - min_x), abs(center[0] - max_x), abs(center[1] - min_y), abs(center[1] - max_y))
+
+        found = []
+        for r in range(max_r + 1):
+            for cell in self._ring(center, r):
+                for key in self.cells.get(cell, ()):
+                    if exclude is not None and key in exclude:
+                        continue
+                    px, py = self.points[key]
+                    found.append((sqrt((px - xy[0]) ** 2 + (py - xy[1]) ** 2), key))
+            # Any point outside of the scanned rings is at least r cells
+            # away from the query point.
+            if len(found) >= k:
+                found.sort()
+                if found[k-1][0] <= r * self.cell_size:
+                    break
+        found.sort()
+        return found[:k]
+
+    def within(self, coords, radius):
+        """Return the (distance, key) pairs within radius miles of coords."""
+        xy = self._project(coords)
+        cx, cy = self._cell(xy)
+        r = ceil(radius / self.cell_size)
+        found = []
+        for x in range(cx - r, cx + r + 1):
+            for y in range(cy - r, cy + r + 1):
+                for key in self.cells.get((x, y), ()):
+                    px, py = self.points[key]
+                    dist = sqrt((px - xy[0]) ** 2 + (py - xy[1]) ** 2)
+                    if dist <= radius:
+                        found.append((dist, key))
+        found.sort()
+        return found
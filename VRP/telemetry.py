@@ -0,0 +1,153 @@
+from deliverysimulator import Constraint
+from collections import namedtuple
+import json
+import time
+
+# Counters of a neighborhood operator.
+OPERATOR_COUNTERS = ('proposed', 'none', 'feasible', 'accepted', 'improved')
+
+# Consecutive temperature steps, from the first step's temperature to the
+# last's, with the moves proposed and accepted in them and the cost and
+# feasibility the last one ended on.
+TemperatureStats = namedtuple('TemperatureStats', ['temperature', 'last_temperature', 'steps', 'proposed', 'accepted', 'cost', 'feasible'])
+
+def _merge(first, second):
+    return TemperatureStats(
+        first.temperature, second.last_temperature, first.steps + second.steps,
+        first.proposed + second.proposed, first.accepted + second.accepted,
+        second.cost, second.feasible
+    )
+
+class Telemetry:
+    """
+    Counters of a search, to find out which operators and constraints its
+    time goes to.  Given to NeighborhoodOperators.generate_neighbors() and
+    SimulatedAnnealing as telemetry, it keeps:
+    - Per operator: how often it was called (proposed), how often it had no
+      move to make (none), and of the neighbors it made how many were
+      feasible, accepted and improving, with the CPU seconds it took.
+    - The number of solutions evaluated, and the CPU seconds taken.
+    - Per constraint (by its Constraint name), how often an evaluated
+      neighbor failed it.  Neighbors are evaluated with return_early, so
+      only the first failed constraint of a neighbor is counted.
+    - Per temperature step, the moves proposed and accepted.  At most
+      capacity TemperatureStats are kept: when they fill up, every pair of
+      neighboring ones is merged, and from then on each one collects twice
+      as many steps, so the history always spans the whole run.
+    callback(event) receives a progress event dict at most every interval
+    seconds, and a summary event when the search ends.
+    """
+    def __init__(self, callback=None, interval=1.0, capacity=1024):
+        if capacity < 2 or capacity % 2:
+            raise ValueError('Capacity must be an even number of at least 2.')
+        self.callback = callback
+        self.interval = interval
+        self.operators = {}
+        self.evaluations = 0
+        self.evaluation_seconds = 0.0
+        self.constraint_failures = {}
+        self.temperatures = []
+        self.capacity = capacity
+        # Temperature steps per TemperatureStats.
+        self.steps = 1
+        self.started = time.time()
+        self.last_event = 0.0
+        # The operator of the neighbor being evaluated.
+        self.operator = None
+        self._proposed = 0
+        self._accepted = 0
+
+    def _stats(self, name):
+        stats = self.operators.get(name)
+        if stats is None:
+            stats = self.operators[name] = dict.fromkeys(OPERATOR_COUNTERS, 0)
+            stats['cpu_seconds'] = 0.0
+        return stats
+
+    def operator_called(self, name, seconds, neighbor):
+        stats = self._stats(name)
+        stats['proposed'] += 1
+        stats['cpu_seconds'] += seconds
+        if not neighbor:
+            stats['none'] += 1
+        else:
+            self.operator = name
+
+    def evaluated(self, feas, seconds):
+        self.evaluations += 1
+        self.evaluation_seconds += seconds
+        self._proposed += 1
+        if all(feas):
+            self._stats(self.operator)['feasible'] += 1
+        else:
+            for i, value in enumerate(feas):
+                if value is False:
+                    name = Constraint(i).name
+                    self.constraint_failures[name] = self.constraint_failures.get(name, 0) + 1
+
+    def accepted(self, improved):
+        stats = self._stats(self.operator)
+        stats['accepted'] += 1
+        self._accepted += 1
+        if improved:
+            stats['improved'] += 1
+
+    def evaluations_per_second(self):
+        elapsed = time.time() - self.started
+        return self.evaluations / elapsed if elapsed > 0 else None
+
+    def temperature_done(self, temperature, cost, feasible):
+        """Close a temperature step, and send a progress event if one is due."""
+        step = TemperatureStats(temperature, temperature, 1, self._proposed, self._accepted, cost, feasible)
+        self._proposed = self._accepted = 0
+        temperatures = self.temperatures
+        if temperatures and temperatures[-1].steps < self.steps:
+            temperatures[-1] = _merge(temperatures[-1], step)
+        else:
+            if len(temperatures) == self.capacity:
+                self.temperatures = temperatures = [_merge(a, b) for a, b in zip(temperatures[::2], temperatures[1::2])]
+                self.steps *= 2
+            temperatures.append(step)
+        now = time.time()
+        if self.callback is not None and now - self.last_event >= self.interval:
+            self.last_event = now
+            self.callback({
+                'event': 'progress',
+                'elapsed': now - self.started,
+                'temperature': temperature,
+                'cost': cost,
+                'feasible': feasible,
+                'acceptance_rate': step.accepted / step.proposed if step.proposed else None,
+                'evaluations': self.evaluations,
+                'evaluations_per_second': self.evaluations_per_second()
+            })
+
+    def finish(self):
+        if self.callback is not None:
+            self.callback(dict(self.summary(), event='summary'))
+
+    def summary(self):
+        """Return every counter as a JSON-serializable dict."""
+        return {
+            'elapsed': time.time() - self.started,
+            'evaluations': self.evaluations,
+            'evaluation_cpu_seconds': self.evaluation_seconds,
+            'evaluations_per_second': self.evaluations_per_second(),
+            'operators': self.operators,
+            'constraint_failures': self.constraint_failures,
+            'acceptance_by_temperature': [
+                {
+                    'temperature': step.temperature,
+                    'last_temperature': step.last_temperature,
+                    'steps': step.steps,
+                    'proposed': step.proposed,
+                    'accepted': step.accepted,
+                    'acceptance_rate': step.accepted / step.proposed if step.proposed else None
+                }
+                for step in self.temperatures
+            ]
+        }
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
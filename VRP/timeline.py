@@ -0,0 +1,199 @@
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import timedelta
+import csv
+import json
+
+try:
+    import numpy as np
+except:
+    np = None
+
+# Package status codes, in the order a package moves through them.
+NOT_READY = 0
+AT_HUB = 1
+EN_ROUTE = 2
+DELIVERED = 3
+STATUS_NAMES = ('NOT READY', 'AT HUB', 'EN ROUTE', 'DELIVERED')
+
+TruckPosition = namedtuple('TruckPosition', ['truck', 'state', 'location', 'destination', 'progress', 'coords'])
+
+class DeliveryTimeline:
+    """
+    A time index over an executed plan, built once when the solution is
+    inserted, to answer fleet-wide status queries without touching Package
+    objects.  Times are stored as seconds after the start of the day.
+    - Per package, in id order: earliest load, load and delivery times, so
+      the status of every package at a time is three vectorized comparisons
+      (with numpy), and sorted copies of the load and delivery times give
+      the number of packages in each status by bisection.
+    - Per truck: the legs it drives as (depart, arrive, from, to) in time
+      order, so the position of a truck at a time is one bisection.
+    """
+    def __init__(self, start_of_day, packages, legs):
+        """
+        <packages>: Package objects with load and delivery times.
+        <legs>: per truck number, a time ordered list of (depart datetime,
+            arrive datetime, from Location, to Location).
+        """
+        self.start_of_day = start_of_day
+        packages = sorted(packages, key=lambda p: p.id)
+        self.ids = array('q', [p.id for p in packages])
+        self.index = {package_id: i for i, package_id in enumerate(self.ids)}
+        self.earliest = array('d', [self.seconds(p.earliest_load) for p in packages])
+        self.loads = array('d', [self.seconds(p.load_time) for p in packages])
+        self.deliveries = array('d', [self.seconds(p.delivery_time) for p in packages])
+        self.sorted_earliest = sorted(self.earliest)
+        self.sorted_loads = sorted(self.loads)
+        self.sorted_deliveries = sorted(self.deliveries)
+        if np is not None:
+            self._earliest = np.frombuffer(self.earliest, dtype=np.float64)
+            self._loads = np.frombuffer(self.loads, dtype=np.float64)
+            self._deliveries = np.frombuffer(self.deliveries, dtype=np.float64)
+
+        self.trucks = sorted(legs)
+        self.legs = {}
+        self.arrivals = {}
+        for number in self.trucks:
+            truck_legs = [(self.seconds(depart), self.seconds(arrive), a, b) for depart, arrive, a, b in legs[number]]
+            self.legs[number] = truck_legs
+            self.arrivals[number] = array('d', [leg[1] for leg in truck_legs])
+
+    def seconds(self, time):
+        return (time - self.start_of_day).total_seconds()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def status_codes(self, cur_time):
+        """
+        Return the status code of every package at cur_time, in the order of
+        self.ids, matching Package.delivery_status().
+        """
+        t = self.seconds(cur_time)
+        if np is not None:
+            codes = np.full(len(self.ids), DELIVERED, dtype=np.int8)
+            codes[t < self._deliveries] = EN_ROUTE
+            codes[t < self._loads] = AT_HUB
+            codes[t < self._earliest] = NOT_READY
+            return codes
+        codes = array('b')
+        for earliest, load, delivery in zip(self.earliest, self.loads, self.deliveries):
+            if t < earliest:
+                codes.append(NOT_READY)
+            elif t < load:
+                codes.append(AT_HUB)
+            elif t < delivery:
+                codes.append(EN_ROUTE)
+            else:
+                codes.append(DELIVERED)
+        return codes
+
+    def status(self, package_id, cur_time):
+        i = self.index[package_id]
+        t = self.seconds(cur_time)
+        if t < self.earliest[i]:
+            return STATUS_NAMES[NOT_READY]
+        elif t < self.loads[i]:
+            return STATUS_NAMES[AT_HUB]
+        elif t < self.deliveries[i]:
+            return STATUS_NAMES[EN_ROUTE]
+        return STATUS_NAMES[DELIVERED]
+
+    def counts(self, cur_time):
+        """
+        Return the number of packages in each status at cur_time, by
+        bisection of the sorted times.  Assumes that no package is loaded
+        before it is available, as in a feasible solution.
+        O(log n)
+        """
+        t = self.seconds(cur_time)
+        ready = bisect_right(self.sorted_earliest, t)
+        loaded = bisect_right(self.sorted_loads, t)
+        delivered = bisect_right(self.sorted_deliveries, t)
+        return {
+            STATUS_NAMES[NOT_READY]: len(self.ids) - ready,
+            STATUS_NAMES[AT_HUB]: ready - loaded,
+            STATUS_NAMES[EN_ROUTE]: loaded - delivered,
+            STATUS_NAMES[DELIVERED]: delivered,
+        }
+
+    def position(self, number, cur_time):
+        """
+        Return the TruckPosition of truck <number> at cur_time.  A truck
+        between legs is standing at the end of its last leg, such as waiting
+        at the depot, and progress is the fraction of the current leg driven.
+        O(log n)
+        """
+        t = self.seconds(cur_time)
+        legs = self.legs[number]
+        if not legs:
+            return None
+        i = bisect_right(self.arrivals[number], t)
+        if i == len(legs):
+            location = legs[-1][3]
+            return TruckPosition(number, 'FINISHED', location, None, 1.0, location.coords)
+        depart, arrive, a, b = legs[i]
+        if t < depart or arrive == depart:
+            location = legs[i-1][3] if i > 0 else a
+            state = 'AT DEPOT' if location is legs[0][2] else 'STOPPED'
+            return TruckPosition(number, state, location, b, 0.0, location.coords)
+        progress = (t - depart) / (arrive - depart)
+        coords = (
+            a.coords[0] + (b.coords[0] - a.coords[0]) * progress,
+            a.coords[1] + (b.coords[1] - a.coords[1]) * progress
+        )
+        return TruckPosition(number, 'EN ROUTE', a, b, progress, coords)
+
+    def positions(self, cur_time):
+        """Return the TruckPosition of every truck at cur_time."""
+        return [self.position(number, cur_time) for number in self.trucks]
+
+    def status_rows(self, cur_time, package_ids=None):
+        """Yield a row dict with the status of each package at cur_time."""
+        codes = self.status_codes(cur_time)
+        if package_ids is None:
+            indices = range(len(self.ids))
+        else:
+            indices = (self.index[package_id] for package_id in package_ids)
+        for i in indices:
+            yield {
+                'id': self.ids[i],
+                'status': STATUS_NAMES[codes[i]],
+                'load_time': str(self.start_of_day + timedelta(seconds=self.loads[i])),
+                'delivery_time': str(self.start_of_day + timedelta(seconds=self.deliveries[i]))
+            }
+
+    def position_rows(self, cur_time):
+        """Yield a row dict with the position of each truck at cur_time."""
+        for position in self.positions(cur_time):
+            if position is None:
+                continue
+            yield {
+                'truck': position.truck,
+                'state': position.state,
+                'location': position.location.id,
+                'destination': position.destination.id if position.destination is not None else None,
+                'progress': round(position.progress, 4),
+                'lat': position.coords[0],
+                'lon': position.coords[1]
+            }
+
+def write_csv(file, rows):
+    """Stream row dicts to an open file as CSV, one row at a time."""
+    writer = None
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(file, fieldnames=list(row.keys()))
+            writer.writeheader()
+        writer.writerow(row)
+
+def write_json(file, rows):
+    """Stream row dicts to an open file as a JSON array, one row at a time."""
+    file.write('[')
+    for i, row in enumerate(rows):
+        if i:
+            file.write(',\n')
+        file.write(json.dumps(row))
+    file.write(']\n')
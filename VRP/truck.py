@@ -4,12 +4,12 @@ from route import Route
 class Truck:
     TRUCK_COUNT = 0
 
-    def __init__(self, depot_location, constants):
+    def __init__(self, depot_location, constants, number=None):
         Truck.TRUCK_COUNT += 1
-        self.number = Truck.TRUCK_COUNT
+        self.number = Truck.TRUCK_COUNT if number is None else number
         self.route = Route(self)
         self.depot_location = depot_location
-        self.speed = constants.truck_speed,
+        self.speed = constants.truck_speed
         self.capacity = constants.truck_capacity
         self.start_of_day = constants.start_of_day
 
@@ -19,5 +19,7 @@ class Truck:
     def load_package(self, package):
         self.route.add_package(package)
 
-    def deliver_package(self):
-        pass
\ No newline at end of file
+    def deliver_package(self, package, delivery_time):
+        """Record the delivery of package at its location at delivery_time."""
+        package.delivery_time = delivery_time
+        self.current_location = package.delivery_location
\ No newline at end of file